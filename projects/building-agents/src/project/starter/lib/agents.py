@@ -1,26 +1,97 @@
-from typing import TypedDict, List, Optional, Union, TypeVar
+from typing import Callable, TypedDict, Dict, List, Optional, Sequence, Union, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import asyncio
 import json
+import threading
+import time
+import uuid
 
-from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run
+from lib.state_machine import StateMachine, Step, EntryPoint, Termination, Run, RunLimits, CancellationToken, current_cancellation_token
 from lib.llm import LLM
-from lib.messages import AIMessage, UserMessage, SystemMessage, ToolMessage
+from lib.messages import AIMessage, UserMessage, SystemMessage, ToolMessage, MessageLog
 from lib.tooling import Tool, ToolCall
 from lib.memory import ShortTermMemory
+from lib.checkpoint import Checkpointer
+from lib.tracing import start_span
+from lib.history import HistoryStrategy, FullHistory
+from lib.metrics import percentile
 
 # Define the state schema
 class AgentState(TypedDict):
     user_query: str  # The current user query being processed
     instructions: str  # System instructions for the agent
-    messages: List[dict]  # List of conversation messages
+    messages: MessageLog  # Append-only conversation history
     current_tool_calls: Optional[List[ToolCall]]  # Current pending tool calls
     total_tokens: int  # Track the cumulative total
     
+# Receives the LLM's content deltas for the run executing on this thread, if any
+_token_callback: ContextVar[Optional[Callable[[str], None]]] = ContextVar("_token_callback", default=None)
+
+
+@dataclass
+class BatchItem:
+    """Outcome of one query in `Agent.batch_invoke`"""
+    query: str
+    session_id: str
+    run: Optional[Run] = None
+    error: Optional[Exception] = None
+    latency: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def total_tokens(self) -> int:
+        final_state = self.run.get_final_state() if self.run else None
+        return (final_state or {}).get("total_tokens", 0)
+
+
+@dataclass
+class BatchResult:
+    """Results of `Agent.batch_invoke`, in the order the queries were given"""
+    items: List[BatchItem] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def runs(self) -> List[Optional[Run]]:
+        return [item.run for item in self.items]
+
+    @property
+    def errors(self) -> List[BatchItem]:
+        return [item for item in self.items if not item.ok]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(item.total_tokens for item in self.items)
+
+    def latency_percentile(self, q: float) -> float:
+        return percentile([item.latency for item in self.items], q)
+
+    def summary(self) -> Dict:
+        return {
+            "queries": len(self.items),
+            "errors": len(self.errors),
+            "total_tokens": self.total_tokens,
+            "wall_time": self.wall_time,
+            "p50_latency": self.latency_percentile(50),
+            "p95_latency": self.latency_percentile(95),
+        }
+
+
 class Agent:
     def __init__(self, 
                  model_name: str,
                  instructions: str, 
                  tools: List[Tool] = None,
-                 temperature: float = 0.7):
+                 temperature: float = 0.7,
+                 checkpointer: Optional[Checkpointer] = None,
+                 limits: Optional[RunLimits] = None,
+                 history: Optional[HistoryStrategy] = None,
+                 max_workers: int = 8,
+                 memory: Optional[ShortTermMemory] = None):
         """
         Initialize an Agent
         
@@ -29,26 +100,69 @@ class Agent:
             instructions: System instructions for the agent
             tools: Optional list of tools available to the agent
             temperature: Temperature parameter for LLM (default: 0.7)
+            checkpointer: Optional checkpointer used to persist runs after every step
+            limits: Optional bounds for each run (default: at most 10 LLM calls per query)
+            history: Optional strategy bounding the history sent to the LLM (default: full history)
+            max_workers: Size of the worker pool used by `submit` and `ainvoke` (default: 8)
+            memory: Optional session memory, e.g. one bounded with limits and a spill store
         """
         self.instructions = instructions
         self.tools = tools if tools else []
         self.model_name = model_name
         self.temperature = temperature
+        self.checkpointer = checkpointer
+        self.limits = limits or RunLimits(max_visits_per_step=10)
+        self.history = history or FullHistory()
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._llm: Optional[LLM] = None
         
         # Initialize memory and state machine
-        self.memory = ShortTermMemory()
+        self.memory = memory if memory is not None else ShortTermMemory()
         self.workflow = self._create_state_machine()
 
+    @property
+    def llm(self) -> LLM:
+        """LLM client shared by all runs (its HTTP connection pool is reused)"""
+        if self._llm is None:
+            with self._executor_lock:
+                if self._llm is None:
+                    self._llm = LLM(
+                        model=self.model_name,
+                        temperature=self.temperature,
+                        tools=self.tools
+                    )
+        return self._llm
+
     def _prepare_messages_step(self, state: AgentState) -> AgentState:
         """Step logic: Prepare messages for LLM consumption"""
-        messages = state.get("messages", [])
+        messages = state.get("messages") or MessageLog()
+        if not isinstance(messages, MessageLog):
+            messages = MessageLog(messages)
         
         # If no messages exist, start with system message
         if not messages:
-            messages = [SystemMessage(content=state["instructions"])]
+            messages = messages + [SystemMessage(content=state["instructions"])]
+
+        # A run stopped by its limits may leave tool calls without results,
+        # which the API rejects; close them before adding the new query
+        last_message = messages[-1]
+        if isinstance(last_message, AIMessage) and last_message.tool_calls:
+            messages = messages + [
+                ToolMessage(
+                    content=json.dumps("Tool call not executed: the previous run was stopped."),
+                    tool_call_id=call.id,
+                    name=call.function.name,
+                )
+                for call in last_message.tool_calls
+            ]
             
         # Add the new user message
-        messages.append(UserMessage(content=state["user_query"]))
+        messages = messages + [UserMessage(content=state["user_query"])]
+
+        # Bound what is carried forward and sent to the LLM
+        messages = self.history.apply(messages, state["session_id"])
         
         return {
             "messages": messages,
@@ -57,14 +171,7 @@ class Agent:
 
     def _llm_step(self, state: AgentState) -> AgentState:
         """Step logic: Process the current state through the LLM"""
-        # Initialize LLM
-        llm = LLM(
-            model=self.model_name,
-            temperature=self.temperature,
-            tools=self.tools
-        )
-
-        response = llm.invoke(state["messages"])
+        response = self.llm.invoke(state["messages"], on_token=_token_callback.get())
         tool_calls = response.tool_calls if response.tool_calls else None
 
         current_total = state.get("total_tokens", 0)
@@ -88,8 +195,11 @@ class Agent:
         """Step logic: Execute any pending tool calls"""
         tool_calls = state["current_tool_calls"] or []
         tool_messages = []
+        token = current_cancellation_token()
         
         for call in tool_calls:
+            if token:
+                token.raise_if_cancelled()
             # Access tool call data correctly
             function_name = call.function.name
             function_args = json.loads(call.function.arguments)
@@ -97,7 +207,8 @@ class Agent:
             # Find the matching tool
             tool = next((t for t in self.tools if t.name == function_name), None)
             if tool:
-                result = str(tool(**function_args))
+                with start_span("agent.tool", {"tool.name": function_name, "tool.call_id": tool_call_id}):
+                    result = str(tool(**function_args))
                 tool_message = ToolMessage(
                     content=json.dumps(result), 
                     tool_call_id=tool_call_id, 
@@ -114,7 +225,7 @@ class Agent:
 
     def _create_state_machine(self) -> StateMachine[AgentState]:
         """Create the internal state machine for the agent"""
-        machine = StateMachine[AgentState](AgentState)
+        machine = StateMachine[AgentState](AgentState, checkpointer=self.checkpointer, limits=self.limits)
         
         # Create steps
         entry = EntryPoint[AgentState]()
@@ -141,53 +252,207 @@ class Agent:
         
         return machine
 
-    def invoke(self, query: str, session_id: Optional[str] = None) -> Run:
+    def invoke(self, query: str, session_id: Optional[str] = None,
+               cancellation_token: Optional[CancellationToken] = None,
+               on_token: Optional[Callable[[str], None]] = None) -> Run:
         """
         Run the agent on a query
         
         Args:
             query: The user's query to process
             session_id: Optional session identifier (uses "default" if None)
+            cancellation_token: Optional token to stop the run cooperatively
+            on_token: Optional callback receiving the LLM's content deltas as
+                they are generated (the LLM calls are streamed)
             
         Returns:
             The final run object after processing
         """
+        context_token = _token_callback.set(on_token)
+        try:
+            return self._invoke(query, session_id, cancellation_token)
+        finally:
+            _token_callback.reset(context_token)
+
+    def _invoke(self, query: str, session_id: Optional[str],
+                cancellation_token: Optional[CancellationToken]) -> Run:
         session_id = session_id or "default"
 
-        # Create session if it doesn't exist
-        self.memory.create_session(session_id)
-
-        # Get previous messages from last run if available
-        previous_messages = []
-        last_run: Run = self.memory.get_last_object(session_id)
-        if last_run:
-            last_state = last_run.get_final_state()
-            if last_state:
-                previous_messages = last_state["messages"]
-
-        initial_state: AgentState = {
-            "user_query": query,
-            "instructions": self.instructions,
-            "messages": previous_messages,
-            "current_tool_calls": None,
-            "session_id": session_id,
-        }
+        # Queries on the same session run one at a time so no turn is lost;
+        # other sessions proceed in parallel. Holding the lock also keeps a
+        # bounded memory from evicting the session mid-run.
+        with self.memory.session_lock(session_id):
+            # Create session if it doesn't exist (or load it back if spilled)
+            self.memory.create_session(session_id)
+
+            # Get previous messages from last run if available
+            previous_messages = MessageLog()
+            last_run: Run = self.memory.get_last_object(session_id)
+            if last_run:
+                last_state = last_run.get_final_state()
+                if last_state:
+                    previous_messages = last_state["messages"]
 
-        run_object = self.workflow.run(initial_state)
+            initial_state: AgentState = {
+                "user_query": query,
+                "instructions": self.instructions,
+                "messages": previous_messages,
+                "current_tool_calls": None,
+                "session_id": session_id,
+            }
+
+            run_object = self.workflow.run(initial_state, cancellation_token=cancellation_token)
+            
+            # Store the complete run object in memory
+            self.memory.add(run_object, session_id)
         
-        # Store the complete run object in memory
-        self.memory.add(run_object, session_id)
+        return run_object
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Bounded worker pool shared by `submit` and `ainvoke`"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="agent-worker",
+                    )
+        return self._executor
+
+    def submit(self, query: str, session_id: Optional[str] = None,
+               cancellation_token: Optional[CancellationToken] = None,
+               on_token: Optional[Callable[[str], None]] = None) -> Future:
+        """
+        Schedule `invoke` on the agent's worker pool
         
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            cancellation_token: Optional token to stop the run cooperatively
+            on_token: Optional callback receiving the LLM's content deltas
+                (called on the worker thread)
+            
+        Returns:
+            Future resolving to the final run object
+        """
+        return self.executor.submit(self.invoke, query, session_id, cancellation_token, on_token)
+
+    async def ainvoke(self, query: str, session_id: Optional[str] = None,
+                      cancellation_token: Optional[CancellationToken] = None,
+                      on_token: Optional[Callable[[str], None]] = None) -> Run:
+        """
+        Run the agent on a query without blocking the event loop
+        
+        Args:
+            query: The user's query to process
+            session_id: Optional session identifier (uses "default" if None)
+            cancellation_token: Optional token to stop the run cooperatively
+            on_token: Optional callback receiving the LLM's content deltas
+                (called on the worker thread)
+            
+        Returns:
+            The final run object after processing
+        """
+        return await asyncio.wrap_future(self.submit(query, session_id, cancellation_token, on_token))
+
+    def batch_invoke(self, queries: List[str],
+                     session_ids: Optional[List[str]] = None,
+                     max_concurrency: Optional[int] = None) -> BatchResult:
+        """
+        Run many queries concurrently, e.g. for evaluation suites
+        
+        Queries on different sessions run in parallel; queries sharing a
+        session id run one after another, in input order, so follow-up
+        questions see the earlier turns. A failing query does not stop
+        the others: its exception is recorded on its item.
+        
+        Args:
+            queries: The user queries to process
+            session_ids: Optional session id per query (default: a fresh session
+                each, deleted from memory once its query finishes; the runs
+                stay on the returned items)
+            max_concurrency: Maximum sessions processed at once (default: `max_workers`)
+            
+        Returns:
+            BatchResult with one item per query, in input order, plus
+            aggregate token and latency statistics
+        """
+        ephemeral = session_ids is None
+        if ephemeral:
+            prefix = f"batch-{uuid.uuid4().hex[:8]}"
+            session_ids = [f"{prefix}-{i}" for i in range(len(queries))]
+        if len(session_ids) != len(queries):
+            raise ValueError("session_ids must have one entry per query")
+
+        items = [BatchItem(query=q, session_id=sid) for q, sid in zip(queries, session_ids)]
+        by_session: Dict[str, List[BatchItem]] = {}
+        for item in items:
+            by_session.setdefault(item.session_id, []).append(item)
+
+        def run_session(session_items: List[BatchItem]):
+            for item in session_items:
+                start = time.monotonic()
+                try:
+                    item.run = self.invoke(item.query, item.session_id)
+                except Exception as e:
+                    item.error = e
+                item.latency = time.monotonic() - start
+            if ephemeral:
+                self.memory.delete_session(session_items[0].session_id)
+                self.history.reset(session_items[0].session_id)
+
+        start = time.monotonic()
+        workers = max(1, min(max_concurrency or self.max_workers, len(by_session) or 1))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-batch") as pool:
+            for future in [pool.submit(run_session, group) for group in by_session.values()]:
+                future.result()
+
+        return BatchResult(items=items, wall_time=time.monotonic() - start)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker pool, optionally waiting for queued queries"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def resume(self, run_id: str) -> Run:
+        """
+        Resume an interrupted run from its last checkpoint
+        
+        Args:
+            run_id: Identifier of the run to resume
+            
+        Returns:
+            The final run object after processing the remaining steps. A run
+            that is already in the session (it finished before) is returned
+            without being added again.
+        """
+        # Loaded once: the session comes from its state, the run from the rest
+        checkpoint = self.workflow.checkpointer.load(run_id) if self.workflow.checkpointer else None
+        state = checkpoint.state if checkpoint else None
+        session_id = (state or {}).get("session_id") or "default"
+
+        with self.memory.session_lock(session_id):
+            self.memory.create_session(session_id)
+            run_object = self.workflow.resume(run_id, checkpoint=checkpoint)
+            stored = any(
+                getattr(run, "run_id", None) == run_object.run_id
+                for run in self.memory.get_all_objects(session_id)
+            )
+            if not stored:
+                self.memory.add(run_object, session_id)
+
         return run_object
 
-    def get_session_runs(self, session_id: Optional[str] = None) -> List[Run]:
+    def get_session_runs(self, session_id: Optional[str] = None) -> Sequence[Run]:
         """Get all Run objects for a session
         
         Args:
             session_id: Optional session ID (uses "default" if None)
             
         Returns:
-            List of Run objects in the session
+            Read-only sequence of Run objects in the session
         """
         return self.memory.get_all_objects(session_id)
 
@@ -198,3 +463,4 @@ class Agent:
             session_id: Optional session to reset (uses "default" if None)
         """
         self.memory.reset(session_id)
+        self.history.reset(session_id)
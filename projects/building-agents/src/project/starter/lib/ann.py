@@ -0,0 +1,337 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pathlib import Path
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def exact_search(queries: np.ndarray, matrix: np.ndarray, k: int,
+                 block_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact top-k rows and similarities for normalized queries, scanning `matrix` in blocks"""
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(matrix), block_size):
+        scores = queries @ matrix[start:start + block_size].T
+        top = top_k(scores, k)
+        best_rows = np.concatenate([best_rows, top + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        if best_rows.shape[1] > k:
+            keep = top_k(best_scores, k)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    return best_rows, best_scores
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized vectors (spherical k-means).
+
+    Vectors are partitioned into `n_lists` clusters; a query scores the
+    `n_probe` closest centroids and then only the vectors in those lists.
+    Raising `n_probe` trades latency for recall (`n_probe == n_lists` is
+    exact search); `python -m lib.ann` measures the trade-off.
+
+    The index holds centroids and one list assignment per matrix row; the
+    vectors themselves stay in the store's matrix. New rows are assigned to
+    their nearest centroid as they arrive (incremental insert), and the
+    centroids are retrained once the store has grown `retrain_factor`
+    times past the size they were trained on.
+
+    Args:
+        n_lists: Number of clusters (default: sqrt(n) at training time)
+        n_probe: Lists scanned per query
+        min_train_size: Below this many vectors, searches stay exact
+        max_train_samples: Vectors sampled for k-means (default: 64 per list)
+        iterations: k-means iterations
+        retrain_factor: Growth since the last training that triggers retraining
+        seed: Random seed for sampling and initialization
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8,
+                 min_train_size: int = 10000, max_train_samples: Optional[int] = None,
+                 iterations: int = 10, retrain_factor: float = 4.0, seed: int = 0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.max_train_samples = max_train_samples
+        self.iterations = iterations
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    def __repr__(self):
+        lists = 0 if self.centroids is None else len(self.centroids)
+        return f"IVFIndex(n_lists={lists}, n_probe={self.n_probe}, size={len(self.assignments)})"
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # Parameters the centroids depend on: a saved index built with other
+    # values is discarded on load and retrained
+    TRAINING_PARAMETERS = ("n_lists", "max_train_samples", "iterations", "seed")
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "n_lists": self.n_lists,
+            "n_probe": self.n_probe,
+            "min_train_size": self.min_train_size,
+            "max_train_samples": self.max_train_samples,
+            "iterations": self.iterations,
+            "retrain_factor": self.retrain_factor,
+            "seed": self.seed,
+        }
+
+    # Training and maintenance ----------------------------------------------
+    @staticmethod
+    def _assign_to(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start:start + block_size]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return self._assign_to(vectors, self.centroids)
+
+    def train(self, matrix: np.ndarray):
+        """Run spherical k-means on a sample of `matrix` and assign every row"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(math.sqrt(len(matrix))))
+        n_lists = min(n_lists, len(matrix))
+        samples = min(len(matrix), self.max_train_samples or 64 * n_lists)
+        sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), samples, replace=False))])
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._assign_to(sample, centroids)
+            # Per-cluster sums of the sample, sorted by label
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            # Reseed empty clusters with random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = self._assign(matrix)
+        self.trained_size = len(matrix)
+        self._order = None
+
+    def needs_training(self, size: int) -> bool:
+        if size < self.min_train_size:
+            return False
+        return not self.trained or size > self.retrain_factor * self.trained_size
+
+    def sync(self, matrix: np.ndarray, updated: Sequence[int] = ()):
+        """
+        Bring the index up to date with the store's matrix
+
+        Trains (or retrains) when needed; otherwise assigns appended rows
+        and reassigns `updated` rows to their nearest centroid.
+        """
+        if self.needs_training(len(matrix)):
+            self.train(matrix)
+            return
+        if not self.trained:
+            return
+        if len(self.assignments) < len(matrix):
+            tail = self._assign(matrix[len(self.assignments):])
+            self.assignments = np.concatenate([self.assignments, tail])
+            self._order = None
+        updated = [row for row in updated if row < len(self.assignments)]
+        if updated:
+            self.assignments[updated] = self._assign(matrix[updated])
+            self._order = None
+
+    def compact(self, keep: np.ndarray):
+        """Drop the assignments of deleted rows (`keep` is False for them)"""
+        if self.trained:
+            self.assignments = self.assignments[keep[:len(self.assignments)]]
+            self._order = None
+
+    def _lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=len(self.centroids))
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._order, self._offsets
+
+    # Search ----------------------------------------------------------------
+    def search(self, queries: np.ndarray, matrix: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None,
+               n_probe: Optional[int] = None) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Approximate top-k rows and similarities per normalized query
+
+        Args:
+            queries: Normalized query vectors
+            matrix: The store's normalized matrix
+            k: Results per query
+            mask: Optional row filter
+            n_probe: Lists scanned per query (default: `self.n_probe`)
+
+        Returns:
+            Tuple[List[np.ndarray], List[np.ndarray]]: Rows and similarities
+                per query (fewer than k if the probed lists hold fewer matches)
+        """
+        order, offsets = self._lists()
+        probes = top_k(queries @ self.centroids.T, n_probe or self.n_probe)
+        rows, scores = [], []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists])
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if not len(candidates):
+                rows.append(np.empty(0, dtype=np.int64))
+                scores.append(np.empty(0, dtype=np.float32))
+                continue
+            similarities = matrix[candidates] @ query
+            top = top_k(similarities[None, :], k)[0]
+            rows.append(candidates[top])
+            scores.append(similarities[top])
+        return rows, scores
+
+    # Persistence -----------------------------------------------------------
+    def state(self) -> Dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids,
+            "assignments": self.assignments,
+            "trained_size": np.array(self.trained_size),
+            "config": np.array(json.dumps(self.config())),
+        }
+
+    def load_state(self, state: Dict[str, np.ndarray], size: int):
+        """
+        Restore a saved index; ignored if it covers more rows than the store
+        has or was trained with different `TRAINING_PARAMETERS`
+        """
+        saved = json.loads(str(state["config"])) if "config" in state else {}
+        if any(saved.get(name, object()) != getattr(self, name) for name in self.TRAINING_PARAMETERS):
+            return
+        assignments = np.asarray(state["assignments"], dtype=np.int32)
+        if len(assignments) > size:
+            return
+        self.centroids = np.asarray(state["centroids"], dtype=np.float32)
+        self.assignments = assignments
+        self.trained_size = int(state["trained_size"])
+        self._order = None
+
+
+# Benchmark (python -m lib.ann) ---------------------------------------------
+def _synthetic(n: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Normalized Gaussian mixture, a rough stand-in for text embeddings"""
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(matrix: np.ndarray, queries: np.ndarray, k: int = 10,
+              n_lists: Optional[int] = None, probes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64),
+              iterations: int = 10) -> List[Dict[str, float]]:
+    """
+    Measure recall@k and latency of IVF search against exact search
+
+    Returns:
+        List[Dict[str, float]]: One row per `n_probe`, plus the exact baseline
+    """
+    def timed(search) -> Tuple[Any, np.ndarray]:
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query[None, :]))
+            latencies.append((time.perf_counter() - start) * 1000)
+        return results, np.array(latencies)
+
+    exact, exact_latency = timed(lambda q: exact_search(q, matrix, k)[0][0])
+    truth = [set(r.tolist()) for r in exact]
+    report = [{
+        "n_probe": 0,
+        "recall": 1.0,
+        "mean_ms": float(exact_latency.mean()),
+        "p95_ms": float(np.percentile(exact_latency, 95)),
+        "speedup": 1.0,
+    }]
+
+    index = IVFIndex(n_lists=n_lists, iterations=iterations, min_train_size=0)
+    start = time.perf_counter()
+    index.train(matrix)
+    build = time.perf_counter() - start
+    for n_probe in probes:
+        if n_probe > len(index.centroids):
+            break
+        found, latency = timed(lambda q: index.search(q, matrix, k, n_probe=n_probe)[0][0])
+        recall = np.mean([len(truth[i] & set(r.tolist())) / len(truth[i]) for i, r in enumerate(found)])
+        report.append({
+            "n_probe": n_probe,
+            "recall": float(recall),
+            "mean_ms": float(latency.mean()),
+            "p95_ms": float(np.percentile(latency, 95)),
+            "speedup": float(exact_latency.mean() / latency.mean()),
+        })
+    report[0]["build_s"] = build
+    report[0]["n_lists"] = len(index.centroids)
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Recall@k and latency of IVF search vs exact search")
+    parser.add_argument("--store", help="Directory of a saved NumpyVectorStore (default: synthetic data)")
+    parser.add_argument("-n", type=int, default=100000, help="Synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=384, help="Synthetic vector size")
+    parser.add_argument("--queries", type=int, default=200, help="Queries sampled from the data")
+    parser.add_argument("-k", type=int, default=10, help="Results per query")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default: sqrt(n))")
+    parser.add_argument("--probes", default="1,2,4,8,16,32,64", help="Comma-separated n_probe values")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    if args.store:
+        from lib.local_vector_db import NumpyVectorStore
+        store = NumpyVectorStore(Path(args.store).name, path=args.store, autosave=False)
+        matrix = np.ascontiguousarray(store.matrix)
+        source = f"store '{store.name}'"
+    else:
+        matrix = _synthetic(args.n, args.dimensions, max(8, args.n // 1000), rng)
+        source = "synthetic"
+    # Perturbed data points, so queries resemble the catalog without being in it
+    picks = matrix[rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)]
+    queries = picks + 0.1 * rng.standard_normal(picks.shape).astype(np.float32) / math.sqrt(matrix.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    probes = [int(p) for p in args.probes.split(",") if p]
+    report = benchmark(matrix, queries, k=args.k, n_lists=args.lists, probes=probes)
+    print(f"{len(matrix)} vectors x {matrix.shape[1]} ({source}), {len(queries)} queries, "
+          f"k={args.k}, {report[0]['n_lists']} lists, built in {report[0]['build_s']:.2f}s")
+    print(f"{'n_probe':>8} {'recall@k':>9} {'mean ms':>8} {'p95 ms':>8} {'speedup':>8}")
+    for row in report:
+        label = "exact" if row["n_probe"] == 0 else str(row["n_probe"])
+        print(f"{label:>8} {row['recall']:>9.3f} {row['mean_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
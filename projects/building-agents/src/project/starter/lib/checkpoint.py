@@ -0,0 +1,312 @@
+from typing import Any, Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from datetime import datetime
+from pathlib import Path
+import copy
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+
+
+# Run attributes that only grow, one entry per step; stored incrementally
+RECORD_LISTS = ("snapshots", "step_metrics")
+
+
+class CheckpointNotFoundError(Exception):
+    """Raised when attempting to resume a run that has no checkpoint"""
+    pass
+
+
+@dataclass
+class Checkpoint:
+    """
+    Durable record of a state machine run after its last completed step.
+
+    Attributes:
+        run_id (str): Identifier of the checkpointed run
+        step_id (str): Last step that finished executing
+        next_step_id (Optional[str]): Step to execute on resume (None when the run is complete)
+        run (Any): The `Run` object, including every snapshot taken so far
+        updated_at (datetime): When the checkpoint was written
+        state_data (Any): State to resume from, also set when no step has completed yet
+    """
+    run_id: str
+    step_id: str
+    next_step_id: Optional[str]
+    run: Any
+    updated_at: datetime
+    state_data: Any = None
+
+    @property
+    def completed(self) -> bool:
+        return self.next_step_id is None
+
+    @property
+    def state(self) -> Any:
+        """State produced by the last completed step (the initial state if none completed)"""
+        if self.state_data is not None:
+            return self.state_data
+        return self.run.get_final_state()
+
+
+class Checkpointer(ABC):
+    """
+    Storage backend for state machine checkpoints.
+
+    A `StateMachine` configured with a checkpointer saves one checkpoint per
+    run after every step, overwriting the previous one, so that
+    `StateMachine.resume(run_id)` can continue from the last completed step.
+
+    The built-in checkpointers split a checkpoint into a small header (the
+    run without its snapshots and step metrics) and per-step records. Each
+    save writes the header and only the records added since the previous
+    save, so checkpointing a run costs time linear in its length instead
+    of re-serializing every snapshot after every step.
+    """
+
+    @abstractmethod
+    def save(self, checkpoint: Checkpoint):
+        pass
+
+    @abstractmethod
+    def load(self, run_id: str) -> Optional[Checkpoint]:
+        pass
+
+    @abstractmethod
+    def delete(self, run_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list_runs(self) -> List[str]:
+        pass
+
+    @staticmethod
+    def _split(checkpoint: Checkpoint) -> Tuple[bytes, Dict[str, list]]:
+        """Serialize a checkpoint without its run's per-step records, which are returned as is"""
+        run = copy.copy(checkpoint.run)
+        records = {name: getattr(run, name) for name in RECORD_LISTS}
+        for name in RECORD_LISTS:
+            setattr(run, name, [])
+        counts = {name: len(items) for name, items in records.items()}
+        header = replace(checkpoint, run=run)
+        return pickle.dumps((header, counts), protocol=pickle.HIGHEST_PROTOCOL), records
+
+    @staticmethod
+    def _join(payload: bytes, records: Dict[Tuple[str, int], bytes]) -> Checkpoint:
+        """Rebuild a checkpoint from its header and serialized records keyed by (list, position)"""
+        loaded = pickle.loads(payload)
+        if isinstance(loaded, Checkpoint):
+            # Written whole by an older version
+            return loaded
+        header, counts = loaded
+        for name, count in counts.items():
+            setattr(header.run, name, [pickle.loads(records[(name, i)]) for i in range(count)])
+        return header
+
+
+class SQLiteCheckpointer(Checkpointer):
+    """
+    Checkpointer backed by a single SQLite file.
+
+    Each run occupies one header row that is replaced after every step,
+    plus one row per snapshot and per step metrics written once.
+
+    Example:
+        >>> machine = StateMachine[AgentState](AgentState, checkpointer=SQLiteCheckpointer("runs.db"))
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "run_id TEXT PRIMARY KEY, "
+                "step_id TEXT NOT NULL, "
+                "next_step_id TEXT, "
+                "updated_at TEXT NOT NULL, "
+                "payload BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint_records ("
+                "run_id TEXT NOT NULL, "
+                "kind TEXT NOT NULL, "
+                "position INTEGER NOT NULL, "
+                "payload BLOB NOT NULL, "
+                "PRIMARY KEY (run_id, kind, position))"
+            )
+
+    def __repr__(self):
+        return f"SQLiteCheckpointer('{self.path}')"
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def save(self, checkpoint: Checkpoint):
+        header, records = self._split(checkpoint)
+        with self._connection() as conn:
+            stored = dict(conn.execute(
+                "SELECT kind, MAX(position) + 1 FROM checkpoint_records WHERE run_id = ? GROUP BY kind",
+                (checkpoint.run_id,),
+            ).fetchall())
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_records (run_id, kind, position, payload) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (checkpoint.run_id, name, position,
+                     pickle.dumps(items[position], protocol=pickle.HIGHEST_PROTOCOL))
+                    for name, items in records.items()
+                    for position in range(stored.get(name, 0), len(items))
+                ],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(run_id, step_id, next_step_id, updated_at, payload) VALUES (?, ?, ?, ?, ?)",
+                (
+                    checkpoint.run_id,
+                    checkpoint.step_id,
+                    checkpoint.next_step_id,
+                    checkpoint.updated_at.isoformat(),
+                    header,
+                ),
+            )
+
+    def load(self, run_id: str) -> Optional[Checkpoint]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT payload FROM checkpoints WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        records = conn.execute(
+            "SELECT kind, position, payload FROM checkpoint_records WHERE run_id = ?", (run_id,)
+        ).fetchall()
+        return self._join(row[0], {(kind, position): payload for kind, position, payload in records})
+
+    def delete(self, run_id: str) -> bool:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM checkpoint_records WHERE run_id = ?", (run_id,))
+            cursor = conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+        return cursor.rowcount > 0
+
+    def list_runs(self) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT run_id FROM checkpoints ORDER BY updated_at"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+class DirectoryCheckpointer(Checkpointer):
+    """
+    Checkpointer that writes two files per run into a local directory.
+
+    The header file is written to a temporary name and atomically renamed,
+    so a process dying mid-write never leaves a truncated checkpoint
+    behind. New per-step records are appended to a log file before the
+    header is replaced; records the header does not count yet, including
+    one cut short by a crash, are ignored and overwritten.
+    """
+
+    suffix = ".ckpt"
+    records_suffix = ".records"
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # run_id -> records already in its log, per list
+        self._stored: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"DirectoryCheckpointer('{self.directory}')"
+
+    def _path(self, run_id: str) -> Path:
+        return self.directory / f"{run_id}{self.suffix}"
+
+    def _records_path(self, run_id: str) -> Path:
+        return self.directory / f"{run_id}{self.records_suffix}"
+
+    def _read_records(self, run_id: str) -> Tuple[Dict[Tuple[str, int], bytes], int]:
+        """Read a run's record log, returning its records and where the last complete one ends"""
+        records: Dict[Tuple[str, int], bytes] = {}
+        end = 0
+        path = self._records_path(run_id)
+        if not path.exists():
+            return records, end
+        with open(path, "rb") as fp:
+            while True:
+                try:
+                    name, position, payload = pickle.load(fp)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                records[(name, position)] = payload
+                end = fp.tell()
+        return records, end
+
+    def _stored_counts(self, run_id: str) -> Dict[str, int]:
+        """Records already logged for a run, reading the log once per process (caller holds the lock)"""
+        stored = self._stored.get(run_id)
+        if stored is None:
+            records, end = self._read_records(run_id)
+            path = self._records_path(run_id)
+            if path.exists() and path.stat().st_size > end:
+                # Drop a record cut short by a crash so appends stay readable
+                os.truncate(path, end)
+            stored = {}
+            for name, position in records:
+                stored[name] = max(stored.get(name, 0), position + 1)
+            self._stored[run_id] = stored
+        return stored
+
+    def save(self, checkpoint: Checkpoint):
+        header, records = self._split(checkpoint)
+        with self._lock:
+            stored = self._stored_counts(checkpoint.run_id)
+            with open(self._records_path(checkpoint.run_id), "ab") as fp:
+                for name, items in records.items():
+                    for position in range(stored.get(name, 0), len(items)):
+                        payload = pickle.dumps(items[position], protocol=pickle.HIGHEST_PROTOCOL)
+                        pickle.dump((name, position, payload), fp, protocol=pickle.HIGHEST_PROTOCOL)
+                    stored[name] = len(items)
+            if checkpoint.completed:
+                self._stored.pop(checkpoint.run_id, None)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(header)
+            os.replace(tmp_path, self._path(checkpoint.run_id))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self, run_id: str) -> Optional[Checkpoint]:
+        path = self._path(run_id)
+        if not path.exists():
+            return None
+        records, _ = self._read_records(run_id)
+        return self._join(path.read_bytes(), records)
+
+    def delete(self, run_id: str) -> bool:
+        with self._lock:
+            self._stored.pop(run_id, None)
+            records_path = self._records_path(run_id)
+            if records_path.exists():
+                records_path.unlink()
+        path = self._path(run_id)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+    def list_runs(self) -> List[str]:
+        paths = sorted(self.directory.glob(f"*{self.suffix}"), key=lambda p: p.stat().st_mtime)
+        return [p.name[:-len(self.suffix)] for p in paths]
@@ -0,0 +1,298 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+from pydantic import BaseModel
+
+from lib.llm import LLM
+from lib.embeddings import normalize_rows
+from lib.memory import LongTermMemory, MemoryFragment, RetrievalScoring
+
+
+logger = logging.getLogger("lib.consolidation")
+
+
+class _MergedMemories(BaseModel):
+    memories: List[str]
+
+
+@dataclass
+class ConsolidationCluster:
+    """Group of similar memories merged into one"""
+    ids: List[str]
+    contents: List[str]
+    merged: Optional[str] = None
+
+
+@dataclass
+class ConsolidationReport:
+    """
+    Outcome of a consolidation pass over one owner's namespace.
+
+    In a dry run the clusters and evictions are what would happen; nothing
+    is merged or written.
+    """
+    owner: str
+    namespace: str
+    dry_run: bool
+    fragments_before: int = 0
+    fragments_after: int = 0
+    clusters: List[ConsolidationCluster] = field(default_factory=list)
+    evicted: List[str] = field(default_factory=list)
+    llm_calls: int = 0
+    skipped_clusters: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "namespace": self.namespace,
+            "dry_run": self.dry_run,
+            "fragments_before": self.fragments_before,
+            "fragments_after": self.fragments_after,
+            "clusters": len(self.clusters),
+            "merged_fragments": sum(len(c.ids) for c in self.clusters),
+            "evicted": len(self.evicted),
+            "llm_calls": self.llm_calls,
+            "skipped_clusters": self.skipped_clusters,
+        }
+
+
+def cluster_embeddings(embeddings: Any, threshold: float, min_size: int = 2) -> List[List[int]]:
+    """
+    Greedy leader clustering by cosine similarity.
+
+    Rows are visited in order; each unassigned row opens a cluster with
+    every unassigned row at least `threshold` similar to it. Only clusters
+    with `min_size` rows or more are returned.
+    """
+    vectors = normalize_rows(embeddings)
+    if not len(vectors):
+        return []
+    similarities = vectors @ vectors.T
+    assigned = np.zeros(len(vectors), dtype=bool)
+    clusters = []
+    for i in range(len(vectors)):
+        if assigned[i]:
+            continue
+        members = np.flatnonzero((similarities[i] >= threshold) & ~assigned)
+        assigned[members] = True
+        if len(members) >= min_size:
+            clusters.append(members.tolist())
+    return clusters
+
+
+class MemoryConsolidator:
+    """
+    Compacts an owner's long-term memories.
+
+    A pass clusters the owner's fragments in a namespace by embedding
+    similarity, merges each cluster into a single fragment with an LLM
+    (several clusters per call), and replaces the originals: merged
+    fragments are written before the originals are removed, so nothing is
+    lost if the pass is interrupted. If the owner still has more than
+    `max_fragments` memories afterwards, the lowest ranked ones (by
+    recency and importance) are evicted.
+
+    Throughput is bounded by `max_llm_calls` per pass and a minimum
+    `min_call_interval` between LLM calls; clusters beyond the budget are
+    left for the next pass. `start` runs passes over every catalog entry
+    on a background thread.
+
+    Args:
+        memory: Long-term memory to compact
+        llm: LLM used for merges (default: gpt-4o-mini, temperature 0)
+        similarity_threshold: Cosine similarity for two memories to be merged
+        min_cluster_size: Smallest group worth merging
+        clusters_per_call: Clusters merged by one LLM call
+        max_llm_calls: LLM calls allowed per pass (None for no limit)
+        min_call_interval: Minimum seconds between LLM calls
+        max_fragments: Memories kept per owner and namespace (None for no limit)
+        scoring: Ranking used to pick evictions (default: recency and importance)
+
+    Example:
+        >>> consolidator = MemoryConsolidator(memory, max_fragments=200)
+        >>> consolidator.consolidate("user-1", dry_run=True).summary()
+        >>> consolidator.start(interval=3600)
+    """
+
+    def __init__(self, memory: LongTermMemory, llm: Optional[LLM] = None,
+                 similarity_threshold: float = 0.85, min_cluster_size: int = 2,
+                 clusters_per_call: int = 8, max_llm_calls: Optional[int] = 10,
+                 min_call_interval: float = 0.0, max_fragments: Optional[int] = None,
+                 scoring: Optional[RetrievalScoring] = None):
+        self.memory = memory
+        self._llm = llm
+        self.similarity_threshold = similarity_threshold
+        self.min_cluster_size = min_cluster_size
+        self.clusters_per_call = clusters_per_call
+        self.max_llm_calls = max_llm_calls
+        self.min_call_interval = min_call_interval
+        self.max_fragments = max_fragments
+        self.scoring = scoring or RetrievalScoring(similarity=0.0, recency=1.0, importance=1.0)
+        self._last_call = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def llm(self) -> LLM:
+        if self._llm is None:
+            self._llm = LLM(model="gpt-4o-mini", temperature=0.0)
+        return self._llm
+
+    def _merge(self, clusters: List[ConsolidationCluster]) -> List[str]:
+        """Merge a batch of clusters with one LLM call"""
+        wait = self._last_call + self.min_call_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_call = time.monotonic()
+
+        groups = [c.contents for c in clusters]
+        prompt = (
+            "Each group below holds overlapping memories about one user. "
+            "Merge every group into a single concise memory that keeps all "
+            "distinct facts and the most recent preference when they conflict. "
+            f"Return exactly {len(groups)} memories, in the same order as the groups.\n\n"
+            f"# Groups:\n{json.dumps(groups, indent=1)}"
+        )
+        response = self.llm.invoke(prompt, response_format=_MergedMemories)
+        merged = _MergedMemories.model_validate_json(response.content).memories
+        if len(merged) != len(clusters):
+            raise ValueError(f"Expected {len(clusters)} merged memories, got {len(merged)}")
+        return merged
+
+    def consolidate(self, owner: str, namespace: str = "default",
+                    dry_run: bool = False) -> ConsolidationReport:
+        """
+        Run one consolidation pass over an owner's namespace
+
+        Args:
+            owner: User whose memories are compacted
+            namespace: Namespace to compact (default: "default")
+            dry_run: Only report the clusters and evictions, without LLM calls or writes
+
+        Returns:
+            ConsolidationReport: What was (or would be) merged and evicted
+        """
+        records = self.memory.get_records(owner, namespace, include_embeddings=True)
+        ids, documents, metadatas = records["ids"], records["documents"], records["metadatas"]
+        report = ConsolidationReport(owner=owner, namespace=namespace, dry_run=dry_run,
+                                     fragments_before=len(ids))
+        if not ids:
+            return report
+
+        # Oldest first, so each cluster is led by its earliest memory
+        order = sorted(range(len(ids)), key=lambda i: metadatas[i].get("timestamp") or 0)
+        embeddings = [records["embeddings"][i] for i in order]
+        clusters = [
+            [order[i] for i in members]
+            for members in cluster_embeddings(embeddings, self.similarity_threshold, self.min_cluster_size)
+        ]
+        report.clusters = [
+            ConsolidationCluster(ids=[ids[i] for i in c], contents=[documents[i] for i in c])
+            for c in clusters
+        ]
+
+        # Merge within the LLM budget; the rest waits for the next pass
+        merged_fragments: List[MemoryFragment] = []
+        merged_ids: List[str] = []
+        if not dry_run:
+            done = []
+            for start in range(0, len(clusters), self.clusters_per_call):
+                if self.max_llm_calls is not None and report.llm_calls >= self.max_llm_calls:
+                    break
+                batch = report.clusters[start:start + self.clusters_per_call]
+                members = clusters[start:start + self.clusters_per_call]
+                try:
+                    merged = self._merge(batch)
+                except Exception:
+                    logger.exception("Merging memories of %s/%s failed", owner, namespace)
+                    break
+                finally:
+                    report.llm_calls += 1
+                for cluster, indices, content in zip(batch, members, merged):
+                    cluster.merged = content
+                    merged_ids.extend(cluster.ids)
+                    merged_fragments.append(MemoryFragment(
+                        content=content,
+                        owner=owner,
+                        namespace=namespace,
+                        timestamp=max(metadatas[i].get("timestamp") or 0 for i in indices),
+                        importance=max(metadatas[i].get("importance", 0.5) for i in indices),
+                    ))
+                done.extend(batch)
+            report.skipped_clusters = len(report.clusters) - len(done)
+            report.clusters = done
+
+        # Bound the owner's memory: rank what would remain and evict the tail
+        if dry_run:
+            merged_set = {i for c in report.clusters for i in c.ids}
+            merged_count = len(report.clusters)
+        else:
+            merged_set = set(merged_ids)
+            merged_count = len(merged_fragments)
+        remaining = [i for i in range(len(ids)) if ids[i] not in merged_set]
+        after = len(remaining) + merged_count
+        if self.max_fragments is not None and after > self.max_fragments:
+            excess = after - self.max_fragments
+            scores = self.scoring.score(
+                np.zeros(len(remaining)),
+                np.array([metadatas[i].get("timestamp") or 0 for i in remaining], dtype=np.float64),
+                np.array([metadatas[i].get("importance", 0.5) for i in remaining], dtype=np.float64),
+            )
+            worst = np.argsort(scores, kind="stable")[:excess]
+            report.evicted = [ids[remaining[i]] for i in worst]
+            after -= len(report.evicted)
+        report.fragments_after = after
+
+        if not dry_run and (merged_ids or report.evicted):
+            report.fragments_after = self.memory.replace(
+                owner, namespace, merged_ids + report.evicted, merged_fragments
+            )
+        return report
+
+    def consolidate_all(self, dry_run: bool = False,
+                        min_fragments: Optional[int] = None) -> List[ConsolidationReport]:
+        """
+        Run a pass over every owner and namespace in the memory's catalog
+
+        Args:
+            dry_run: Only report, without LLM calls or writes
+            min_fragments: Skip partitions with fewer memories (default: `min_cluster_size`)
+        """
+        min_fragments = self.min_cluster_size if min_fragments is None else min_fragments
+        reports = []
+        for entry in self.memory.get_catalog(refresh=True):
+            if self._stop.is_set():
+                break
+            if entry.count < min_fragments:
+                continue
+            reports.append(self.consolidate(entry.owner, entry.namespace, dry_run=dry_run))
+        return reports
+
+    def start(self, interval: float = 3600.0):
+        """Run `consolidate_all` every `interval` seconds on a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    for report in self.consolidate_all():
+                        logger.info("Consolidated memories", extra=report.summary())
+                except Exception:
+                    logger.exception("Memory consolidation pass failed")
+
+        self._thread = threading.Thread(target=loop, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """Stop the background thread (a running pass finishes its current partition)"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
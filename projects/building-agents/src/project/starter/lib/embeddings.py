@@ -0,0 +1,453 @@
+from typing import Any, Dict, List, Optional, Tuple
+from abc import abstractmethod
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+from chromadb.utils.embedding_functions import known_embedding_functions
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+from lib.tracing import start_span
+
+
+class EmbeddingBackend(EmbeddingFunction[Documents]):
+    """
+    Base class for embedding functions used by `VectorStoreManager`.
+
+    Inputs are split into batches of `batch_size` texts, each embedded by
+    `_embed_batch`, which subclasses must implement (a backend missing it
+    cannot be instantiated). Backends are plain Chroma embedding
+    functions, so they can be passed anywhere Chroma expects one.
+
+    Args:
+        batch_size: Texts embedded per call to the underlying model or API
+    """
+
+    model_name: str = ""
+
+    def __init__(self, batch_size: int = 64):
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(model_name='{self.model_name}')"
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings: List[np.ndarray] = []
+        with start_span("embeddings.embed", {"embedding.model": self.model_name, "text_count": len(texts)}):
+            for start in range(0, len(texts), self.batch_size):
+                embeddings.extend(self._embed_batch(texts[start:start + self.batch_size]))
+        return embeddings
+
+    @abstractmethod
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed one batch of texts"""
+
+    def warmup(self):
+        """Load the model (or open the connection) ahead of the first real call"""
+        self(["warmup"])
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "batch_size": self.batch_size}
+
+
+class OpenAIEmbeddings(EmbeddingBackend):
+    """
+    OpenAI embeddings API (the default backend; one network round trip per batch).
+
+    Args:
+        api_key: OpenAI API key (default: OPENAI_API_KEY)
+        model_name: Embedding model
+        api_base: Optional API base URL, e.g. a proxy endpoint
+        batch_size: Texts sent per request
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model_name: str = "text-embedding-ada-002",
+                 api_base: Optional[str] = None, batch_size: int = 256):
+        super().__init__(batch_size)
+        self.model_name = model_name
+        self._function = embedding_functions.OpenAIEmbeddingFunction(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            model_name=model_name,
+            api_base=api_base,
+        )
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        return [np.asarray(e, dtype=np.float32) for e in self._function(texts)]
+
+    @staticmethod
+    def name() -> str:
+        # Same name and config as Chroma's OpenAI function, so existing
+        # collections (and LongTermMemory schemas) stay compatible
+        return "openai"
+
+    def get_config(self) -> Dict[str, Any]:
+        return self._function.get_config()
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "OpenAIEmbeddings":
+        return OpenAIEmbeddings(
+            api_key=os.getenv(config.get("api_key_env_var") or "OPENAI_API_KEY"),
+            model_name=config.get("model_name", "text-embedding-ada-002"),
+            api_base=config.get("api_base"),
+        )
+
+
+class _PinnedMiniLM(ONNXMiniLM_L6_V2):
+    """Chroma's MiniLM with a configurable ONNX session and per-batch padding"""
+
+    def __init__(self, num_threads: Optional[int], preferred_providers: Optional[List[str]]):
+        super().__init__(preferred_providers=preferred_providers)
+        self.num_threads = num_threads
+
+    @property
+    def _session_options(self) -> Any:
+        options = self.ort.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        return options
+
+    @property
+    def model(self) -> Any:
+        session = self.__dict__.get("_session")
+        if session is None:
+            providers = self._preferred_providers or self.ort.get_available_providers()
+            session = self.ort.InferenceSession(
+                os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx"),
+                providers=[p for p in providers if p != "CoreMLExecutionProvider"],
+                sess_options=self._session_options,
+            )
+            self.__dict__["_session"] = session
+        return session
+
+    @property
+    def tokenizer(self) -> Any:
+        tokenizer = self.__dict__.get("_tokenizer")
+        if tokenizer is None:
+            tokenizer = self.Tokenizer.from_file(
+                os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "tokenizer.json")
+            )
+            # Pad to the longest text of the batch rather than always to 256
+            # tokens; short queries then cost a fraction of the compute
+            tokenizer.enable_truncation(max_length=256)
+            tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+            self.__dict__["_tokenizer"] = tokenizer
+        return tokenizer
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        self._download_model_if_not_exists()
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        last_hidden_state = self.model.run(None, {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids),
+        })[0]
+        # Mean pooling over real tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return self._normalize(pooled).astype(np.float32)
+
+
+class MiniLMEmbeddings(EmbeddingBackend):
+    """
+    Local all-MiniLM-L6-v2 embeddings through onnxruntime (384 dimensions).
+
+    Uses the ONNX model Chroma ships (downloaded to ~/.cache/chroma on first
+    use), so queries are embedded in-process in milliseconds instead of a
+    network round trip. Texts are sorted by length before batching so each
+    batch is padded only to its own longest text.
+
+    Args:
+        num_threads: ONNX intra-op threads (None lets onnxruntime use all cores);
+            pin it when several workers share a machine
+        preferred_providers: onnxruntime execution providers, e.g. ["CPUExecutionProvider"]
+        batch_size: Texts per forward pass
+    """
+
+    model_name = ONNXMiniLM_L6_V2.MODEL_NAME
+
+    def __init__(self, num_threads: Optional[int] = None,
+                 preferred_providers: Optional[List[str]] = None, batch_size: int = 32):
+        super().__init__(batch_size)
+        self.num_threads = num_threads
+        self.preferred_providers = preferred_providers
+        self._model = _PinnedMiniLM(num_threads, preferred_providers)
+        # onnxruntime sessions are thread-safe, but one run at a time keeps
+        # the pinned thread budget from being oversubscribed
+        self._lock = threading.Lock()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embedded = super().__call__([texts[i] for i in order])
+        embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+        for position, i in enumerate(order):
+            embeddings[i] = embedded[position]
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        with self._lock:
+            return list(self._model.embed(texts))
+
+    @staticmethod
+    def name() -> str:
+        # Same vectors as Chroma's default function, so collections stay compatible
+        return "onnx_mini_lm_l6_v2"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"preferred_providers": self.preferred_providers}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "MiniLMEmbeddings":
+        return MiniLMEmbeddings(preferred_providers=config.get("preferred_providers"))
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """
+    Deterministic feature-hashing embeddings, for tests and offline runs.
+
+    Words and character trigrams are hashed into `dimensions` signed buckets
+    and the vector is L2-normalized, so texts sharing words land close
+    together. No model, no network, identical output across processes.
+
+    Args:
+        dimensions: Vector size
+        batch_size: Texts per batch
+    """
+
+    def __init__(self, dimensions: int = 384, batch_size: int = 256):
+        super().__init__(batch_size)
+        self.dimensions = dimensions
+        self.model_name = f"hashing-{dimensions}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_PATTERN.findall(text.lower())
+        trigrams = [w[i:i + 3] for w in words for i in range(max(len(w) - 2, 1))]
+        return words + [f"#{t}" for t in trigrams]
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % self.dimensions] += 1.0 if (value >> 63) else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        return list(matrix)
+
+    @staticmethod
+    def name() -> str:
+        return "hashing"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {**super().get_config(), "dimensions": self.dimensions}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashingEmbeddings":
+        return HashingEmbeddings(dimensions=config.get("dimensions", 384),
+                                 batch_size=config.get("batch_size", 256))
+
+
+def normalize_rows(vectors: Any) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix as float32, leaving zero rows as they are"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def embedding_id(embedding_function: Any) -> str:
+    """Identify an embedding function (provider and model); caches report the function they wrap"""
+    embedding_function = getattr(embedding_function, "cached_function", embedding_function)
+    try:
+        name = embedding_function.name()
+    except Exception:
+        name = type(embedding_function).__name__
+    model = getattr(embedding_function, "model_name", None)
+    return f"{name}:{model}" if model else name
+
+
+class CachedEmbeddingFunction(EmbeddingBackend):
+    """
+    Persistent embedding cache in front of another embedding function.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by the sha256 of
+    the wrapped function's identity (provider and model) and the text, so
+    a text is embedded once per model across runs and processes. Each call
+    looks up every text, then embeds only the misses (deduplicated) in one
+    call to the wrapped function.
+
+    Args:
+        function: Embedding function to cache
+        path: SQLite file holding the vectors
+
+    Example:
+        >>> ef = CachedEmbeddingFunction(get_embedding_function("openai"), "embeddings.sqlite")
+        >>> manager = VectorStoreManager(embedding_backend=ef)
+    """
+
+    # SQLite's default limit on bound parameters is 999
+    _LOOKUP_CHUNK = 900
+
+    def __init__(self, function: EmbeddingFunction, path: str):
+        super().__init__(batch_size=self._LOOKUP_CHUNK)
+        self.cached_function = function
+        self.path = path
+        self.model_name = getattr(function, "model_name", "")
+        self.hits = 0
+        self.misses = 0
+        self._prefix = embedding_id(function).encode() + b"\x00"
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, "
+            "vector BLOB NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(self._prefix + text.encode()).digest()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        # A single batch: one lookup (chunked by `_lookup`) and one call to
+        # the wrapped function for all misses
+        return self._embed_batch(list(input))
+
+    def _embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+        keys = [self._key(text) for text in texts]
+        with start_span("embeddings.cache", {"embedding.model": self.model_name, "text_count": len(texts)}) as span:
+            found = self._lookup(list(set(keys)))
+            missing = {key: text for key, text in zip(keys, texts) if key not in found}
+            self.hits += len(texts) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+            span.set_attribute("cache.misses", len(missing))
+            if missing:
+                vectors = self.cached_function(list(missing.values()))
+                embedded = {key: np.asarray(v, dtype=np.float32) for key, v in zip(missing, vectors)}
+                self._store(embedded)
+                found.update(embedded)
+        return [found[key] for key in keys]
+
+    def _lookup(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(keys), self._LOOKUP_CHUNK):
+            chunk = keys[start:start + self._LOOKUP_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def _store(self, vectors: Dict[bytes, np.ndarray]):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in vectors.items()],
+            )
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        """Drop every cached vector"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM embeddings")
+
+    def warmup(self):
+        warmup = getattr(self.cached_function, "warmup", None)
+        if warmup:
+            warmup()
+
+    @staticmethod
+    def name() -> str:
+        return "cached"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "function": self.cached_function.name(),
+            "config": self.cached_function.get_config(),
+        }
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "CachedEmbeddingFunction":
+        name = config["function"]
+        backends = {backend.name(): backend for backend in BACKENDS.values()}
+        function = known_embedding_functions.get(name, backends.get(name)).build_from_config(config["config"])
+        return CachedEmbeddingFunction(function, config["path"])
+
+
+BACKENDS = {
+    "openai": OpenAIEmbeddings,
+    "minilm": MiniLMEmbeddings,
+    "hashing": HashingEmbeddings,
+}
+
+_cache: Dict[Tuple[str, str], EmbeddingBackend] = {}
+_cache_lock = threading.Lock()
+
+
+def get_embedding_function(backend: str = "openai", warm: bool = False, **options) -> EmbeddingBackend:
+    """
+    Get a shared embedding backend, created once per process and options.
+
+    Loading a local model takes seconds; every `VectorStoreManager` (and
+    every store) asking for the same backend reuses the loaded instance.
+
+    Args:
+        backend: One of "openai", "minilm" or "hashing"
+        warm: Load the model now instead of on the first embedding call
+        **options: Backend constructor arguments (e.g. num_threads=2)
+
+    Returns:
+        EmbeddingBackend: The shared instance
+
+    Raises:
+        ValueError: If the backend is unknown
+
+    Example:
+        >>> ef = get_embedding_function("minilm", warm=True, num_threads=2)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {sorted(BACKENDS)}")
+    # Options may hold lists (e.g. preferred_providers), so key on their JSON form
+    key = (backend, json.dumps(options, sort_keys=True, default=str))
+    with _cache_lock:
+        function = _cache.get(key)
+        if function is None:
+            function = BACKENDS[backend](**options)
+            _cache[key] = function
+    if warm:
+        function.warmup()
+    return function
@@ -296,10 +296,21 @@ class AgentEvaluator:
         if run.end_timestamp and run.start_timestamp:
             execution_time = (run.end_timestamp - run.start_timestamp).total_seconds()
         
+        # Tool latency comes from the measured tool steps when available
+        tool_step_time = execution_time
+        tool_stats = run.step_stats().get("tool_executor")
+        if tool_stats:
+            tool_step_time = tool_stats.total_duration
+        peak_memory = max(
+            (m.peak_memory for m in run.step_metrics if m.peak_memory is not None),
+            default=None,
+        )
+        
         system_metrics = SystemMetrics(
             total_tokens=total_tokens,
             execution_time=execution_time,
-            tool_call_latency=execution_time / max(len(tool_calls_made), 1),
+            tool_call_latency=tool_step_time / max(len(tool_calls_made), 1),
+            memory_usage=peak_memory,
             cost_estimate=self._estimate_cost(total_tokens)
         )
         
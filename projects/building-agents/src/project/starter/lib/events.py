@@ -0,0 +1,83 @@
+from typing import Any, Optional
+import logging
+
+
+class StateMachineListener:
+    """
+    Receives execution events from a `StateMachine`.
+
+    Subclass and override only the hooks you need; the default
+    implementations do nothing. Listeners are called synchronously on the
+    thread running the workflow, so they should return quickly.
+
+    Example:
+        >>> machine.subscribe(LoggingListener())
+    """
+
+    def on_step_start(self, run: Any, step_id: str, state: Any):
+        """Called right before a step's logic runs"""
+        pass
+
+    def on_step_end(self, run: Any, step_id: str, state: Any, metrics: Any):
+        """Called after a step finished, with the new state and its StepMetrics"""
+        pass
+
+    def on_transition(self, run: Any, source: str, target: str):
+        """Called when the workflow moves from `source` to `target`"""
+        pass
+
+    def on_error(self, run: Any, step_id: str, error: BaseException):
+        """Called when a step raises, before the exception propagates"""
+        pass
+
+
+class LoggingListener(StateMachineListener):
+    """
+    Structured logging adapter for state machine events.
+
+    Every record carries `run_id`, `step_id` and `event` in its `extra`
+    fields, so JSON formatters (e.g. python-json-logger) can emit them as
+    separate keys.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("lib.state_machine")
+        self.level = level
+
+    def _log(self, level: int, event: str, message: str, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, extra={"event": event, **fields})
+
+    def on_step_start(self, run, step_id, state):
+        self._log(logging.DEBUG, "step_start", "Executing step: %s" % step_id,
+                  run_id=run.run_id, step_id=step_id)
+
+    def on_step_end(self, run, step_id, state, metrics):
+        self._log(self.level, "step_end", "Finished step: %s" % step_id,
+                  run_id=run.run_id, step_id=step_id,
+                  duration=metrics.duration, tokens=metrics.tokens)
+
+    def on_transition(self, run, source, target):
+        self._log(logging.DEBUG, "transition", "Transition: %s -> %s" % (source, target),
+                  run_id=run.run_id, step_id=source, target=target)
+
+    def on_error(self, run, step_id, error):
+        self._log(logging.ERROR, "error", "Step failed: %s (%r)" % (step_id, error),
+                  run_id=run.run_id, step_id=step_id, error=repr(error))
+
+
+class ConsoleListener(StateMachineListener):
+    """Prints step progress to stdout, useful when working in notebooks"""
+
+    def on_step_start(self, run, step_id, state):
+        if step_id == "__entry__":
+            print(f"[StateMachine] Starting: {step_id}")
+        else:
+            print(f"[StateMachine] Executing step: {step_id}")
+
+    def on_transition(self, run, source, target):
+        if target == "__termination__":
+            print(f"[StateMachine] Terminating: {target}")
+
+    def on_error(self, run, step_id, error):
+        print(f"[StateMachine] Error in step {step_id}: {error!r}")
@@ -0,0 +1,259 @@
+from typing import List, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import threading
+
+from lib.llm import LLM
+from lib.messages import AIMessage, BaseMessage, MessageLog, SystemMessage, ToolMessage, UserMessage
+
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """
+    Cheap token estimate for a message (~4 characters per token plus a
+    fixed per-message overhead). Good enough for budgeting without a
+    tokenizer dependency.
+    """
+    chars = len(message.content or "")
+    if isinstance(message, AIMessage) and message.tool_calls:
+        for call in message.tool_calls:
+            chars += len(call.function.name) + len(call.function.arguments)
+    return chars // 4 + 4
+
+
+def _split_units(messages: MessageLog) -> Tuple[List[BaseMessage], List[List[BaseMessage]]]:
+    """
+    Split a history into pinned leading system messages and units that must
+    be kept or dropped together: an assistant message with tool calls stays
+    with the tool results that answer it.
+    """
+    items = list(messages)
+    start = 0
+    while start < len(items) and isinstance(items[start], SystemMessage):
+        start += 1
+
+    units: List[List[BaseMessage]] = []
+    for message in items[start:]:
+        if isinstance(message, ToolMessage) and units:
+            units[-1].append(message)
+        else:
+            units.append([message])
+    return items[:start], units
+
+
+class HistoryStrategy(ABC):
+    """
+    Decides which part of a session's history is kept and sent to the LLM.
+
+    Agents apply their strategy in `_prepare_messages_step`, after the new
+    user query has been appended; the result replaces the state's messages,
+    so the history carried into the next turn stays bounded too.
+    """
+
+    @abstractmethod
+    def apply(self, messages: MessageLog, session_id: str) -> MessageLog:
+        pass
+
+    def reset(self, session_id: Optional[str] = None):
+        """Forget any state kept for a session (all sessions if None)"""
+        pass
+
+
+class FullHistory(HistoryStrategy):
+    """Keep the whole history (the default behaviour)"""
+
+    def apply(self, messages: MessageLog, session_id: str) -> MessageLog:
+        return messages
+
+
+class TokenBudgetWindow(HistoryStrategy):
+    """
+    Sliding window over the most recent turns that fit a token budget.
+
+    Leading system messages (the instructions, and a conversation summary
+    if one is present) are always kept, and the latest user turn with its
+    tool calls and results is never dropped, even if it exceeds the budget
+    on its own.
+
+    Args:
+        max_tokens: Estimated token budget for the whole history
+    """
+
+    def __init__(self, max_tokens: int = 8000):
+        self.max_tokens = max_tokens
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(max_tokens={self.max_tokens})"
+
+    def _trim(self, pinned: List[BaseMessage],
+              units: List[List[BaseMessage]]) -> Tuple[List[List[BaseMessage]], List[List[BaseMessage]]]:
+        """Return (dropped, kept) units"""
+        budget = self.max_tokens - sum(estimate_tokens(m) for m in pinned)
+
+        # Always keep the current turn, starting at the last user message
+        last_user = max(
+            (i for i, unit in enumerate(units) if isinstance(unit[0], UserMessage)),
+            default=0,
+        )
+        cut = last_user
+        budget -= sum(estimate_tokens(m) for unit in units[last_user:] for m in unit)
+
+        for i in range(last_user - 1, -1, -1):
+            cost = sum(estimate_tokens(m) for m in units[i])
+            if cost > budget:
+                break
+            budget -= cost
+            cut = i
+
+        # The kept window must open with a user message
+        while cut < last_user and not isinstance(units[cut][0], UserMessage):
+            cut += 1
+        return units[:cut], units[cut:]
+
+    def apply(self, messages: MessageLog, session_id: str) -> MessageLog:
+        if sum(estimate_tokens(m) for m in messages) <= self.max_tokens:
+            return messages
+
+        pinned, units = _split_units(messages)
+        dropped, kept = self._trim(pinned, units)
+        if not dropped:
+            return messages
+        return MessageLog(pinned + [m for unit in kept for m in unit])
+
+
+@dataclass
+class _SummaryState:
+    summary: Optional[str] = None
+    pending: List[BaseMessage] = field(default_factory=list)
+    future: Optional[Future] = None
+
+
+class SummarizingHistory(TokenBudgetWindow):
+    """
+    Token budget window that folds dropped turns into a rolling summary.
+
+    Turns that fall out of the window are summarized by an LLM on a
+    background thread, together with the previous summary, so the agent's
+    turn never waits on summarization. The summary is injected as a system
+    message right after the instructions from the next turn on; until it
+    is ready the window simply drops the old turns.
+
+    The summary message is part of the history the agent stores with each
+    run, so the session memory is its durable copy: state for a session
+    not seen recently is dropped (least recently used first, beyond
+    `max_sessions`), and is picked up again from the summary message in
+    the history after an eviction or a restart. Agents call `reset` when
+    a session is reset or deleted.
+
+    Args:
+        max_tokens: Estimated token budget for the whole history
+        llm: LLM used for summaries (default: gpt-4o-mini, temperature 0)
+        max_summary_words: Length guidance given to the summarizer
+        max_workers: Size of the background summarization pool
+        max_sessions: Sessions whose summary state is kept in memory
+    """
+
+    def __init__(self, max_tokens: int = 8000, llm: Optional[LLM] = None,
+                 max_summary_words: int = 200, max_workers: int = 1,
+                 max_sessions: int = 1024):
+        super().__init__(max_tokens)
+        self._llm = llm
+        self.max_summary_words = max_summary_words
+        self.max_sessions = max_sessions
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history-summary")
+        self._sessions: "OrderedDict[str, _SummaryState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self) -> LLM:
+        if self._llm is None:
+            self._llm = LLM(model="gpt-4o-mini", temperature=0.0)
+        return self._llm
+
+    def get_summary(self, session_id: str) -> Optional[str]:
+        state = self._sessions.get(session_id)
+        return state.summary if state else None
+
+    def reset(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def _state(self, session_id: str) -> _SummaryState:
+        """Get a session's state, evicting the least recently used ones (caller holds the lock)"""
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SummaryState()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def _summarize(self, previous: Optional[str], messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(
+            f"{m.role}: {m.content}" for m in messages if m.content
+        )
+        prompt = (
+            f"Update the running summary of a conversation in at most {self.max_summary_words} words. "
+            "Keep facts, user preferences, names, dates and open questions; drop pleasantries.\n\n"
+            f"# Current summary:\n{previous or '(none)'}\n\n"
+            f"# New messages:\n{transcript}\n\n"
+            "# Updated summary:"
+        )
+        return self.llm.invoke(prompt).content or previous or ""
+
+    def _collect(self, state: _SummaryState):
+        """Pick up a finished summary and schedule the next one (caller holds the lock)"""
+        if state.future is not None and state.future.done():
+            try:
+                state.summary = state.future.result()
+            except Exception:
+                pass  # keep the previous summary; the dropped turns are lost
+            state.future = None
+
+        if state.pending and state.future is None:
+            state.future = self._executor.submit(self._summarize, state.summary, state.pending)
+            state.pending = []
+
+    def apply(self, messages: MessageLog, session_id: str) -> MessageLog:
+        original_pinned, units = _split_units(messages)
+        instructions = [m for m in original_pinned if not (m.content or "").startswith(SUMMARY_PREFIX)]
+        summaries = [m for m in original_pinned if (m.content or "").startswith(SUMMARY_PREFIX)][-1:]
+
+        with self._lock:
+            state = self._state(session_id)
+            if state.summary is None and state.future is None and summaries:
+                # Evicted or restarted: continue from the summary in the history
+                state.summary = summaries[0].content[len(SUMMARY_PREFIX):]
+            self._collect(state)
+            summary = state.summary
+        if summary is not None and not (summaries and summaries[0].content == SUMMARY_PREFIX + summary):
+            summaries = [SystemMessage(content=SUMMARY_PREFIX + summary)]
+        pinned = instructions + summaries
+
+        total = sum(estimate_tokens(m) for m in pinned) + sum(
+            estimate_tokens(m) for unit in units for m in unit
+        )
+        dropped, kept = [], units
+        if total > self.max_tokens:
+            dropped, kept = self._trim(pinned, units)
+
+        if dropped:
+            with self._lock:
+                state.pending.extend(m for unit in dropped for m in unit)
+                self._collect(state)
+        elif len(pinned) == len(original_pinned) and all(a is b for a, b in zip(pinned, original_pinned)):
+            return messages
+
+        return MessageLog(pinned + [m for unit in kept for m in unit])
+
+    def shutdown(self, wait: bool = True):
+        """Stop the background summarization pool"""
+        self._executor.shutdown(wait=wait)
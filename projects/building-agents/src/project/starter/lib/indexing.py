@@ -0,0 +1,214 @@
+from typing import Any, Callable, Dict, List, Optional, Union
+from dataclasses import dataclass, field
+from pathlib import Path
+import hashlib
+import json
+import os
+import tempfile
+
+from lib.documents import Document, Corpus
+from lib.embeddings import embedding_id
+from lib.tracing import start_span
+from lib.vector_db import VectorStore, IngestionError
+
+
+HASH_KEY = "content_hash"
+
+
+def document_hash(document: Document) -> str:
+    """Hash of a document's content and metadata (ignoring the stored hash itself)"""
+    metadata = {k: v for k, v in (document.metadata or {}).items() if k != HASH_KEY}
+    payload = json.dumps([document.content, metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class IndexDiff:
+    """Documents to write and delete to bring a store in line with a corpus"""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.removed),
+            "unchanged": self.unchanged,
+        }
+
+
+class IncrementalIndexer:
+    """
+    Keeps a vector store in sync with a corpus, writing only what changed.
+
+    Every document is hashed (content and metadata). `sync` compares the
+    hashes with a manifest of what is indexed, upserts new and changed
+    documents, deletes documents that are no longer in the corpus and
+    leaves the rest alone, so a refresh costs embeddings and writes in
+    proportion to the diff rather than the catalog.
+
+    The hash is also stored in each document's metadata (`content_hash`).
+    The manifest is kept as JSON at `manifest_path`; when there is none,
+    or it doesn't match the store (another collection, another embedding
+    model, a different document count), it is rebuilt from the store's
+    metadata. Documents indexed without a hash are treated as changed.
+
+    Args:
+        store: Vector store to keep in sync
+        manifest_path: JSON manifest file (None to always read hashes from the store)
+        batch_size: Documents per upsert chunk (default: `VectorStore` default)
+        max_workers: Chunks embedded at once
+
+    Example:
+        >>> indexer = IncrementalIndexer(store, "games.manifest.json")
+        >>> indexer.sync(corpus).summary()
+        {'added': 3, 'changed': 1, 'removed': 0, 'unchanged': 996}
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, store: VectorStore, manifest_path: Optional[Union[str, Path]] = None,
+                 batch_size: Optional[int] = None, max_workers: int = 4):
+        self.store = store
+        self.manifest_path = Path(manifest_path) if manifest_path else None
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._manifest: Optional[Dict[str, str]] = None
+
+    def __repr__(self):
+        return f"IncrementalIndexer(store='{self.store.name}', manifest='{self.manifest_path}')"
+
+    # Manifest --------------------------------------------------------------
+    @property
+    def _identity(self) -> Dict[str, Any]:
+        return {
+            "version": self.MANIFEST_VERSION,
+            "collection": self.store.name,
+            "embedding_function": embedding_id(self.store.embedding_function),
+        }
+
+    @property
+    def manifest(self) -> Dict[str, str]:
+        """Indexed document IDs and their hashes"""
+        if self._manifest is None:
+            self._manifest = self._load_manifest()
+        return self._manifest
+
+    def _load_manifest(self) -> Dict[str, str]:
+        if self.manifest_path and self.manifest_path.exists():
+            try:
+                data = json.loads(self.manifest_path.read_text())
+            except ValueError:
+                data = {}
+            documents = data.get("documents", {})
+            if data.get("identity") == self._identity and len(documents) == self.store.count():
+                return documents
+        return self._rebuild_manifest()
+
+    def _rebuild_manifest(self) -> Dict[str, str]:
+        """Read the stored hashes back from the store"""
+        with start_span("indexer.rebuild_manifest", {"collection": self.store.name}):
+            stored = self.store.get(include=["metadatas"])
+        return {
+            doc_id: (metadata or {}).get(HASH_KEY, "")
+            for doc_id, metadata in zip(stored["ids"], stored["metadatas"])
+        }
+
+    def _save_manifest(self):
+        if not self.manifest_path:
+            return
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps({"identity": self._identity, "documents": self.manifest})
+        fd, tmp_path = tempfile.mkstemp(dir=self.manifest_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(payload)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # Sync ------------------------------------------------------------------
+    def diff(self, corpus: Union[Corpus, List[Document]]) -> IndexDiff:
+        """Compare a corpus with what is indexed, without writing anything"""
+        return self._diff(corpus, {doc.id: document_hash(doc) for doc in corpus})
+
+    def _diff(self, corpus: Union[Corpus, List[Document]], hashes: Dict[str, str]) -> IndexDiff:
+        manifest = self.manifest
+        diff = IndexDiff()
+        for doc in corpus:
+            indexed = manifest.get(doc.id)
+            if indexed is None:
+                diff.added.append(doc.id)
+            elif indexed != hashes[doc.id]:
+                diff.changed.append(doc.id)
+            else:
+                diff.unchanged += 1
+        diff.removed = [doc_id for doc_id in manifest if doc_id not in hashes]
+        return diff
+
+    def sync(self, corpus: Union[Corpus, List[Document]], dry_run: bool = False,
+             on_progress: Optional[Callable[[int, int], None]] = None) -> IndexDiff:
+        """
+        Bring the store in line with a corpus
+
+        Args:
+            corpus: The full set of documents that should be indexed
+            dry_run: Only compute the diff
+            on_progress: Called with (documents written, documents to write)
+
+        Returns:
+            IndexDiff: What was (or would be) written and deleted
+
+        Raises:
+            ValueError: If the corpus has duplicate IDs
+            IngestionError: If some documents could not be written; the
+                manifest still records everything that was
+        """
+        hashes = {doc.id: document_hash(doc) for doc in corpus}
+        if len(hashes) != len(corpus):
+            raise ValueError("Corpus has duplicate document IDs")
+        diff = self._diff(corpus, hashes)
+        if dry_run or not diff.has_changes:
+            return diff
+
+        with start_span("indexer.sync", {"collection": self.store.name, **diff.summary()}):
+            manifest = self.manifest
+            if diff.removed:
+                self.store.delete(diff.removed)
+                for doc_id in diff.removed:
+                    manifest.pop(doc_id, None)
+
+            pending = set(diff.added) | set(diff.changed)
+            documents = [
+                Document(id=doc.id, content=doc.content,
+                         metadata={**(doc.metadata or {}), HASH_KEY: hashes[doc.id]})
+                for doc in corpus if doc.id in pending
+            ]
+            try:
+                if documents:
+                    self.store.upsert(documents, batch_size=self.batch_size,
+                                      max_workers=self.max_workers, on_progress=on_progress)
+            except IngestionError as e:
+                # Failed documents keep their old hash (or stay out of the
+                # manifest) and are picked up again by the next sync
+                self._record(documents, hashes, set(e.failed_ids))
+                raise
+            except Exception:
+                self._save_manifest()
+                raise
+            self._record(documents, hashes, set())
+        return diff
+
+    def _record(self, documents: List[Document], hashes: Dict[str, str], failed: set):
+        for doc in documents:
+            if doc.id not in failed:
+                self.manifest[doc.id] = hashes[doc.id]
+        self._save_manifest()
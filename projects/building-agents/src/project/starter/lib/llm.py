@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from openai import OpenAI
 from lib.messages import (
@@ -7,8 +7,11 @@ from lib.messages import (
     AIMessage,
     BaseMessage,
     UserMessage,
+    MessageLog,
 )
-from lib.tooling import Tool
+from lib.tooling import Tool, ToolCall
+from lib.metrics import record_tokens
+from lib.tracing import start_span
 
 
 class LLM:
@@ -55,34 +58,107 @@ class LLM:
             return [UserMessage(content=input)]
         elif isinstance(input, BaseMessage):
             return [input]
+        elif isinstance(input, MessageLog):
+            return input
         elif isinstance(input, list) and all(isinstance(m, BaseMessage) for m in input):
             return input
         else:
             raise ValueError(f"Invalid input type {type(input)}.")
 
+    def _stream(self, payload: Dict[str, Any],
+                on_token: Callable[[str], None]) -> Tuple[Optional[str], Optional[List[ToolCall]], Any, Optional[str]]:
+        """Request a streamed completion, passing content deltas to `on_token` as they arrive
+
+        Returns:
+            (content, tool_calls, usage, model) assembled from the chunks
+        """
+        stream = self.client.chat.completions.create(
+            **payload, stream=True, stream_options={"include_usage": True}
+        )
+        content: List[str] = []
+        calls: Dict[int, Dict[str, str]] = {}
+        usage = None
+        model = None
+        for chunk in stream:
+            model = chunk.model or model
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                on_token(delta.content)
+            # Tool calls arrive in fragments keyed by their index
+            for fragment in delta.tool_calls or []:
+                call = calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["name"] += fragment.function.name or ""
+                    call["arguments"] += fragment.function.arguments or ""
+
+        tool_calls = [
+            ToolCall(id=call["id"], type="function",
+                     function={"name": call["name"], "arguments": call["arguments"]})
+            for _, call in sorted(calls.items())
+        ]
+        return ("".join(content) if content else None), (tool_calls or None), usage, model
+
     def invoke(self, 
-               input: str | BaseMessage | List[BaseMessage],
-               response_format: BaseModel = None,) -> AIMessage:
+               input: str | BaseMessage | List[BaseMessage] | MessageLog,
+               response_format: BaseModel = None,
+               on_token: Optional[Callable[[str], None]] = None) -> AIMessage:
+        """
+        Get the model's reply to a conversation
+
+        Args:
+            input: A prompt, a message or a conversation
+            response_format: Optional Pydantic model the reply must be parsed into
+            on_token: Optional callback receiving content deltas as they are
+                generated (the reply is streamed; ignored with `response_format`)
+
+        Returns:
+            AIMessage: The complete reply, with tool calls and token usage
+        """
         messages = self._convert_input(input)
         payload = self._build_payload(messages)
-        if response_format:
-            payload.update({"response_format": response_format})
-            response = self.client.beta.chat.completions.parse(**payload)
-        else:
-            response = self.client.chat.completions.create(**payload)
-        choice = response.choices[0]
-        message = choice.message
+        attributes = {
+            "gen_ai.system": "openai",
+            "gen_ai.request.model": self.model,
+            "gen_ai.request.temperature": self.temperature,
+            "message_count": len(messages),
+            "stream": on_token is not None and not response_format,
+        }
+        with start_span("llm.invoke", attributes) as span:
+            if on_token is not None and not response_format:
+                content, tool_calls, usage, response_model = self._stream(payload, on_token)
+            else:
+                if response_format:
+                    payload.update({"response_format": response_format})
+                    response = self.client.beta.chat.completions.parse(**payload)
+                else:
+                    response = self.client.chat.completions.create(**payload)
+                message = response.choices[0].message
+                content, tool_calls = message.content, message.tool_calls
+                usage, response_model = response.usage, response.model
 
-        token_usage = None
-        if response.usage:
-            token_usage = TokenUsage(
-                prompt_tokens=response.usage.prompt_tokens,
-                completion_tokens=response.usage.completion_tokens,
-                total_tokens=response.usage.total_tokens
-            )
+            token_usage = None
+            if usage:
+                token_usage = TokenUsage(
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    total_tokens=usage.total_tokens
+                )
+                record_tokens(token_usage.total_tokens)
+                span.set_attributes({
+                    "gen_ai.response.model": response_model,
+                    "gen_ai.usage.input_tokens": token_usage.prompt_tokens,
+                    "gen_ai.usage.output_tokens": token_usage.completion_tokens,
+                })
 
         return AIMessage(
-            content=message.content,
-            tool_calls=message.tool_calls,
+            content=content,
+            tool_calls=tool_calls,
             token_usage=token_usage
         )
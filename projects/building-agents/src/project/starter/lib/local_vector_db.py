@@ -0,0 +1,695 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction, QueryResult, GetResult
+
+from lib.ann import IVFIndex, exact_search, top_k
+from lib.documents import Corpus
+from lib.embeddings import normalize_rows
+from lib.tracing import start_span
+from lib.vector_db import VectorStore, VectorStoreManager, IngestionError
+
+
+logger = logging.getLogger("lib.local_vector_db")
+
+_MISSING = object()
+
+
+@dataclass
+class _Column:
+    """
+    Cached view of one metadata key across a store's documents.
+
+    Attributes:
+        values: Raw values (object array, `_MISSING` where the key is absent)
+        numeric: Numeric view, NaN where the value is not a number
+        present: Which documents have the key at all
+        codes: Per-document index into `categories` (None if some value is unhashable)
+        categories: Distinct values mapped to their code, so equality and
+            membership filters compare integer arrays
+    """
+    values: np.ndarray
+    numeric: np.ndarray
+    present: np.ndarray
+    codes: Optional[np.ndarray]
+    categories: Dict[Any, int]
+
+# Stores with writes not saved yet
+_unsaved_stores: "weakref.WeakSet[NumpyVectorStore]" = weakref.WeakSet()
+
+
+@atexit.register
+def _save_unsaved_stores():
+    """Save stores whose pending autosave has not run before the interpreter exits"""
+    for store in list(_unsaved_stores):
+        try:
+            store.flush()
+        except Exception:
+            logger.exception("Failed to save %r at exit", store)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store backed by a NumPy matrix.
+
+    Drop-in alternative to the Chroma-backed `VectorStore` for small and
+    medium catalogs: same methods, and `query`/`get` return the same
+    `QueryResult`/`GetResult` shapes. Distances follow the store's
+    `hnsw:space` metadata like Chroma: squared L2 by default (2 - 2 cosine
+    on normalized vectors), or 1 - cosine for "cosine" and "ip".
+
+    Embeddings are normalized once on insert and kept in one contiguous
+    float32 matrix, so a query is a matrix product plus `argpartition`,
+    scanned in blocks of `block_size` rows to bound memory. Metadata
+    filters (Chroma `where` syntax: equality, `$ne`, `$gt`, `$gte`, `$lt`,
+    `$lte`, `$in`, `$nin`, `$and`, `$or`) are evaluated as boolean masks
+    over metadata columns, and masks are cached until the next write.
+    Stored embeddings are returned normalized.
+
+    With an `index` (see `lib.ann.IVFIndex`), searches over stores larger
+    than the index's `min_train_size` are approximate: only the vectors in
+    the lists closest to the query are scored. Stores that shrink below
+    that size, and filters that leave fewer rows than that, are still
+    searched exactly.
+
+    With a `path`, `save` writes the matrix with `np.save` and the records
+    as JSON; reopening memory-maps the matrix, and it is only copied into
+    memory on the first write. Saving rewrites the whole store, so with
+    `autosave` writes only mark the store as changed and it is saved at
+    most once every `save_interval` seconds, however many writes land in
+    between. `flush` saves pending changes right away; stores with unsaved
+    changes are also saved when the interpreter exits.
+
+    Args:
+        name: Store name
+        embedding_function: Function used to embed documents and queries
+        metadata: Store-level metadata
+        path: Directory the store is saved to (None for memory only)
+        autosave: Save automatically after writes (only with a `path`)
+        block_size: Rows scored per matrix product
+        index: Optional approximate nearest-neighbour index
+        save_interval: Seconds an automatic save waits to batch further
+            writes (0 saves after every write)
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    RECORDS_FILE = "records.json"
+    INDEX_FILE = "ivf.npz"
+    MASK_CACHE_SIZE = 256
+
+    def __init__(self, name: str, embedding_function: Optional[EmbeddingFunction] = None,
+                 metadata: Optional[Dict[str, Any]] = None, path: Optional[Union[str, Path]] = None,
+                 autosave: bool = True, block_size: int = 65536,
+                 index: Optional[IVFIndex] = None, save_interval: float = 1.0):
+        self._name = name
+        self.embedding_function = embedding_function
+        self._metadata = dict(metadata or {})
+        self.path = Path(path) if path else None
+        self.autosave = autosave
+        self.save_interval = save_interval
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self.block_size = block_size
+        self.index = index
+        self._updated_rows: List[int] = []
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        self._columns: Dict[str, _Column] = {}
+        self._masks: Dict[str, np.ndarray] = {}
+        if self.path and (self.path / self.RECORDS_FILE).exists():
+            self._load()
+
+    def __repr__(self):
+        return f"NumpyVectorStore(name='{self._name}', count={self._size})"
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return dict(self._metadata)
+
+    @property
+    def dimensions(self) -> int:
+        return self._vectors.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Normalized embeddings, one row per document"""
+        return self._vectors[:self._size]
+
+    def count(self) -> int:
+        return self._size
+
+    def update_metadata(self, metadata: Dict[str, Any]):
+        with self._lock:
+            self._metadata = dict(metadata)
+            self._changed()
+
+    # Persistence -----------------------------------------------------------
+    def save(self):
+        """Write the matrix (`np.save`) and records (JSON) to `path`"""
+        if not self.path:
+            raise ValueError(f"Store '{self._name}' has no path to save to")
+        with self._lock, start_span("local_vector_store.save", {"collection": self._name, "document_count": self._size}):
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._replace(self.VECTORS_FILE, lambda fp: np.save(fp, np.ascontiguousarray(self.matrix)))
+            records = {
+                "name": self._name,
+                "metadata": self._metadata,
+                "ids": self._ids,
+                "documents": self._documents,
+                "metadatas": self._metadatas,
+            }
+            self._replace(self.RECORDS_FILE, lambda fp: fp.write(json.dumps(records).encode()))
+            if self.index is not None and self.index.trained:
+                self._replace(self.INDEX_FILE, lambda fp: np.savez(fp, **self.index.state()))
+            self._saved()
+
+    def flush(self):
+        """Save changes not saved yet, if any"""
+        with self._lock:
+            if self._dirty and self.path:
+                self.save()
+
+    def _saved(self):
+        """Forget pending changes and any scheduled save (caller holds the lock)"""
+        self._dirty = False
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        _unsaved_stores.discard(self)
+
+    def _replace(self, filename: str, write: Callable[[Any], Any]):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                write(fp)
+            os.replace(tmp_path, self.path / filename)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load(self):
+        records = json.loads((self.path / self.RECORDS_FILE).read_text())
+        self._metadata = records.get("metadata") or self._metadata
+        self._ids = records["ids"]
+        self._documents = records["documents"]
+        self._metadatas = records["metadatas"]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        # Read-only memory map; copied into memory on the first write
+        self._vectors = np.load(self.path / self.VECTORS_FILE, mmap_mode="r")
+        self._size = len(self._ids)
+        if self.index is not None and (self.path / self.INDEX_FILE).exists():
+            with np.load(self.path / self.INDEX_FILE) as state:
+                self.index.load_state(dict(state), self._size)
+
+    def _changed(self):
+        self._columns.clear()
+        self._masks.clear()
+        if not self.path:
+            return
+        self._dirty = True
+        if not self.autosave:
+            return
+        if self.save_interval <= 0:
+            self.save()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_interval, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+            _unsaved_stores.add(self)
+
+    # Writes ----------------------------------------------------------------
+    def _write(self, operation: str, item: Corpus, embeddings: Optional[List[List[float]]],
+               batch_size: Optional[int], max_workers: int, max_retries: int,
+               on_progress: Optional[Callable[[int, int], None]]):
+        item_dict = item.to_dict()
+        ids = item_dict["ids"]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate IDs in the same write")
+        total = len(ids)
+        if not total:
+            return
+
+        with start_span(f"local_vector_store.{operation}", {"collection": self._name, "document_count": total}):
+            if embeddings is not None:
+                chunks = [(0, total, normalize_rows(embeddings))]
+            else:
+                chunks = self._embed_chunks(item_dict["contents"], batch_size, max_workers, max_retries)
+
+            failed_ids: List[str] = []
+            errors: List[BaseException] = []
+            done = 0
+            with self._lock:
+                # Check the whole batch first so a bad one leaves the store untouched
+                dimensions = {vectors.shape[1] for _, _, vectors in chunks if not isinstance(vectors, BaseException)}
+                if self._size:
+                    dimensions.add(self.dimensions)
+                if len(dimensions) > 1:
+                    raise ValueError(f"Embeddings for store '{self._name}' have mismatched dimensions: "
+                                     f"{sorted(dimensions)}")
+                for start, end, vectors in chunks:
+                    if isinstance(vectors, BaseException):
+                        failed_ids.extend(ids[start:end])
+                        errors.append(vectors)
+                        continue
+                    for offset in range(end - start):
+                        i = start + offset
+                        position = self._positions.get(ids[i])
+                        if position is not None and operation == "add":
+                            logger.warning("Document '%s' already exists in '%s', skipped", ids[i], self._name)
+                            continue
+                        self._put(position, ids[i], item_dict["contents"][i], item_dict["metadatas"][i],
+                                  vectors[offset])
+                    done += end - start
+                    if on_progress:
+                        on_progress(done, total)
+                self._sync_index()
+                self._changed()
+
+            if failed_ids:
+                raise IngestionError(
+                    f"{len(failed_ids)} of {total} documents were not written to '{self._name}'",
+                    failed_ids, errors,
+                )
+
+    def _embed_chunks(self, texts: List[str], batch_size: Optional[int], max_workers: int,
+                      max_retries: int) -> List[Tuple[int, int, Any]]:
+        """Embed texts in chunks on a thread pool; failed chunks carry their exception"""
+        size = max(1, batch_size or self.DEFAULT_BATCH_SIZE)
+        bounds = [(start, min(start + size, len(texts))) for start in range(0, len(texts), size)]
+
+        def embed(bound: Tuple[int, int]) -> Tuple[int, int, Any]:
+            start, end = bound
+            attempt = 0
+            while True:
+                try:
+                    return start, end, normalize_rows(self.embedding_function(texts[start:end]))
+                except Exception as e:
+                    if attempt >= max_retries:
+                        return start, end, e
+                    attempt += 1
+                    logger.warning("Embedding documents %d-%d for '%s' failed (%r), retry %d/%d",
+                                   start, end, self._name, e, attempt, max_retries)
+                    time.sleep(min(0.5 * 2 ** (attempt - 1), 8.0))
+
+        if len(bounds) == 1:
+            return [embed(bounds[0])]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(bounds))),
+                                thread_name_prefix="local-vector-store-embed") as pool:
+            return list(pool.map(embed, bounds))
+
+    def _put(self, position: Optional[int], doc_id: str, content: Optional[str],
+             metadata: Optional[Dict[str, Any]], vector: np.ndarray):
+        if position is None:
+            position = self._size
+            self._reserve(self._size + 1, vector.shape[0])
+            self._ids.append(doc_id)
+            self._documents.append(content)
+            self._metadatas.append(metadata)
+            self._positions[doc_id] = position
+            self._size += 1
+        else:
+            self._reserve(self._size, vector.shape[0])
+            self._updated_rows.append(position)
+            self._documents[position] = content
+            self._metadatas[position] = metadata
+        self._vectors[position] = vector
+
+    def _reserve(self, rows: int, dimensions: int):
+        """Make the matrix writable with room for `rows` rows (amortized doubling)"""
+        capacity = self._vectors.shape[0]
+        if self._vectors.flags.writeable and capacity >= rows and self._vectors.shape[1] == dimensions:
+            return
+        grown = np.zeros((max(rows, 2 * capacity, 64), dimensions), dtype=np.float32)
+        if self._size:
+            grown[:self._size] = self.matrix
+        self._vectors = grown
+
+    def delete(self, ids: List[str]):
+        """Remove documents by ID"""
+        with self._lock:
+            rows = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+            if not rows:
+                return
+            with start_span("local_vector_store.delete", {"collection": self._name, "document_count": len(rows)}):
+                keep = np.ones(self._size, dtype=bool)
+                keep[rows] = False
+                self._compact(keep)
+                self._changed()
+
+    def _sync_index(self):
+        """Assign new and rewritten rows to the index (training it once the store is large enough)"""
+        updated, self._updated_rows = self._updated_rows, []
+        if self.index is not None and self._size:
+            self.index.sync(self.matrix, updated)
+
+    def _compact(self, keep: np.ndarray):
+        if self.index is not None:
+            self.index.compact(keep)
+        kept = np.flatnonzero(keep)
+        self._reserve(self._size, self.dimensions)
+        self._vectors[:len(kept)] = self.matrix[kept]
+        self._ids = [self._ids[i] for i in kept]
+        self._documents = [self._documents[i] for i in kept]
+        self._metadatas = [self._metadatas[i] for i in kept]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._size = len(kept)
+
+    # Filters ---------------------------------------------------------------
+    def _column(self, key: str) -> _Column:
+        """Columns of a metadata key, built once per key until the next write"""
+        column = self._columns.get(key)
+        if column is None:
+            values = np.empty(self._size, dtype=object)
+            values[:] = [(m or {}).get(key, _MISSING) for m in self._metadatas]
+            numeric = np.array([
+                v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                for v in values
+            ], dtype=np.float64)
+            present = np.fromiter((v is not _MISSING for v in values), dtype=bool, count=self._size)
+            categories: Dict[Any, int] = {}
+            try:
+                codes = np.fromiter((categories.setdefault(v, len(categories)) for v in values),
+                                    dtype=np.int64, count=self._size)
+            except TypeError:
+                # Unhashable values (e.g. lists) are compared one by one
+                codes, categories = None, {}
+            column = self._columns[key] = _Column(values, numeric, present, codes, categories)
+        return column
+
+    def _mask(self, where: Optional[Dict[str, Any]],
+              where_document: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
+        if not where and not where_document:
+            return None
+        key = json.dumps([where, where_document], sort_keys=True, default=str)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.ones(self._size, dtype=bool)
+            if where:
+                mask &= self._where_mask(where)
+            if where_document:
+                mask &= self._document_mask(where_document)
+            if len(self._masks) >= self.MASK_CACHE_SIZE:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+    def _where_mask(self, where: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+            elif key == "$or":
+                combined = np.zeros(self._size, dtype=bool)
+                for clause in condition:
+                    combined |= self._where_mask(clause)
+                mask &= combined
+            elif isinstance(condition, dict):
+                for operator, value in condition.items():
+                    mask &= self._compare(key, operator, value)
+            else:
+                mask &= self._compare(key, "$eq", condition)
+        return mask
+
+    def _compare(self, key: str, operator: str, value: Any) -> np.ndarray:
+        column = self._column(key)
+        if operator in ("$eq", "$ne"):
+            equal = self._isin(column, [value])
+            return equal if operator == "$eq" else column.present & ~equal
+        if operator in ("$in", "$nin"):
+            inside = self._isin(column, list(value))
+            return inside if operator == "$in" else column.present & ~inside
+        comparisons = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+        if operator in comparisons:
+            with np.errstate(invalid="ignore"):
+                return comparisons[operator](column.numeric, value)
+        raise ValueError(f"Unsupported filter operator '{operator}'")
+
+    def _isin(self, column: _Column, options: List[Any]) -> np.ndarray:
+        """Which documents have a value equal to one of `options`"""
+        try:
+            if column.codes is not None:
+                wanted = [column.categories[o] for o in options if o in column.categories]
+                return np.isin(column.codes, wanted)
+        except TypeError:
+            pass  # unhashable option: compare one by one
+        return np.fromiter((any(v == o for o in options) for v in column.values),
+                           dtype=bool, count=self._size)
+
+    def _document_mask(self, where_document: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self._size, dtype=bool)
+        for operator, value in where_document.items():
+            if operator == "$and":
+                for clause in value:
+                    mask &= self._document_mask(clause)
+            elif operator == "$or":
+                combined = np.zeros(self._size, dtype=bool)
+                for clause in value:
+                    combined |= self._document_mask(clause)
+                mask &= combined
+            elif operator in ("$contains", "$not_contains"):
+                contains = np.fromiter((value in (d or "") for d in self._documents), dtype=bool, count=self._size)
+                mask &= contains if operator == "$contains" else ~contains
+            else:
+                raise ValueError(f"Unsupported document filter operator '{operator}'")
+        return mask
+
+    # Reads -----------------------------------------------------------------
+    def _search(self, queries: np.ndarray, k: int,
+                mask: Optional[np.ndarray]) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Top-k rows and cosine similarities for normalized queries"""
+        rows = None if mask is None else np.flatnonzero(mask)
+        index = self.index
+        if index is not None:
+            self._sync_index()
+        # Small stores (e.g. after deletes) and selective filters are searched exactly
+        if (index is None or not index.trained or self._size < index.min_train_size
+                or (rows is not None and len(rows) < index.min_train_size)):
+            return self._exact(queries, k, rows)
+
+        found, scores = index.search(queries, self.matrix, k, mask)
+        wanted = min(k, self._size if rows is None else len(rows))
+        for i, query in enumerate(queries):
+            # The probed lists held too few matches (e.g. a selective filter)
+            if len(found[i]) < wanted:
+                exact_rows, exact_scores = self._exact(query[None, :], k, rows)
+                found[i], scores[i] = exact_rows[0], exact_scores[0]
+        return found, scores
+
+    def _exact(self, queries: np.ndarray, k: int,
+               rows: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        if rows is None:
+            return exact_search(queries, self.matrix, k, self.block_size)
+        scores = queries @ self.matrix[rows].T
+        top = top_k(scores, k)
+        return rows[top], np.take_along_axis(scores, top, axis=1)
+
+    def query(self, query_texts: Optional[str | List[str]] = None, n_results: int = 3,
+              where: Optional[Dict[str, Any]] = None,
+              where_document: Optional[Dict[str, Any]] = None,
+              query_embeddings: Optional[List[List[float]]] = None,
+              include: Optional[List[str]] = None) -> QueryResult:
+        include = include or ["documents", "distances", "metadatas"]
+        if query_embeddings is None:
+            texts = [query_texts] if isinstance(query_texts, str) else list(query_texts or [])
+            if not texts:
+                return self._result(np.empty((0, 0), dtype=np.int64), np.empty((0, 0)), include)
+            query_embeddings = self.embed(texts)
+        elif not len(query_embeddings):
+            return self._result(np.empty((0, 0), dtype=np.int64), np.empty((0, 0)), include)
+        queries = normalize_rows(query_embeddings)
+
+        attributes = {"collection": self._name, "n_results": n_results, "filtered": bool(where or where_document)}
+        with self._lock, start_span("local_vector_store.query", attributes):
+            if self._size:
+                mask = self._mask(where, where_document)
+                rows, scores = self._search(queries, n_results, mask)
+            else:
+                rows = np.empty((len(queries), 0), dtype=np.int64)
+                scores = np.empty((len(queries), 0), dtype=np.float32)
+            return self._result(rows, scores, include)
+
+    def _distances(self, similarities: np.ndarray) -> np.ndarray:
+        if self._metadata.get("hnsw:space", "l2") == "l2":
+            return np.maximum(2.0 - 2.0 * similarities, 0.0)
+        return 1.0 - similarities
+
+    def _result(self, rows: np.ndarray, scores: np.ndarray, include: List[str]) -> QueryResult:
+        return {
+            "ids": [[self._ids[i] for i in r] for r in rows],
+            "embeddings": [self.matrix[r] for r in rows] if "embeddings" in include else None,
+            "documents": [[self._documents[i] for i in r] for r in rows] if "documents" in include else None,
+            "uris": None,
+            "included": include,
+            "data": None,
+            "metadatas": [[self._metadatas[i] for i in r] for r in rows] if "metadatas" in include else None,
+            "distances": [self._distances(s).tolist() for s in scores] if "distances" in include else None,
+        }
+
+    def get(self, ids: Optional[List[str]] = None,
+            where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None,
+            include: Optional[List[str]] = None) -> GetResult:
+        include = include or ["documents", "metadatas"]
+        with self._lock:
+            if ids is not None:
+                rows = np.array([self._positions[i] for i in ids if i in self._positions], dtype=np.int64)
+            else:
+                rows = np.arange(self._size)
+            mask = self._mask(where)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if limit is not None:
+                rows = rows[:limit]
+            return {
+                "ids": [self._ids[i] for i in rows],
+                "embeddings": self.matrix[rows] if "embeddings" in include else None,
+                "documents": [self._documents[i] for i in rows] if "documents" in include else None,
+                "uris": None,
+                "included": include,
+                "data": None,
+                "metadatas": [self._metadatas[i] for i in rows] if "metadatas" in include else None,
+            }
+
+
+class NumpyVectorStoreManager(VectorStoreManager):
+    """
+    `VectorStoreManager` for `NumpyVectorStore`s, with the same interface.
+
+    Without `persist_directory` stores live in memory; with it each store
+    is a subdirectory, opened (memory-mapped) on first use and, when
+    `autosave` is on, saved at most once every `save_interval` seconds
+    while it is being written to. Call `flush` to save every open store
+    right away (e.g. before handing the directory to another process).
+    `index_options` gives every store an `IVFIndex` built with those
+    arguments.
+
+    Example:
+        >>> manager = NumpyVectorStoreManager(persist_directory="./local_db",
+        ...                                   embedding_backend="minilm",
+        ...                                   index_options={"n_probe": 8})
+        >>> store = manager.get_or_create_store("udaplay_games")
+    """
+
+    def __init__(self, openai_api_key: Optional[str] = None, persist_directory: Optional[str] = None,
+                 embedding_backend: Union[str, EmbeddingFunction] = "openai",
+                 embedding_options: Optional[Dict[str, Any]] = None, warm: bool = False,
+                 autosave: bool = True, index_options: Optional[Dict[str, Any]] = None,
+                 save_interval: float = 1.0):
+        self.persist_directory = persist_directory
+        self.autosave = autosave
+        self.save_interval = save_interval
+        self.index_options = index_options
+        self.embedding_function = self._create_embedding_function(
+            openai_api_key, embedding_backend, embedding_options or {}, warm
+        )
+        self._stores: Dict[str, NumpyVectorStore] = {}
+        self._lock = threading.Lock()
+        if persist_directory:
+            Path(persist_directory).mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f"NumpyVectorStoreManager(persist_directory='{self.persist_directory}')"
+
+    def _path(self, name: str) -> Optional[Path]:
+        if not name or name.startswith(".") or "/" in name or os.sep in name:
+            raise ValueError(f"Invalid store name '{name}'")
+        return Path(self.persist_directory) / name if self.persist_directory else None
+
+    def _open(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorStore:
+        index = IVFIndex(**self.index_options) if self.index_options is not None else None
+        store = NumpyVectorStore(name, self.embedding_function, metadata, self._path(name), self.autosave,
+                                 index=index, save_interval=self.save_interval)
+        self._stores[name] = store
+        return store
+
+    def _exists(self, name: str) -> bool:
+        if name in self._stores:
+            return True
+        path = self._path(name)
+        return bool(path and (path / NumpyVectorStore.RECORDS_FILE).exists())
+
+    def get_store(self, name: str) -> Optional[NumpyVectorStore]:
+        with self._lock:
+            if not self._exists(name):
+                return None
+            return self._stores.get(name) or self._open(name)
+
+    def create_store(self, store_name: str, force: bool = False,
+                     metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorStore:
+        if force:
+            self.delete_store(store_name)
+        with self._lock:
+            if self._exists(store_name):
+                raise ValueError(f"Store '{store_name}' exists. Pass `force=True` or use `get_or_create_store` method")
+            store = self._open(store_name, metadata)
+            if store.path:
+                store.save()
+            return store
+
+    def get_or_create_store(self, store_name: str,
+                            metadata: Optional[Dict[str, Any]] = None) -> NumpyVectorStore:
+        return self.get_store(store_name) or self.create_store(store_name, metadata=metadata)
+
+    def list_stores(self) -> List[str]:
+        with self._lock:
+            names = set(self._stores)
+            if self.persist_directory:
+                names.update(p.parent.name for p in Path(self.persist_directory).glob(f"*/{NumpyVectorStore.RECORDS_FILE}"))
+            return sorted(names)
+
+    def rename_store(self, store_name: str, new_name: str):
+        store = self.get_store(store_name)
+        if store is None:
+            raise ValueError(f"Store '{store_name}' does not exist")
+        with self._lock:
+            if self._exists(new_name):
+                raise ValueError(f"Store '{new_name}' already exists")
+            new_path = self._path(new_name)
+            if new_path:
+                os.replace(store.path, new_path)
+                store.path = new_path
+            store._name = new_name
+            self._stores[new_name] = self._stores.pop(store_name)
+            if store.path:
+                store.save()
+
+    def flush(self):
+        """Save the pending changes of every open store"""
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            store.flush()
+
+    def delete_store(self, store_name: str):
+        with self._lock:
+            store = self._stores.pop(store_name, None)
+            if store is not None:
+                # A pending save would recreate the directory
+                with store._lock:
+                    store._saved()
+            path = self._path(store_name)
+            if path and path.exists():
+                shutil.rmtree(path)
@@ -1,26 +1,713 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from pathlib import Path
+import atexit
 import copy
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import zlib
+
+import numpy as np
 
 from lib.documents import Document, Corpus
-from lib.vector_db import VectorStoreManager,QueryResult
+from lib.embeddings import embedding_id, normalize_rows
+from lib.messages import MessageLog
+from lib.tracing import start_span
+from lib.vector_db import VectorStore, VectorStoreManager, QueryResult
+
 
+logger = logging.getLogger("lib.memory")
 
 class SessionNotFoundError(Exception):
     """Raised when attempting to access a session that doesn't exist"""
     pass
 
 
+class SessionStore(ABC):
+    """
+    Persistent backend for `ShortTermMemory` sessions.
+
+    By default the memory only spills evicted sessions to the store and
+    removes them again when they are loaded back. With `write_through`
+    enabled the store is the source of truth: every change is mirrored to
+    it, so sessions survive restarts and can be shared by several worker
+    processes.
+    """
+
+    @abstractmethod
+    def save(self, session_id: str, objects: List[Any]):
+        """Store the objects of a session, replacing any previous value"""
+        pass
+
+    @abstractmethod
+    def load(self, session_id: str, limit: Optional[int] = None) -> Optional[List[Any]]:
+        """Load the objects of a session (only the last `limit` if given), or None if it is not stored"""
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        pass
+
+    def contains(self, session_id: str) -> bool:
+        return session_id in self.list_sessions()
+
+    def append(self, session_id: str, objects: List[Any]):
+        """Append objects to a session, creating it if needed"""
+        self.save(session_id, (self.load(session_id) or []) + list(objects))
+
+    def pop(self, session_id: str) -> Optional[Any]:
+        """Remove and return the last object of a session"""
+        objects = self.load(session_id)
+        if not objects:
+            return None
+        self.save(session_id, objects[:-1])
+        return objects[-1]
+
+    def revision(self, session_id: str) -> Optional[int]:
+        """
+        Counter that changes on every write to the session, used to notice
+        writes made by other processes. None if the store does not track it.
+        """
+        return None
+
+    def flush(self):
+        """Write out any buffered changes"""
+        pass
+
+
+class DirectorySessionStore(SessionStore):
+    """Session store writing one pickle file per session into a directory"""
+
+    suffix = ".session"
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return f"DirectorySessionStore('{self.directory}')"
+
+    def _path(self, session_id: str) -> Path:
+        # Session ids are user-controlled; hex-encode them into safe file names
+        return self.directory / f"{session_id.encode().hex()}{self.suffix}"
+
+    def save(self, session_id: str, objects: List[Any]):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(list(objects), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(session_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> Optional[List[Any]]:
+        path = self._path(session_id)
+        if not path.exists():
+            return None
+        with open(path, "rb") as fp:
+            objects = pickle.load(fp)
+        return objects[-limit:] if limit else objects
+
+    def delete(self, session_id: str) -> bool:
+        path = self._path(session_id)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+    def contains(self, session_id: str) -> bool:
+        return self._path(session_id).exists()
+
+    def list_sessions(self) -> List[str]:
+        return [
+            bytes.fromhex(p.name[:-len(self.suffix)]).decode()
+            for p in self.directory.glob(f"*{self.suffix}")
+        ]
+
+
+@dataclass
+class _Chain:
+    """
+    Stored messages of one conversation buffer in one session.
+
+    Positions below `parent_length` are read from the `parent` chain; the
+    chain's own rows start there. The first `stored` positions are
+    committed.
+    """
+    chain_id: str
+    session_id: str
+    parent: Optional[str] = None
+    parent_length: int = 0
+    stored: int = 0
+
+
+@dataclass
+class _Encoded:
+    """Rows to insert for objects serialized against stored conversations"""
+    objects: List[tuple] = field(default_factory=list)
+    chains: Dict[str, tuple] = field(default_factory=dict)
+    messages: Dict[tuple, bytes] = field(default_factory=dict)
+    # (chain, messages the rows commit) to record once written
+    stored: List[tuple] = field(default_factory=list)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by a SQLite database in WAL mode.
+
+    Each object is stored as its own pickled (and optionally zlib
+    compressed) row, indexed by session and insertion order, so appending
+    a run never rewrites the session and loading the last runs of a
+    session is a single index range scan. Sessions are indexed by last
+    update for recency queries.
+
+    Conversations are stored once per session rather than in every run:
+    each `MessageLog` inside an object is pickled as a reference to a
+    stored prefix of its conversation, and only messages not stored yet
+    are written, one row each. Since every run of a session carries the
+    whole conversation so far, this keeps the database linear in the
+    conversation length instead of quadratic. Conversations loaded back
+    are continued under a new chain referencing the loaded one, so
+    processes extending the same session never write the same rows.
+
+    Appends use group commit: while one thread is writing, appends from
+    other threads queue up and are written together in the next
+    transaction, so many concurrent sessions share a few commits. An
+    append still returns only once its rows are committed, so another
+    worker process opening the same file (WAL lets readers proceed while
+    one process writes) always sees it.
+
+    Args:
+        path: Database file
+        compress: Compress stored objects with zlib
+
+    Example:
+        >>> store = SQLiteSessionStore("sessions.db")
+        >>> memory = ShortTermMemory(store=store, write_through=True)
+    """
+
+    def __init__(self, path: str, compress: bool = False):
+        self.path = path
+        self.compress = compress
+        self._local = threading.local()
+        self._pending: List[_Encoded] = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Conversation buffer -> {session_id: _Chain}
+        self._chains: "weakref.WeakKeyDictionary[Any, Dict[str, _Chain]]" = weakref.WeakKeyDictionary()
+        self._chains_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, "
+                "revision INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_objects ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_id TEXT NOT NULL, "
+                "payload BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_chains ("
+                "chain_id TEXT PRIMARY KEY, "
+                "session_id TEXT NOT NULL, "
+                "parent TEXT, "
+                "parent_length INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                "chain_id TEXT NOT NULL, "
+                "position INTEGER NOT NULL, "
+                "payload BLOB NOT NULL, "
+                "PRIMARY KEY (chain_id, position))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS session_objects_by_session "
+                "ON session_objects (session_id, id)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS session_chains_by_session "
+                "ON session_chains (session_id)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_by_recency ON sessions (updated_at)"
+            )
+
+    def __repr__(self):
+        return f"SQLiteSessionStore('{self.path}')"
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _pack(self, payload: bytes) -> bytes:
+        # A one-byte header records whether the payload is compressed
+        if self.compress:
+            return b"z" + zlib.compress(payload)
+        return b"p" + payload
+
+    @staticmethod
+    def _unpack(payload: bytes) -> bytes:
+        if payload[:1] == b"z":
+            return zlib.decompress(payload[1:])
+        return payload[1:]
+
+    # Conversations ---------------------------------------------------------
+    def _chain(self, log: MessageLog, session_id: str) -> _Chain:
+        """Chain storing a log's conversation in a session, created on first use"""
+        # Logs sharing a buffer are views of one conversation
+        buffer = log._buffer
+        with self._chains_lock:
+            chains = self._chains.setdefault(buffer, {})
+            chain = chains.get(session_id)
+            if chain is None:
+                chain = chains[session_id] = _Chain(uuid.uuid4().hex, session_id)
+            return chain
+
+    def _encode(self, session_id: str, objects: List[Any]) -> _Encoded:
+        """Serialize objects, collecting the conversation rows they need"""
+        encoded = _Encoded()
+
+        def persistent_id(obj):
+            if not isinstance(obj, MessageLog):
+                return None
+            chain = self._chain(obj, session_id)
+            length = len(obj)
+            encoded.chains[chain.chain_id] = (chain.chain_id, session_id, chain.parent, chain.parent_length)
+            for position in range(chain.stored, length):
+                key = (chain.chain_id, position)
+                if key not in encoded.messages:
+                    encoded.messages[key] = self._pack(
+                        pickle.dumps(obj[position], protocol=pickle.HIGHEST_PROTOCOL)
+                    )
+            encoded.stored.append((chain, length))
+            return ("messages", chain.chain_id, length)
+
+        for obj in objects:
+            buffer = io.BytesIO()
+            pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = persistent_id
+            pickler.dump(obj)
+            encoded.objects.append((session_id, self._pack(buffer.getvalue())))
+        return encoded
+
+    def _insert(self, conn: sqlite3.Connection, batch: List[_Encoded]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO session_chains (chain_id, session_id, parent, parent_length) "
+            "VALUES (?, ?, ?, ?)",
+            [row for encoded in batch for row in encoded.chains.values()],
+        )
+        # Concurrent appends may carry the same messages; keep the first copy
+        conn.executemany(
+            "INSERT OR IGNORE INTO session_messages (chain_id, position, payload) VALUES (?, ?, ?)",
+            [(chain_id, position, payload)
+             for encoded in batch for (chain_id, position), payload in encoded.messages.items()],
+        )
+        conn.executemany(
+            "INSERT INTO session_objects (session_id, payload) VALUES (?, ?)",
+            [row for encoded in batch for row in encoded.objects],
+        )
+
+    def _committed(self, batch: List[_Encoded]):
+        with self._chains_lock:
+            for encoded in batch:
+                for chain, length in encoded.stored:
+                    chain.stored = max(chain.stored, length)
+
+    def _load_conversations(self, conn: sqlite3.Connection, session_id: str) -> Dict[str, MessageLog]:
+        """Rebuild every stored conversation of a session, keyed by chain"""
+        chains = {
+            chain_id: (parent, parent_length)
+            for chain_id, parent, parent_length in conn.execute(
+                "SELECT chain_id, parent, parent_length FROM session_chains WHERE session_id = ?",
+                (session_id,),
+            )
+        }
+        own: Dict[str, List[Any]] = {chain_id: [] for chain_id in chains}
+        for chain_id, payload in conn.execute(
+            "SELECT m.chain_id, m.payload FROM session_messages m "
+            "JOIN session_chains c ON c.chain_id = m.chain_id "
+            "WHERE c.session_id = ? ORDER BY m.chain_id, m.position",
+            (session_id,),
+        ):
+            own[chain_id].append(pickle.loads(self._unpack(payload)))
+
+        items: Dict[str, List[Any]] = {}
+
+        def resolve(chain_id: str) -> List[Any]:
+            if chain_id not in items:
+                parent, parent_length = chains[chain_id]
+                prefix = resolve(parent)[:parent_length] if parent else []
+                items[chain_id] = prefix + own[chain_id]
+            return items[chain_id]
+
+        logs = {}
+        for chain_id in chains:
+            log = logs[chain_id] = MessageLog(resolve(chain_id))
+            length = len(log)
+            with self._chains_lock:
+                # New messages go to a child chain, never to rows another
+                # process may be extending as well
+                self._chains.setdefault(log._buffer, {})[session_id] = _Chain(
+                    uuid.uuid4().hex, session_id, parent=chain_id,
+                    parent_length=length, stored=length,
+                )
+        return logs
+
+    def _conversations(self, conn: sqlite3.Connection,
+                       session_id: str) -> Callable[[], Dict[str, MessageLog]]:
+        """Loader of a session's conversations, read once and only if some object refers to them"""
+        loaded: Dict[str, MessageLog] = {}
+
+        def conversations() -> Dict[str, MessageLog]:
+            if not loaded:
+                loaded.update(self._load_conversations(conn, session_id))
+            return loaded
+
+        return conversations
+
+    def _decode(self, payload: bytes, conversations: Callable[[], Dict[str, MessageLog]]) -> Any:
+        unpickler = pickle.Unpickler(io.BytesIO(self._unpack(payload)))
+
+        def persistent_load(pid):
+            _, chain_id, length = pid
+            return conversations()[chain_id].prefix(length)
+
+        unpickler.persistent_load = persistent_load
+        return unpickler.load()
+
+    def _forget(self, conn: sqlite3.Connection, session_id: str):
+        """Drop a session's stored conversations (caller holds the write lock)"""
+        conn.execute(
+            "DELETE FROM session_messages WHERE chain_id IN "
+            "(SELECT chain_id FROM session_chains WHERE session_id = ?)",
+            (session_id,),
+        )
+        conn.execute("DELETE FROM session_chains WHERE session_id = ?", (session_id,))
+        with self._chains_lock:
+            for chains in self._chains.values():
+                chains.pop(session_id, None)
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, session_id: str, count: int = 1):
+        conn.execute(
+            "INSERT INTO sessions (session_id, revision, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET "
+            "revision = revision + excluded.revision, updated_at = excluded.updated_at",
+            (session_id, count, time.time()),
+        )
+
+    def flush(self):
+        """Write all queued appends in a single transaction"""
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                with self._connection() as conn:
+                    self._insert(conn, pending)
+                    counts: Dict[str, int] = {}
+                    for encoded in pending:
+                        for session_id, _ in encoded.objects:
+                            counts[session_id] = counts.get(session_id, 0) + 1
+                    for session_id, count in counts.items():
+                        self._bump(conn, session_id, count)
+            except BaseException:
+                # Put the rows back so the next writer retries them
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                raise
+            self._committed(pending)
+
+    def append(self, session_id: str, objects: List[Any]):
+        encoded = self._encode(session_id, objects)
+        with self._pending_lock:
+            self._pending.append(encoded)
+        # Either this call writes the queue, or a concurrent one already did
+        self.flush()
+
+    def save(self, session_id: str, objects: List[Any]):
+        with self._write_lock, self._connection() as conn:
+            conn.execute("DELETE FROM session_objects WHERE session_id = ?", (session_id,))
+            self._forget(conn, session_id)
+            encoded = self._encode(session_id, objects)
+            self._insert(conn, [encoded])
+            self._bump(conn, session_id)
+        self._committed([encoded])
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> Optional[List[Any]]:
+        conn = self._connection()
+        if conn.execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone() is None:
+            return None
+        rows = conn.execute(
+            "SELECT payload FROM session_objects WHERE session_id = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, limit if limit else -1),
+        ).fetchall()
+        conversations = self._conversations(conn, session_id)
+        return [self._decode(row[0], conversations) for row in reversed(rows)]
+
+    def pop(self, session_id: str) -> Optional[Any]:
+        with self._write_lock, self._connection() as conn:
+            # Take the write lock before reading, so no other process can
+            # pop or append between the lookup and the delete
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload FROM session_objects WHERE session_id = ? "
+                "ORDER BY id DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM session_objects WHERE id = ?", (row[0],))
+            self._bump(conn, session_id)
+            conversations = self._conversations(conn, session_id)
+        return self._decode(row[1], conversations)
+
+    def delete(self, session_id: str) -> bool:
+        with self._write_lock, self._connection() as conn:
+            conn.execute("DELETE FROM session_objects WHERE session_id = ?", (session_id,))
+            self._forget(conn, session_id)
+            cursor = conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def contains(self, session_id: str) -> bool:
+        return self.revision(session_id) is not None
+
+    def revision(self, session_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT revision FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def list_sessions(self, limit: Optional[int] = None) -> List[str]:
+        """List stored sessions, most recently updated first"""
+        rows = self._connection().execute(
+            "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT ?",
+            (limit if limit else -1,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def _estimate_size(obj: Any, counted: Optional["weakref.WeakKeyDictionary"] = None) -> int:
+    """
+    Approximate retained size of an object, in bytes, from its pickled form
+
+    With `counted` (conversation buffer -> messages already accounted for),
+    a `MessageLog` only adds the messages not counted before: logs sharing
+    a buffer hold a single copy of them, and a run then costs its new
+    messages instead of the whole conversation.
+    """
+    if counted is None:
+        try:
+            return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(obj)
+
+    messages_size = 0
+
+    def persistent_id(item):
+        nonlocal messages_size
+        if not isinstance(item, MessageLog):
+            return None
+        buffer = item._buffer
+        start = counted.get(buffer, 0)
+        for position in range(start, len(item)):
+            messages_size += len(pickle.dumps(item[position], protocol=pickle.HIGHEST_PROTOCOL))
+        if len(item) > start:
+            counted[buffer] = len(item)
+        return len(item)
+
+    try:
+        stream = io.BytesIO()
+        pickler = pickle.Pickler(stream, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        return stream.tell() + messages_size
+    except Exception:
+        return sys.getsizeof(obj)
+
+
+class SessionLock:
+    """
+    Re-entrant lock of one `ShortTermMemory` session.
+
+    The underlying lock lives in the memory's registry only while some
+    thread holds it or waits for it, so every thread working on a session
+    shares the same lock, and the registry does not grow with the number
+    of sessions ever seen. A session with a registered lock is in use and
+    is never evicted.
+    """
+
+    def __init__(self, registry: Dict[str, list], guard: threading.RLock, session_id: str):
+        self._registry = registry
+        self._guard = guard
+        self.session_id = session_id
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        with self._guard:
+            entry = self._registry.get(self.session_id)
+            if entry is None:
+                # [lock, threads holding or waiting for it]
+                entry = self._registry[self.session_id] = [threading.RLock(), 0]
+            entry[1] += 1
+        if entry[0].acquire(blocking, timeout):
+            return True
+        self._unregister(entry)
+        return False
+
+    def release(self):
+        entry = self._registry[self.session_id]
+        entry[0].release()
+        self._unregister(entry)
+
+    def _unregister(self, entry: list):
+        with self._guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._registry[self.session_id]
+
+    def __enter__(self) -> "SessionLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
 @dataclass
 class ShortTermMemory():
-    """Manage the history of objects across multiple sessions"""
-    sessions: Dict[str, List[Any]] = field(default_factory=lambda: {})
+    """Manage the history of objects across multiple sessions
+
+    Safe to share across threads: creating and deleting sessions is
+    serialized, reads never take a lock, and `session_lock` lets callers
+    make a read-modify-write on one session atomic without blocking others.
+
+    Memory can be bounded for long-lived processes. Sessions are tracked in
+    least-recently-used order and evicted when any limit is exceeded; with
+    a `store`, evicted sessions are spilled to it and transparently loaded
+    back on their next access instead of being lost. The "default" session
+    and sessions whose `session_lock` is held or awaited are never evicted.
+
+    With `write_through`, every change is also written to the store and
+    sessions stay there after being loaded, so they survive restarts and
+    any worker process sharing the store can pick up any session. Before
+    reading a cached session its store revision is checked, and the
+    session is reloaded if another process changed it.
+
+    Attributes:
+        max_sessions: Maximum number of sessions kept in memory
+        max_runs_per_session: Maximum objects kept per session (oldest are dropped)
+        idle_ttl: Seconds after which an untouched session is evicted
+        max_bytes: Budget for the estimated size of all stored objects
+        store: Optional backend receiving evicted sessions
+        write_through: Mirror every change to `store` and treat it as the source of truth
+        copy_on_read: Return deep copies from reads instead of the stored objects
+
+    Objects are copied once when added. Reads hand out the stored objects
+    themselves, so looking up the last run costs the same however long the
+    session is; callers must treat them as read-only, or enable
+    `copy_on_read` to get a private copy of just the requested objects.
+    """
+    sessions: Dict[str, List[Any]] = field(default_factory=OrderedDict)
+    max_sessions: Optional[int] = None
+    max_runs_per_session: Optional[int] = None
+    idle_ttl: Optional[float] = None
+    max_bytes: Optional[int] = None
+    store: Optional[SessionStore] = None
+    copy_on_read: bool = False
+    write_through: bool = False
+    _lock: threading.RLock = field(default_factory=threading.RLock, init=False, repr=False, compare=False)
+    _session_locks: Dict[str, list] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _last_access: Dict[str, float] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _sizes: Dict[str, List[int]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _total_bytes: int = field(default=0, init=False, repr=False, compare=False)
+    _revisions: Dict[str, Optional[int]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # Conversation buffer -> messages already included in `_total_bytes`
+    _counted: "weakref.WeakKeyDictionary" = field(default_factory=weakref.WeakKeyDictionary, init=False,
+                                                 repr=False, compare=False)
 
     def __post_init__(self):
         """Initialize the default session"""
+        if self.write_through and self.store is None:
+            raise ValueError("write_through requires a store")
+        if not isinstance(self.sessions, OrderedDict):
+            self.sessions = OrderedDict(self.sessions)
+        for session_id, objects in self.sessions.items():
+            self._last_access[session_id] = time.monotonic()
+            if self.max_bytes is not None:
+                self._sizes[session_id] = [_estimate_size(o, self._counted) for o in objects]
+                self._total_bytes += sum(self._sizes[session_id])
         self.create_session("default")
 
+    def __deepcopy__(self, memo):
+        # Locks cannot be copied; the copy gets fresh ones
+        return ShortTermMemory(
+            sessions=copy.deepcopy(self.sessions, memo),
+            max_sessions=self.max_sessions,
+            max_runs_per_session=self.max_runs_per_session,
+            idle_ttl=self.idle_ttl,
+            max_bytes=self.max_bytes,
+            store=self.store,
+            copy_on_read=self.copy_on_read,
+            write_through=self.write_through,
+        )
+
+    @property
+    def bounded(self) -> bool:
+        return any(limit is not None for limit in (
+            self.max_sessions, self.max_runs_per_session, self.idle_ttl, self.max_bytes
+        ))
+
+    @property
+    def total_bytes(self) -> int:
+        """Estimated size of all objects in memory (tracked only with `max_bytes`)"""
+        return self._total_bytes
+
+    def session_lock(self, session_id: Optional[str] = None) -> SessionLock:
+        """Get the lock guarding a session
+        
+        Hold it around sequences like `get_last_object` -> work -> `add` so
+        that concurrent callers on the same session do not lose updates.
+        While held, the session is not evicted.
+        
+        Args:
+            session_id: Optional session ID (uses default if None)
+            
+        Returns:
+            SessionLock: Re-entrant lock dedicated to the session
+        """
+        return SessionLock(self._session_locks, self._lock, session_id or "default")
+
     def __str__(self) -> str:
         session_ids = list(self.sessions.keys())
         return f"Memory(sessions={session_ids})"
@@ -31,6 +718,9 @@ class ShortTermMemory():
     def create_session(self, session_id: str) -> bool:
         """Create a new session
         
+        A session previously spilled to the store counts as existing and is
+        loaded back into memory.
+        
         Args:
             session_id: Unique identifier for the session
             
@@ -38,8 +728,19 @@ class ShortTermMemory():
             bool: True if session was created, False if it already existed
         """
         if session_id in self.sessions:
+            self._touch(session_id)
             return False
-        self.sessions[session_id] = []
+        with self._lock:
+            if session_id in self.sessions or self._restore(session_id):
+                self._touch(session_id)
+                return False
+            self.sessions[session_id] = []
+            self._sizes[session_id] = []
+            if self.write_through:
+                self.store.save(session_id, [])
+                self._revisions[session_id] = self.store.revision(session_id)
+            self._touch(session_id)
+            self._enforce_limits(session_id)
         return True
 
     def delete_session(self, session_id: str) -> bool:
@@ -56,11 +757,98 @@ class ShortTermMemory():
         """
         if session_id == "default":
             raise ValueError("Cannot delete the default session")
-        if session_id not in self.sessions:
-            return False
+        with self._lock:
+            spilled = self.store.delete(session_id) if self.store else False
+            if session_id not in self.sessions:
+                return spilled
+            self._drop(session_id)
+        return True
+
+    def _drop(self, session_id: str):
+        """Remove a session from memory (caller holds the lock)"""
         del self.sessions[session_id]
+        self._last_access.pop(session_id, None)
+        self._revisions.pop(session_id, None)
+        self._total_bytes -= sum(self._sizes.pop(session_id, []))
+
+    def _restore(self, session_id: str) -> bool:
+        """Load a stored session into memory (caller holds the lock)"""
+        if self.store is None:
+            return False
+        # Read the revision first: a write slipping in before the load only
+        # makes the cached copy look stale, never fresh
+        revision = self.store.revision(session_id) if self.write_through else None
+        objects = self.store.load(session_id, limit=self.max_runs_per_session)
+        if objects is None:
+            return False
+        if session_id in self.sessions:
+            self._drop(session_id)
+        self.sessions[session_id] = objects
+        self._sizes[session_id] = [_estimate_size(o, self._counted) for o in objects] if self.max_bytes is not None else []
+        self._total_bytes += sum(self._sizes[session_id])
+        if self.write_through:
+            self._revisions[session_id] = revision
+        else:
+            self.store.delete(session_id)
+        self._touch(session_id)
+        self._enforce_limits(session_id)
         return True
 
+    def _touch(self, session_id: str):
+        if not self.bounded:
+            return
+        # No lock: each step is a single atomic operation, and a session
+        # dropped concurrently is simply not touched
+        try:
+            self.sessions.move_to_end(session_id)
+        except KeyError:
+            return
+        self._last_access[session_id] = time.monotonic()
+
+    def _evict(self, session_id: str) -> bool:
+        """Spill or delete a session unless it is in use (caller holds the lock)"""
+        if session_id in self._session_locks:
+            # Held or awaited by some thread, possibly this one
+            return False
+        if self.store is not None and not self.write_through:
+            self.store.save(session_id, self.sessions[session_id])
+        self._drop(session_id)
+        return True
+
+    def _enforce_limits(self, current: Optional[str] = None):
+        """Apply all configured limits, keeping `current` in memory"""
+        if not self.bounded:
+            return
+        with self._lock:
+            if current in self.sessions and self.max_runs_per_session is not None:
+                objects = self.sessions[current]
+                excess = len(objects) - self.max_runs_per_session
+                if excess > 0:
+                    del objects[:excess]
+                    # Sizes are appended together with their objects, so the
+                    # oldest entries belong to the trimmed runs
+                    sizes = self._sizes.setdefault(current, [])
+                    self._total_bytes -= sum(sizes[:excess])
+                    del sizes[:excess]
+
+            def over_limit() -> bool:
+                if self.max_sessions is not None and len(self.sessions) > self.max_sessions:
+                    return True
+                return self.max_bytes is not None and self._total_bytes > self.max_bytes
+
+            now = time.monotonic()
+            # Least recently used sessions come first
+            for session_id in list(self.sessions.keys()):
+                if session_id in ("default", current):
+                    continue
+                expired = (
+                    self.idle_ttl is not None
+                    and now - self._last_access.get(session_id, now) > self.idle_ttl
+                )
+                if not expired and not over_limit():
+                    break
+                self._evict(session_id)
+
     def _validate_session(self, session_id: str):
         """Validate that a session exists
         
@@ -70,8 +858,35 @@ class ShortTermMemory():
         Raises:
             SessionNotFoundError: If session doesn't exist
         """
-        if session_id not in self.sessions:
-            raise SessionNotFoundError(f"Session '{session_id}' not found")
+        if session_id in self.sessions:
+            if self.write_through and self.store.revision(session_id) != self._revisions.get(session_id):
+                # Changed (or deleted) by another process since it was loaded
+                with self._lock:
+                    if not self._restore(session_id):
+                        self._drop(session_id)
+                        raise SessionNotFoundError(f"Session '{session_id}' not found")
+            self._touch(session_id)
+            return
+        with self._lock:
+            if session_id in self.sessions or self._restore(session_id):
+                return
+        raise SessionNotFoundError(f"Session '{session_id}' not found")
+
+    def _objects(self, session_id: str) -> List[Any]:
+        """Get the list holding a session's objects, loading it if needed
+        
+        Raises:
+            SessionNotFoundError: If session doesn't exist
+        """
+        self._validate_session(session_id)
+        objects = self.sessions.get(session_id)
+        if objects is None:
+            # Evicted right after validation: load it back under the lock,
+            # which keeps it from being evicted again before we return
+            with self._lock:
+                self._validate_session(session_id)
+                objects = self.sessions[session_id]
+        return objects
 
     def add(self, object: Any, session_id: Optional[str] = None):
         """Add a new object to the history
@@ -84,24 +899,46 @@ class ShortTermMemory():
             SessionNotFoundError: If specified session doesn't exist
         """
         session_id = session_id or "default"
-        self._validate_session(session_id)
-        self.sessions[session_id].append(copy.deepcopy(object))
+        stored = copy.deepcopy(object)
+        if self.max_bytes is None:
+            self._objects(session_id).append(stored)
+        else:
+            size = _estimate_size(stored, self._counted)
+            with self._lock:
+                # Keep objects and their sizes aligned for trimming
+                self._objects(session_id).append(stored)
+                self._sizes.setdefault(session_id, []).append(size)
+                self._total_bytes += size
+        if self.write_through:
+            self._mirror(session_id, self.store.append, [stored])
+        self._enforce_limits(session_id)
+
+    def _mirror(self, session_id: str, write, *args) -> Any:
+        """Apply a write to the store and account for it in the cached revision"""
+        result = write(session_id, *args)
+        revision = self._revisions.get(session_id)
+        if revision is not None:
+            self._revisions[session_id] = revision + 1
+        return result
 
-    def get_all_objects(self, session_id: Optional[str] = None) -> List[Any]:
+    def get_all_objects(self, session_id: Optional[str] = None) -> Sequence[Any]:
         """Get all objects for a session
         
         Args:
             session_id: Optional session ID (uses default if None)
             
         Returns:
-            List of objects in the session
+            Immutable sequence of the objects in the session (deep copies
+            if `copy_on_read` is enabled)
             
         Raises:
             SessionNotFoundError: If specified session doesn't exist
         """
         session_id = session_id or "default"
-        self._validate_session(session_id)
-        return [copy.deepcopy(obj) for obj in self.sessions[session_id]]
+        objects = tuple(self._objects(session_id))
+        if self.copy_on_read:
+            return tuple(copy.deepcopy(obj) for obj in objects)
+        return objects
 
     def get_last_object(self, session_id: Optional[str] = None) -> Optional[Any]:
         """Get the most recent object for a session
@@ -115,12 +952,19 @@ class ShortTermMemory():
         Raises:
             SessionNotFoundError: If specified session doesn't exist
         """
-        objects = self.get_all_objects(session_id)
-        return objects[-1] if objects else None
+        session_id = session_id or "default"
+        objects = self._objects(session_id)
+        if not objects:
+            return None
+        last = objects[-1]
+        return copy.deepcopy(last) if self.copy_on_read else last
 
     def get_all_sessions(self) -> List[str]:
-        """Get all session IDs"""
-        return list(self.sessions.keys())
+        """Get all session IDs, including sessions spilled to the store"""
+        session_ids = list(self.sessions.keys())
+        if self.store is not None:
+            session_ids += [sid for sid in self.store.list_sessions() if sid not in self.sessions]
+        return session_ids
 
     def reset(self, session_id: Optional[str] = None):
         """Reset memory for a specific session or all sessions
@@ -131,13 +975,28 @@ class ShortTermMemory():
         Raises:
             SessionNotFoundError: If specified session doesn't exist
         """
-        if session_id is None:
-            # Reset all sessions to empty lists
-            for sid in self.sessions:
-                self.sessions[sid] = []
-        else:
-            self._validate_session(session_id)
-            self.sessions[session_id] = []
+        with self._lock:
+            if session_id is None:
+                # Reset all sessions to empty lists
+                for sid in list(self.sessions):
+                    self.sessions[sid] = []
+                    self._sizes[sid] = []
+                self._total_bytes = 0
+                if self.store is not None:
+                    # Also empty sessions spilled to the store, or they
+                    # would come back with their runs on the next access
+                    for sid in self.store.list_sessions():
+                        if self.write_through:
+                            self._mirror(sid, self.store.save, [])
+                        else:
+                            self.store.save(sid, [])
+            else:
+                self._validate_session(session_id)
+                self.sessions[session_id] = []
+                self._total_bytes -= sum(self._sizes.get(session_id, []))
+                self._sizes[session_id] = []
+                if self.write_through:
+                    self._mirror(session_id, self.store.save, [])
 
     def pop(self, session_id: Optional[str] = None) -> Optional[Any]:
         """Remove and return the last object from a session
@@ -152,11 +1011,17 @@ class ShortTermMemory():
             SessionNotFoundError: If specified session doesn't exist
         """
         session_id = session_id or "default"
-        self._validate_session(session_id)
-        
-        if not self.sessions[session_id]:
-            return None
-        return self.sessions[session_id].pop()
+        with self._lock:
+            objects = self._objects(session_id)
+            if not objects:
+                return None
+            sizes = self._sizes.get(session_id)
+            if sizes:
+                self._total_bytes -= sizes.pop()
+            last = objects.pop()
+        if self.write_through:
+            self._mirror(session_id, self.store.pop)
+        return last
 
 @dataclass
 class MemoryFragment:
@@ -171,11 +1036,13 @@ class MemoryFragment:
         owner (str): Identifier for the user who owns this memory fragment
         namespace (str): Logical grouping for organizing related memories (default: "default")
         timestamp (int): Unix timestamp when the memory was created (auto-generated)
+        importance (float): How much the memory matters, from 0 to 1 (default: 0.5)
     """
     content: str
     owner: str 
     namespace: str = "default"
     timestamp: int = field(default_factory=lambda: int(datetime.now().timestamp()))
+    importance: float = 0.5
 
 
 @dataclass
@@ -208,6 +1075,90 @@ class TimestampFilter:
     greater_than_value: int = None
     lower_than_value: int = None
 
+
+@dataclass
+class RetrievalScoring:
+    """
+    Weights for re-ranking memory search candidates.
+    
+    Search over-fetches `overfetch` times the requested number of
+    candidates by vector similarity, then orders them by
+    
+        similarity * cosine + recency * 0.5 ** (age / half_life) + importance * importance
+    
+    Attributes:
+        similarity (float): Weight of the cosine similarity to the query
+        recency (float): Weight of the exponential recency decay
+        importance (float): Weight of the memory's importance score
+        half_life (float): Age in seconds at which the recency term halves (default: 7 days)
+        overfetch (int): Candidates fetched per requested result
+    """
+    similarity: float = 1.0
+    recency: float = 0.2
+    importance: float = 0.2
+    half_life: float = 7 * 24 * 3600
+    overfetch: int = 4
+
+    def score(self, similarities:np.ndarray, timestamps:np.ndarray,
+              importances:np.ndarray, now:Optional[float]=None) -> np.ndarray:
+        """Score candidates (vectorized over all of them)"""
+        now = datetime.now().timestamp() if now is None else now
+        age = np.maximum(now - timestamps, 0.0)
+        decay = np.exp2(-age / self.half_life)
+        return (
+            self.similarity * similarities
+            + self.recency * decay
+            + self.importance * np.clip(importances, 0.0, 1.0)
+        )
+
+
+@dataclass
+class MemoryCatalogEntry:
+    """
+    Summary of the memories an owner keeps in a namespace.
+    
+    Attributes:
+        owner (str): Identifier of the user owning the memories
+        namespace (str): Namespace the memories belong to
+        count (int): Number of stored memories
+        updated_at (int): Unix timestamp of the last write
+    """
+    owner: str
+    namespace: str
+    count: int = 0
+    updated_at: int = 0
+
+class MemorySchemaError(Exception):
+    """Raised when an existing long-term memory collection cannot be attached"""
+    pass
+
+
+def _content_hash(memory_fragment: "MemoryFragment") -> str:
+    """Hash identifying a memory's owner, namespace and whitespace/case-normalized content"""
+    normalized = " ".join(memory_fragment.content.lower().split())
+    key = f"{memory_fragment.owner}\x00{memory_fragment.namespace}\x00{normalized}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _embedding_id(embedding_function: Any) -> str:
+    """Identify an embedding function (provider and model) for compatibility checks"""
+    return embedding_id(embedding_function)
+
+
+# Long-term memories that may still hold buffered registrations
+_open_memories: "weakref.WeakSet[LongTermMemory]" = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_memories():
+    """Flush long-term memories that were not closed before the interpreter exits"""
+    for memory in list(_open_memories):
+        try:
+            memory.close()
+        except Exception:
+            logger.exception("Failed to flush %r at exit", memory)
+
+
 class LongTermMemory:
     """
     Manages persistent memory storage and retrieval using vector embeddings.
@@ -221,31 +1172,395 @@ class LongTermMemory:
     - Namespace-based organization
     - Time-based filtering
     - Semantic similarity search
+
+    Memories are partitioned by owner and namespace: each pair gets its
+    own collection, named after a hash of the pair, so a search only
+    touches that user's memories and its latency does not grow with the
+    number of tenants. Partitions are created on first write and routed
+    to through an in-process cache.
+
+    Each partition's collection metadata also holds its catalog entry
+    (owner, namespace, memory count, last update), refreshed on every
+    write and cached in process, so listing namespaces never scans
+    memories.
+
+    Initialization attaches to existing partitions, so memories (and their
+    embeddings) kept by a persistent `VectorStoreManager` survive restarts
+    without being re-embedded. Each partition records the schema version
+    and embedding model it was written with: an incompatible partition
+    raises `MemorySchemaError` unless `reset=True` is passed. A collection
+    from an older schema version (including the former single shared
+    collection) is migrated by copying its stored embeddings into the
+    partitions.
+
+    Registrations are buffered and written in batches: one embedding
+    request and one insert per partition for every `batch_size` memories,
+    or every `flush_interval` seconds, whichever comes first. Searches
+    flush first, so a memory is always visible to the next search. While
+    flushing, exact duplicates (same owner, namespace and normalized
+    content) and near-duplicates (cosine similarity of at least
+    `dedup_threshold` with one of the owner's memories in that namespace)
+    are skipped.
+
+    Call `close()` when done with the memory so buffered registrations
+    are written; the flush timer is a daemon thread and does not keep the
+    process alive. Memories still open when the interpreter exits are
+    flushed by an `atexit` hook as a last resort, which does not cover a
+    process that is killed.
+
+    Args:
+        db: Manager providing the vector stores
+        collection_name: Prefix of the partition collections
+        reset: Discard any existing memories and start empty
+        batch_size: Buffered registrations that trigger a write
+        flush_interval: Seconds after which buffered registrations are written
+            anyway (None waits for `batch_size`, a search or `flush`)
+        dedup_threshold: Cosine similarity above which a memory counts as a
+            duplicate (None disables near-duplicate detection)
+        scoring: Re-ranking weights for search (None for the default
+            `RetrievalScoring()`, False to rank by similarity only)
     """
-    def __init__(self, db:VectorStoreManager):
-        self.vector_store = db.create_store("long_term_memory", force=True)
+    SCHEMA_VERSION = 3
+
+    def __init__(self, db:VectorStoreManager, collection_name:str="long_term_memory",
+                 reset:bool=False, batch_size:int=32, flush_interval:Optional[float]=1.0,
+                 dedup_threshold:Optional[float]=0.95,
+                 scoring:Union[RetrievalScoring, bool, None]=None):
+        self.db = db
+        # Resolved to None when re-ranking is disabled
+        self.scoring: Optional[RetrievalScoring] = RetrievalScoring() if scoring is None else (scoring or None)
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup_threshold = dedup_threshold
+        self._pending: List[Document] = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._partitions: Dict[tuple, VectorStore] = {}
+        self._partitions_lock = threading.Lock()
+        self._catalog: Dict[tuple, MemoryCatalogEntry] = {}
+        self._attach(reset)
+
+    @property
+    def _schema_metadata(self) -> Dict[str, Any]:
+        return {
+            "schema_version": self.SCHEMA_VERSION,
+            "embedding_function": _embedding_id(self.db.embedding_function),
+        }
+
+    def partition_name(self, owner:str, namespace:str) -> str:
+        """Name of the collection holding an owner's memories in a namespace"""
+        digest = hashlib.sha1(f"{owner}\x00{namespace}".encode()).hexdigest()[:16]
+        return f"{self.collection_name}-{digest}"
+
+    # Suffixes of the collections a migration copies into before they
+    # replace the partitions: "-migrating" while rows are being copied,
+    # "-migrated" once the copy is complete
+    STAGING_SUFFIX = "-migrating"
+    STAGED_SUFFIX = "-migrated"
+
+    def _partition_names(self, suffix:str="") -> List[str]:
+        prefix = f"{self.collection_name}-"
+        return [
+            name for name in self.db.list_stores()
+            if name.startswith(prefix) and name.endswith(suffix)
+            and len(name) == len(prefix) + 16 + len(suffix)
+        ]
+
+    def _check(self, store:VectorStore):
+        """Raise if a partition cannot be used as-is"""
+        metadata = store.metadata
+        version = metadata.get("schema_version", 0)
+        embedding = metadata.get("embedding_function")
+        expected = self._schema_metadata["embedding_function"]
+
+        if embedding is not None and embedding != expected:
+            raise MemorySchemaError(
+                f"Collection '{store.name}' was embedded with {embedding}, "
+                f"not {expected}; pass reset=True to discard it"
+            )
+        if version > self.SCHEMA_VERSION:
+            raise MemorySchemaError(
+                f"Collection '{store.name}' has schema version {version}, "
+                f"newer than the supported {self.SCHEMA_VERSION}"
+            )
+
+    def _attach(self, reset:bool):
+        """Attach to existing partitions, migrating older layouts as needed"""
+        if reset:
+            for suffix in ("", self.STAGING_SUFFIX, self.STAGED_SUFFIX):
+                for name in self._partition_names(suffix):
+                    self.db.delete_store(name)
+            self.db.delete_store(self.collection_name)
+            return
+
+        self._recover()
+
+        # Before v3 all memories lived in one collection named `collection_name`
+        legacy = self.db.get_store(self.collection_name)
+        if legacy is not None:
+            self._check(legacy)
+            self._migrate(legacy)
 
-    def get_namespaces(self) -> List[str]:
+        for name in self._partition_names():
+            store = self.db.get_store(name)
+            self._check(store)
+            if store.metadata.get("schema_version", 0) < self.SCHEMA_VERSION:
+                self._migrate(store)
+
+        self._load_catalog()
+
+    def _load_catalog(self):
+        """Read the catalog from partition metadata (one lookup per partition)"""
+        catalog = {}
+        for name in self._partition_names():
+            store = self.db.get_store(name)
+            if store is None:
+                continue
+            metadata = store.metadata
+            if "count" not in metadata:
+                entry = self._update_catalog(store, metadata["owner"], metadata["namespace"])
+            else:
+                entry = MemoryCatalogEntry(
+                    owner=metadata["owner"],
+                    namespace=metadata["namespace"],
+                    count=metadata["count"],
+                    updated_at=metadata.get("updated_at", 0),
+                )
+            catalog[(entry.owner, entry.namespace)] = entry
+            with self._partitions_lock:
+                self._partitions.setdefault((entry.owner, entry.namespace), store)
+        self._catalog = catalog
+
+    def _update_catalog(self, store:VectorStore, owner:str, namespace:str) -> MemoryCatalogEntry:
+        """Record a partition's current size in its metadata and in the cache"""
+        entry = MemoryCatalogEntry(
+            owner=owner,
+            namespace=namespace,
+            count=store.count(),
+            updated_at=int(datetime.now().timestamp()),
+        )
+        store.update_metadata({
+            **self._partition_metadata(owner, namespace),
+            "count": entry.count,
+            "updated_at": entry.updated_at,
+        })
+        self._catalog[(owner, namespace)] = entry
+        return entry
+
+    def _recover(self):
+        """Finish or roll back a migration that was interrupted by a crash"""
+        staging = self._partition_names(self.STAGING_SUFFIX)
+        staged = self._partition_names(self.STAGED_SUFFIX)
+        if staging:
+            # Interrupted while copying: no partition was replaced yet and the
+            # source is intact, so drop the copies and migrate again
+            for name in staging + staged:
+                self.db.delete_store(name)
+            return
+        # Interrupted while swapping: every copy is complete, finish the swap
+        for staged_name in staged:
+            name = staged_name[:-len(self.STAGED_SUFFIX)]
+            self.db.delete_store(name)
+            self.db.rename_store(staged_name, name)
+
+    def _migrate(self, store:VectorStore):
+        """
+        Upgrade a collection to the current schema by copying its rows,
+        embeddings included, into their partitions (nothing is re-embedded)
+        """
+        records = store.get(include=["documents", "metadatas", "embeddings"])
+        documents = []
+        for doc_id, content, meta in zip(records["ids"], records["documents"], records["metadatas"]):
+            meta = dict(meta or {})
+            meta.setdefault("owner", "")
+            meta.setdefault("namespace", "default")
+            # v2: content hash used to skip duplicate registrations
+            meta.setdefault("content_hash", _content_hash(MemoryFragment(
+                content=content,
+                owner=meta["owner"],
+                namespace=meta["namespace"],
+            )))
+            documents.append(Document(id=doc_id, content=content, metadata=meta))
+
+        # Copy into staging collections, marking each one "-migrated" once
+        # complete; partitions are only replaced after every copy is done and
+        # the source is deleted last. `_recover` picks up from either phase,
+        # and a source that survives a crash is migrated again (rows are
+        # upserted, so copying them twice is harmless).
+        groups: Dict[tuple, List[int]] = {}
+        for i, document in enumerate(documents):
+            groups.setdefault((document.metadata["owner"], document.metadata["namespace"]), []).append(i)
+        names = []
+        for (owner, namespace), indices in groups.items():
+            name = self.partition_name(owner, namespace)
+            staging = name + self.STAGING_SUFFIX
+            target = self.db.create_store(staging, force=True,
+                                          metadata=self._partition_metadata(owner, namespace))
+            existing = self.db.get_store(name) if name != store.name else None
+            if existing is not None:
+                rows = existing.get(include=["documents", "metadatas", "embeddings"])
+                if rows["ids"]:
+                    target.add(
+                        [Document(id=i, content=c, metadata=m)
+                         for i, c, m in zip(rows["ids"], rows["documents"], rows["metadatas"])],
+                        embeddings=list(rows["embeddings"]),
+                    )
+            target.upsert([documents[i] for i in indices],
+                          embeddings=[records["embeddings"][i] for i in indices])
+            self.db.delete_store(name + self.STAGED_SUFFIX)
+            self.db.rename_store(staging, name + self.STAGED_SUFFIX)
+            names.append(name)
+
+        for name in names:
+            self.db.delete_store(name)
+            self.db.rename_store(name + self.STAGED_SUFFIX, name)
+        if store.name not in names:
+            self.db.delete_store(store.name)
+        with self._partitions_lock:
+            self._partitions.clear()
+
+    def _partition_metadata(self, owner:str, namespace:str) -> Dict[str, Any]:
+        return {**self._schema_metadata, "owner": owner, "namespace": namespace}
+
+    def _partition(self, owner:str, namespace:str, create:bool=False) -> Optional[VectorStore]:
+        """Route to the partition of an owner and namespace"""
+        key = (owner, namespace)
+        store = self._partitions.get(key)
+        if store is not None:
+            return store
+        with self._partitions_lock:
+            store = self._partitions.get(key)
+            if store is None:
+                name = self.partition_name(owner, namespace)
+                if create:
+                    store = self.db.get_or_create_store(
+                        name, metadata=self._partition_metadata(owner, namespace)
+                    )
+                else:
+                    store = self.db.get_store(name)
+                if store is not None:
+                    self._partitions[key] = store
+        return store
+
+    def get_records(self, owner:str, namespace:str="default",
+                    include_embeddings:bool=False) -> Dict[str, List[Any]]:
+        """
+        Fetch all stored memories of an owner in a namespace.
+        
+        Args:
+            owner (str): User identifier
+            namespace (str): Namespace to read (default: "default")
+            include_embeddings (bool): Also return the stored vectors
+            
+        Returns:
+            Dict[str, List[Any]]: Parallel "ids", "documents", "metadatas"
+                (and "embeddings") lists
+        """
+        self.flush()
+        store = self._partition(owner, namespace)
+        if store is None:
+            return {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        records = store.get(include=include)
+        return {
+            "ids": list(records["ids"]),
+            "documents": list(records["documents"]),
+            "metadatas": list(records["metadatas"]),
+            "embeddings": list(records["embeddings"]) if include_embeddings else [],
+        }
+
+    def replace(self, owner:str, namespace:str, remove_ids:List[str],
+                fragments:List[MemoryFragment]) -> int:
+        """
+        Replace stored memories with new fragments (e.g. merged ones).
+        
+        The new fragments are written before the old ones are removed, so an
+        interruption never loses a memory. If removing the old ones fails,
+        the new ones are deleted again so the partition is left as it was.
+        
+        Args:
+            owner (str): User identifier
+            namespace (str): Namespace of the memories
+            remove_ids (List[str]): IDs of the memories to remove
+            fragments (List[MemoryFragment]): Memories to store instead
+            
+        Returns:
+            int: Number of memories in the partition afterwards
+        """
+        with self._write_lock:
+            store = self._partition(owner, namespace, create=True)
+            if fragments:
+                documents = [
+                    Document(content=f.content, metadata={
+                        "owner": owner,
+                        "namespace": namespace,
+                        "timestamp": f.timestamp,
+                        "content_hash": _content_hash(f),
+                        "importance": float(f.importance),
+                    })
+                    for f in fragments
+                ]
+                embeddings = [list(map(float, v)) for v in self.db.embedding_function([d.content for d in documents])]
+                store.add(documents, embeddings=embeddings)
+            try:
+                store.delete(list(remove_ids))
+            except BaseException:
+                if fragments:
+                    # Roll back the staged rows rather than keep both versions
+                    store.delete([d.id for d in documents])
+                raise
+            return self._update_catalog(store, owner, namespace).count
+
+    def get_namespaces(self, owner:Optional[str]=None) -> List[str]:
         """
         Retrieve all unique namespaces currently stored in memory.
         
         Useful for understanding how memories are organized and for
-        administrative purposes.
+        administrative purposes. Answered from the catalog, without
+        reading any memory.
         
+        Args:
+            owner (Optional[str]): Only list namespaces this user has memories in
+            
         Returns:
             List[str]: List of unique namespace identifiers
         """
-        results = self.vector_store.get()
-        namespaces = [r["metadatas"][0]["namespace"] for r in results]
-        return namespaces
+        return sorted({
+            entry.namespace for entry in self.get_catalog(owner)
+        })
+
+    def get_catalog(self, owner:Optional[str]=None, refresh:bool=False) -> List[MemoryCatalogEntry]:
+        """
+        List the owner/namespace partitions with their memory counts.
+        
+        Args:
+            owner (Optional[str]): Only list this user's entries
+            refresh (bool): Re-read the catalog from the store, to pick up
+                writes made by other processes
+            
+        Returns:
+            List[MemoryCatalogEntry]: Entries sorted by owner and namespace
+        """
+        self.flush()
+        if refresh:
+            self._load_catalog()
+        entries = [
+            entry for entry in self._catalog.values()
+            if owner is None or entry.owner == owner
+        ]
+        return sorted(entries, key=lambda e: (e.owner, e.namespace))
 
     def register(self, memory_fragment:MemoryFragment, metadata:Optional[Dict[str, str]]=None):
         """
         Store a new memory fragment in the long-term memory system.
         
-        The memory is converted to a vector embedding and stored with associated
-        metadata for later retrieval. Additional metadata can be provided to
-        enhance searchability.
+        The memory is buffered and later converted to a vector embedding and
+        stored, in a batch with other registrations, with associated metadata
+        for later retrieval. Additional metadata can be provided to enhance
+        searchability. Duplicates of existing memories are dropped when the
+        batch is written.
         
         Args:
             memory_fragment (MemoryFragment): The memory content to store
@@ -255,26 +1570,137 @@ class LongTermMemory:
             "owner": memory_fragment.owner,
             "namespace": memory_fragment.namespace,
             "timestamp": memory_fragment.timestamp,
+            "content_hash": _content_hash(memory_fragment),
+            "importance": float(memory_fragment.importance),
         }
         if metadata:
             complete_metadata.update(metadata)
 
-        self.vector_store.add(
-            Document(
-                content=memory_fragment.content,
-                metadata=complete_metadata,
-            )
+        document = Document(
+            content=memory_fragment.content,
+            metadata=complete_metadata,
         )
+        with self._pending_lock:
+            if not self._pending:
+                _open_memories.add(self)
+            self._pending.append(document)
+            full = len(self._pending) >= self.batch_size
+            if not full and self.flush_interval is not None and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all buffered registrations
+        
+        Returns:
+            int: Number of memories stored (after dropping duplicates)
+        """
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return 0
+            try:
+                return self._write(pending)
+            except BaseException:
+                # Keep the batch for the next flush rather than losing it
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                raise
+
+    def close(self):
+        """Flush buffered registrations and the stores' pending saves, and stop the flush timer"""
+        self.flush()
+        self.db.flush()
+        _open_memories.discard(self)
+
+    def _write(self, documents:List[Document]) -> int:
+        groups: Dict[tuple, Dict[str, Document]] = {}
+        for document in documents:
+            key = (document.metadata["owner"], document.metadata["namespace"])
+            groups.setdefault(key, {}).setdefault(document.metadata["content_hash"], document)
+
+        # Exact duplicates, within the batch and against each partition
+        batches = []
+        for (owner, namespace), unique in groups.items():
+            store = self._partition(owner, namespace)
+            if store is not None:
+                existing = store.get(
+                    where={"content_hash": {"$in": list(unique)}},
+                    include=["metadatas"],
+                )
+                for meta in existing["metadatas"] or []:
+                    unique.pop(meta.get("content_hash"), None)
+            if unique:
+                batches.append(((owner, namespace), list(unique.values())))
+        if not batches:
+            return 0
+
+        # One embedding request for the whole batch
+        texts = [d.content for _, docs in batches for d in docs]
+        with start_span("long_term_memory.embed", {"text_count": len(texts)}):
+            embeddings = [list(map(float, v)) for v in self.db.embedding_function(texts)]
+
+        written = 0
+        offset = 0
+        for (owner, namespace), docs in batches:
+            vectors = embeddings[offset:offset + len(docs)]
+            offset += len(docs)
+            store = self._partition(owner, namespace, create=True)
+            if self.dedup_threshold is not None:
+                keep = self._near_duplicate_mask(store, vectors)
+                docs = [d for d, k in zip(docs, keep) if k]
+                vectors = [v for v, k in zip(vectors, keep) if k]
+            if docs:
+                store.add(docs, embeddings=vectors)
+                self._update_catalog(store, owner, namespace)
+                written += len(docs)
+        return written
+
+    def _near_duplicate_mask(self, store:VectorStore, embeddings:List[List[float]]) -> List[bool]:
+        """Flag memories to keep: not too similar to stored or earlier batch memories"""
+        keep = [True] * len(embeddings)
+        vectors = normalize_rows(embeddings)
+
+        stored = []
+        if store.count():
+            # Nearest stored memory for the whole batch in one query
+            result = store.query(
+                query_embeddings=embeddings,
+                n_results=1,
+                include=["embeddings"],
+            )
+            stored = result.get("embeddings") or []
+
+        accepted: List[int] = []
+        for i in range(len(embeddings)):
+            neighbours = stored[i] if i < len(stored) else []
+            if len(neighbours) and float(normalize_rows(neighbours[0])[0] @ vectors[i]) >= self.dedup_threshold:
+                keep[i] = False
+                continue
+            if accepted and float(np.max(vectors[accepted] @ vectors[i])) >= self.dedup_threshold:
+                keep[i] = False
+                continue
+            accepted.append(i)
+        return keep
 
     def search(self, query_text:str, owner:str, limit:int=3,
                timestamp_filter:Optional[TimestampFilter]=None, 
-               namespace:Optional[str]="default") -> MemorySearchResult:
+               namespace:Optional[str]="default",
+               scoring:Union[RetrievalScoring, bool, None]=None) -> MemorySearchResult:
         """
         Search for relevant memories using semantic similarity.
         
         Performs a vector similarity search to find memories that are semantically
-        related to the query text. Results are filtered by owner, namespace, and
-        optionally by timestamp range.
+        related to the query text. The query only runs against the partition of
+        the owner and namespace, optionally filtered by timestamp range.
         
         Args:
             query_text (str): The search query to find similar memories
@@ -282,50 +1708,60 @@ class LongTermMemory:
             limit (int): Maximum number of results to return (default: 3)
             timestamp_filter (Optional[TimestampFilter]): Time-based filtering criteria
             namespace (Optional[str]): Namespace to search within (default: "default")
+            scoring (Union[RetrievalScoring, bool, None]): Re-ranking weights for
+                this search (default: the memory's `scoring`; False ranks by
+                similarity only)
             
         Returns:
-            MemorySearchResult: Container with matching memory fragments and metadata
+            MemorySearchResult: Container with matching memory fragments and
+                metadata (distances, plus similarities and scores when re-ranked)
         """
+        # Make buffered registrations visible
+        self.flush()
 
-        where = {
-            "$and": [
-                {
-                    "namespace": {
-                        "$eq": namespace
-                    }
-                },
-                {
-                    "owner": {
-                        "$eq": owner
-                    }
-                },
-            ]
-        }
+        store = self._partition(owner, namespace)
+        if store is None:
+            return MemorySearchResult(fragments=[], metadata={"distances": []})
 
+        # Owner and namespace are implied by the partition
+        conditions = []
         if timestamp_filter:
             if timestamp_filter.greater_than_value:
-                where["$and"].append({
+                conditions.append({
                     "timestamp": {
                         "$gt": timestamp_filter.greater_than_value,
                     }
                 })
             if timestamp_filter.lower_than_value:
-                where["$and"].append({
+                conditions.append({
                     "timestamp": {
                         "$lt": timestamp_filter.lower_than_value,
                     }
                 })
+        where = None
+        if len(conditions) == 1:
+            where = conditions[0]
+        elif conditions:
+            where = {"$and": conditions}
 
-        result:QueryResult = self.vector_store.query(
-            query_texts=[query_text],
-            n_results=limit,
-            where=where
-        )
+        scoring = self.scoring if scoring is None else (scoring or None)
+        if scoring is None:
+            result:QueryResult = store.query(
+                query_texts=[query_text],
+                n_results=limit,
+                where=where
+            )
+            documents = result.get("documents", [[]])[0]
+            metadatas = result.get("metadatas", [[]])[0]
+            result_metadata = {
+                "distances": result.get("distances", [[]])[0]
+            }
+        else:
+            documents, metadatas, result_metadata = self._rerank(
+                store, query_text, limit, where, scoring
+            )
 
         fragments = []
-        documents = result.get("documents", [[]])[0]
-        metadatas = result.get("metadatas", [[]])[0]
-
         for content, meta in zip(documents, metadatas):
             owner = meta.get("owner")
             namespace = meta.get("namespace", "default")
@@ -335,16 +1771,46 @@ class LongTermMemory:
                 content=content,
                 owner=owner,
                 namespace=namespace,
-                timestamp=timestamp
+                timestamp=timestamp,
+                importance=meta.get("importance", 0.5),
             )
 
             fragments.append(fragment)
-        
-        result_metadata = {
-            "distances": result.get("distances", [[]])[0]
-        }
 
         return MemorySearchResult(
             fragments=fragments,
             metadata=result_metadata
         )
+
+    def _rerank(self, store:VectorStore, query_text:str, limit:int,
+                where:Optional[Dict[str, Any]], scoring:RetrievalScoring):
+        """Over-fetch candidates and order them by the combined score"""
+        query_embedding = store.embed([query_text])
+        result:QueryResult = store.query(
+            query_embeddings=query_embedding,
+            n_results=limit * scoring.overfetch,
+            where=where,
+            include=["documents", "distances", "metadatas", "embeddings"],
+        )
+        documents = result.get("documents", [[]])[0]
+        metadatas = result.get("metadatas", [[]])[0]
+        distances = result.get("distances", [[]])[0]
+        if not documents:
+            return [], [], {"distances": [], "similarities": [], "scores": []}
+
+        # Cosine similarity from the vectors, whatever the collection's metric
+        similarities = normalize_rows(result["embeddings"][0]) @ normalize_rows(query_embedding)[0]
+        timestamps = np.array([m.get("timestamp") or 0 for m in metadatas], dtype=np.float64)
+        importances = np.array([m.get("importance", 0.5) for m in metadatas], dtype=np.float64)
+        scores = scoring.score(similarities, timestamps, importances)
+
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return (
+            [documents[i] for i in order],
+            [metadatas[i] for i in order],
+            {
+                "distances": [distances[i] for i in order],
+                "similarities": [float(similarities[i]) for i in order],
+                "scores": [float(scores[i]) for i in order],
+            },
+        )
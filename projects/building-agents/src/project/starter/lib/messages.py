@@ -1,5 +1,8 @@
 from pydantic import BaseModel
-from typing import Optional, Union, List, Dict, Literal
+from typing import Optional, Union, List, Dict, Literal, Iterable, Iterator
+from collections.abc import Sequence
+from itertools import islice
+import threading
 
 from lib.tooling import ToolCall
 
@@ -46,3 +49,104 @@ AnyMessage = Union[
     AIMessage,
     ToolMessage,
 ]
+
+
+class _SharedBuffer:
+    __slots__ = ("items", "lock", "__weakref__")
+
+    def __init__(self, items: List):
+        self.items = items
+        self.lock = threading.Lock()
+
+
+class MessageLog(Sequence):
+    """
+    Append-only conversation history with structural sharing.
+
+    A log is an immutable view over the first `len(log)` items of a buffer
+    shared with every log derived from it. Adding messages to the newest
+    view extends the shared buffer in place, so `log + [message]` costs
+    O(1) per message instead of copying the whole history, while older
+    views (e.g. in earlier snapshots) keep seeing exactly what they saw.
+    Adding to an older view copies its prefix into a new buffer.
+
+    Because views never change, copying a log (including `copy.deepcopy`)
+    returns the log itself.
+
+    Example:
+        >>> log = MessageLog([SystemMessage(content="Be brief")])
+        >>> log = log + [UserMessage(content="Hi")]
+        >>> len(log)
+        2
+    """
+    __slots__ = ("_buffer", "_length")
+
+    def __init__(self, messages: Optional[Iterable[BaseMessage]] = None):
+        items = list(messages) if messages is not None else []
+        self._buffer = _SharedBuffer(items)
+        self._length = len(items)
+
+    @classmethod
+    def _view(cls, buffer: _SharedBuffer, length: int) -> "MessageLog":
+        log = cls.__new__(cls)
+        log._buffer = buffer
+        log._length = length
+        return log
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("MessageLog index out of range")
+        return self._buffer.items[index]
+
+    def __iter__(self) -> Iterator[BaseMessage]:
+        return islice(self._buffer.items, self._length)
+
+    def __reversed__(self) -> Iterator[BaseMessage]:
+        items = self._buffer.items
+        for i in range(self._length - 1, -1, -1):
+            yield items[i]
+
+    def prefix(self, length: int) -> "MessageLog":
+        """View of the first `length` messages, sharing this log's buffer"""
+        if not 0 <= length <= self._length:
+            raise IndexError("MessageLog prefix out of range")
+        return self._view(self._buffer, length)
+
+    def __add__(self, messages: Iterable[BaseMessage]) -> "MessageLog":
+        extra = list(messages)
+        buffer = self._buffer
+        with buffer.lock:
+            if len(buffer.items) == self._length:
+                buffer.items.extend(extra)
+                return self._view(buffer, self._length + len(extra))
+        # Someone already extended this prefix; branch off a private copy
+        return MessageLog(buffer.items[:self._length] + extra)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MessageLog, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __copy__(self) -> "MessageLog":
+        return self
+
+    def __deepcopy__(self, memo) -> "MessageLog":
+        return self
+
+    def __reduce__(self):
+        return (MessageLog, (list(self),))
+
+    def __repr__(self) -> str:
+        return f"MessageLog({list(self)!r})"
+
+    def to_list(self) -> List[BaseMessage]:
+        return list(self)
@@ -0,0 +1,152 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import math
+import time
+import tracemalloc
+
+
+@dataclass
+class StepMetrics:
+    """
+    Resource usage recorded for a single step execution.
+
+    Attributes:
+        step_id (str): Identifier of the executed step
+        start_time (float): `time.monotonic()` when the step started
+        end_time (float): `time.monotonic()` when the step finished
+        cpu_time (float): Process CPU seconds consumed by the step
+        tokens (int): LLM tokens consumed while the step was running
+        peak_memory (Optional[int]): Peak traced allocation in bytes (only when tracemalloc is enabled)
+    """
+    step_id: str
+    start_time: float
+    end_time: float = 0.0
+    cpu_time: float = 0.0
+    tokens: int = 0
+    peak_memory: Optional[int] = None
+
+    @property
+    def duration(self) -> float:
+        """Wall-clock seconds spent in the step"""
+        return self.end_time - self.start_time
+
+
+@dataclass
+class StepStats:
+    """Aggregated metrics for all executions of one step id"""
+    step_id: str
+    count: int
+    total_duration: float
+    p50_duration: float
+    p95_duration: float
+    total_cpu_time: float
+    total_tokens: int
+    max_peak_memory: Optional[int] = None
+
+    @property
+    def mean_duration(self) -> float:
+        return self.total_duration / self.count if self.count else 0.0
+
+
+class _TokenMeter:
+    def __init__(self, parent: Optional["_TokenMeter"] = None):
+        self.parent = parent
+        self.tokens = 0
+
+
+_current_meter: ContextVar[Optional[_TokenMeter]] = ContextVar("_current_meter", default=None)
+
+
+def record_tokens(count: int):
+    """
+    Attribute LLM tokens to the step that is currently executing.
+
+    Tokens are also attributed to enclosing steps, so a workflow nested
+    inside a tool (e.g. a RAG pipeline) is counted by the outer step too.
+    Calls made outside of a step are ignored.
+    """
+    meter = _current_meter.get()
+    while meter is not None:
+        meter.tokens += count
+        meter = meter.parent
+
+
+@contextmanager
+def measure_step(step_id: str, trace_memory: bool = False) -> Iterator[StepMetrics]:
+    """
+    Measure the wall-clock time, CPU time, tokens and (optionally) peak
+    allocations of the code executed inside the context.
+
+    Args:
+        step_id: Identifier recorded on the resulting metrics
+        trace_memory: Whether to record the tracemalloc peak. Tracing is
+            started (and stopped afterwards) if it isn't already running.
+
+    Yields:
+        StepMetrics: Populated when the context exits, even on error
+    """
+    owns_tracing = False
+    if trace_memory:
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+            owns_tracing = True
+
+    meter = _TokenMeter(parent=_current_meter.get())
+    token = _current_meter.set(meter)
+    metrics = StepMetrics(step_id=step_id, start_time=time.monotonic())
+    cpu_start = time.process_time()
+    try:
+        yield metrics
+    finally:
+        metrics.end_time = time.monotonic()
+        metrics.cpu_time = time.process_time() - cpu_start
+        metrics.tokens = meter.tokens
+        _current_meter.reset(token)
+        if trace_memory:
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+            if owns_tracing:
+                tracemalloc.stop()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of `values` (q in [0, 100])"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_step_metrics(metrics: Iterable[StepMetrics]) -> Dict[str, StepStats]:
+    """
+    Aggregate step metrics by step id.
+
+    Accepts metrics from one or many runs, e.g.
+    `summarize_step_metrics(m for run in runs for m in run.step_metrics)`.
+
+    Returns:
+        Dict[str, StepStats]: Stats keyed by step id, in first-seen order
+    """
+    grouped: Dict[str, List[StepMetrics]] = {}
+    for m in metrics:
+        grouped.setdefault(m.step_id, []).append(m)
+
+    stats = {}
+    for step_id, items in grouped.items():
+        durations = [m.duration for m in items]
+        peaks = [m.peak_memory for m in items if m.peak_memory is not None]
+        stats[step_id] = StepStats(
+            step_id=step_id,
+            count=len(items),
+            total_duration=sum(durations),
+            p50_duration=percentile(durations, 50),
+            p95_duration=percentile(durations, 95),
+            total_cpu_time=sum(m.cpu_time for m in items),
+            total_tokens=sum(m.tokens for m in items),
+            max_peak_memory=max(peaks) if peaks else None,
+        )
+    return stats
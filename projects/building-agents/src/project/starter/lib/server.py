@@ -0,0 +1,349 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+import asyncio
+import json
+import logging
+
+from lib.agents import Agent
+from lib.events import StateMachineListener
+from lib.messages import AIMessage
+from lib.state_machine import Run
+
+
+logger = logging.getLogger("lib.server")
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Per-request sink for step and token events; set on the worker thread running the query
+_event_sink: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar("_event_sink", default=None)
+
+
+class _StreamingListener(StateMachineListener):
+    """Forwards step events to the request that started the run, if it streams"""
+
+    def on_step_start(self, run, step_id, state):
+        sink = _event_sink.get()
+        if sink:
+            sink({"event": "step_start", "run_id": run.run_id, "step_id": step_id})
+
+    def on_step_end(self, run, step_id, state, metrics):
+        sink = _event_sink.get()
+        if sink:
+            sink({
+                "event": "step_end",
+                "run_id": run.run_id,
+                "step_id": step_id,
+                "duration": metrics.duration,
+                "tokens": metrics.tokens,
+            })
+
+
+def _final_answer(run: Run) -> str:
+    final_state = run.get_final_state() or {}
+    for message in reversed(final_state.get("messages", [])):
+        if isinstance(message, AIMessage) and message.content:
+            return message.content
+    return ""
+
+
+def _run_payload(run: Run, session_id: str) -> Dict[str, Any]:
+    final_state = run.get_final_state() or {}
+    return {
+        "session_id": session_id,
+        "run_id": run.run_id,
+        "status": run.status.value,
+        "answer": _final_answer(run),
+        "total_tokens": final_state.get("total_tokens", 0),
+    }
+
+
+class ServerBusyError(Exception):
+    """Raised when the server cannot accept more queries"""
+    pass
+
+
+class AgentServer:
+    """
+    ASGI application hosting a long-lived, warm `Agent`.
+
+    The agent (and its LLM client, tools and vector store) is built once
+    per process and shared by every request; sessions are kept in the
+    agent's memory. Queries run on the agent's worker pool so the event
+    loop stays responsive.
+
+    Endpoints:
+        GET    /healthz                          Liveness and load
+        GET    /sessions/{id}                    Runs stored for a session
+        DELETE /sessions/{id}                    Reset a session
+        POST   /sessions/{id}/messages           {"query": ...} -> final answer
+        POST   /sessions/{id}/messages/stream    Same, as Server-Sent Events
+        WS     /sessions/{id}/ws                 Send {"query": ...}, receive events
+
+    Streaming endpoints send `step_start`/`step_end` events, `token` events
+    carrying the LLM's content deltas as they are generated, and finally
+    the `answer` (or an `error`).
+
+    Backpressure: at most `max_concurrency` queries run at once and at most
+    `max_queue` wait; beyond that requests get 503 with `Retry-After`.
+    On shutdown the server stops accepting queries and waits up to
+    `drain_timeout` seconds for in-flight ones to finish.
+
+    Example:
+        >>> app = AgentServer(agent)
+        >>> uvicorn.run(app, host="0.0.0.0", port=8000)
+    """
+
+    def __init__(self, agent: Agent, max_concurrency: int = 8, max_queue: int = 64,
+                 drain_timeout: float = 30.0):
+        self.agent = agent
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self._active = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._idle: Optional[asyncio.Event] = None
+        agent.workflow.subscribe(_StreamingListener())
+
+    # Query execution -------------------------------------------------------
+    def _ensure_primitives(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._idle = asyncio.Event()
+            self._idle.set()
+
+    def _admit(self):
+        self._ensure_primitives()
+        if self.draining:
+            raise ServerBusyError("Server is shutting down")
+        if self._active >= self.max_concurrency + self.max_queue:
+            raise ServerBusyError("Too many queries in progress")
+        self._active += 1
+        self._idle.clear()
+
+    def _release(self):
+        self._active -= 1
+        if self._active == 0:
+            self._idle.set()
+
+    async def run_query(self, query: str, session_id: str,
+                        on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Run:
+        """
+        Run a query on the agent's worker pool
+
+        Args:
+            query: The user's query
+            session_id: Session the query belongs to
+            on_event: Optional callback for step events and LLM token deltas
+                (`{"event": "token", "delta": ...}`), called on the event loop;
+                with it the LLM calls are streamed
+
+        Raises:
+            ServerBusyError: If the server is draining or over capacity
+        """
+        self._admit()
+        try:
+            return await self._execute(query, session_id, on_event)
+        finally:
+            self._release()
+
+    async def _execute(self, query: str, session_id: str,
+                       on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Run:
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            sink = on_token = None
+            if on_event is not None:
+                sink = lambda event: loop.call_soon_threadsafe(on_event, event)
+                on_token = lambda delta: sink({"event": "token", "delta": delta})
+
+            def work() -> Run:
+                # Pool threads are reused: never leave this request's sink behind
+                context_token = _event_sink.set(sink)
+                try:
+                    return self.agent.invoke(query, session_id, on_token=on_token)
+                finally:
+                    _event_sink.reset(context_token)
+
+            return await loop.run_in_executor(self.agent.executor, work)
+
+    # ASGI entry point ------------------------------------------------------
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._ensure_primitives()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.drain()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def drain(self):
+        """Stop accepting queries and wait for in-flight ones to finish"""
+        self._ensure_primitives()
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out with %d queries in flight", self._active)
+        self.agent.shutdown(wait=False)
+
+    @staticmethod
+    def _route(path: str) -> Tuple[Optional[str], Optional[str]]:
+        """Split `/sessions/{id}[/suffix]` into (session_id, suffix)"""
+        parts = [p for p in path.split("/") if p]
+        if len(parts) < 2 or parts[0] != "sessions":
+            return None, None
+        return parts[1], "/".join(parts[2:])
+
+    # HTTP ------------------------------------------------------------------
+    async def _http(self, scope: Scope, receive: Receive, send: Send):
+        method, path = scope["method"], scope["path"]
+        if path == "/healthz" and method == "GET":
+            status = "draining" if self.draining else "ok"
+            return await self._json(send, 503 if self.draining else 200,
+                                    {"status": status, "active": self._active})
+
+        session_id, suffix = self._route(path)
+        if session_id is None:
+            return await self._json(send, 404, {"error": "Not found"})
+
+        if suffix == "" and method == "GET":
+            try:
+                runs = self.agent.get_session_runs(session_id)
+            except Exception:
+                return await self._json(send, 404, {"error": f"Session '{session_id}' not found"})
+            return await self._json(send, 200, {"session_id": session_id,
+                                                "runs": [r.metadata for r in runs]})
+        if suffix == "" and method == "DELETE":
+            self.agent.memory.create_session(session_id)
+            self.agent.reset_session(session_id)
+            return await self._json(send, 204, None)
+        if suffix in ("messages", "messages/stream") and method == "POST":
+            try:
+                body = json.loads(await self._read_body(receive) or b"{}")
+                query = body["query"]
+            except (ValueError, KeyError, TypeError):
+                return await self._json(send, 400, {"error": "Body must be JSON with a `query` field"})
+            if suffix == "messages":
+                return await self._answer(send, query, session_id)
+            return await self._stream(send, query, session_id)
+
+        return await self._json(send, 404, {"error": "Not found"})
+
+    async def _answer(self, send: Send, query: str, session_id: str):
+        try:
+            run = await self.run_query(query, session_id)
+        except ServerBusyError as e:
+            return await self._json(send, 503, {"error": str(e)}, [(b"retry-after", b"1")])
+        except Exception as e:
+            logger.exception("Query failed")
+            return await self._json(send, 500, {"error": repr(e)})
+        await self._json(send, 200, _run_payload(run, session_id))
+
+    async def _stream(self, send: Send, query: str, session_id: str):
+        # Admit before the 200 status line goes out so overload is still a 503
+        try:
+            self._admit()
+        except ServerBusyError as e:
+            return await self._json(send, 503, {"error": str(e)}, [(b"retry-after", b"1")])
+
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self._execute(query, session_id, queue.put_nowait))
+
+        def finished(_):
+            self._release()
+            queue.put_nowait(None)
+        task.add_done_callback(finished)
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache")],
+        })
+
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            await self._sse(send, event["event"], event)
+
+        try:
+            run = task.result()
+            payload = _run_payload(run, session_id)
+            await self._sse(send, "answer", payload)
+        except Exception as e:
+            await self._sse(send, "error", {"error": repr(e)})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _sse(send: Send, event: str, data: Dict[str, Any]):
+        chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _json(send: Send, status: int, payload: Any,
+                    headers: Optional[List[Tuple[bytes, bytes]]] = None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    # WebSocket -------------------------------------------------------------
+    async def _websocket(self, scope: Scope, receive: Receive, send: Send):
+        session_id, suffix = self._route(scope["path"])
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        if session_id is None or suffix != "ws" or self.draining:
+            return await send({"type": "websocket.close", "code": 1013 if self.draining else 1008})
+        await send({"type": "websocket.accept"})
+
+        async def emit(data: Dict[str, Any]):
+            await send({"type": "websocket.send", "text": json.dumps(data)})
+
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            try:
+                query = json.loads(message.get("text") or message.get("bytes") or b"")["query"]
+            except (ValueError, KeyError, TypeError):
+                await emit({"event": "error", "error": "Message must be JSON with a `query` field"})
+                continue
+
+            queue: asyncio.Queue = asyncio.Queue()
+            task = asyncio.ensure_future(self.run_query(query, session_id, queue.put_nowait))
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                await emit(event)
+            try:
+                await emit({"event": "answer", **_run_payload(task.result(), session_id)})
+            except Exception as e:
+                await emit({"event": "error", "error": repr(e)})
@@ -1,9 +1,17 @@
 from typing import Any, Callable, Dict, List, Optional, Union, TypeVar, Generic, cast, Type, TypedDict, get_type_hints
 from dataclasses import dataclass, field
 from datetime import datetime
+from contextvars import ContextVar
+from enum import Enum
 import uuid
 import copy
 import inspect
+import time
+
+from lib.checkpoint import Checkpoint, Checkpointer, CheckpointNotFoundError
+from lib.metrics import StepMetrics, StepStats, measure_step, summarize_step_metrics
+from lib.tracing import start_span
+from lib.events import StateMachineListener
 
 
 StateSchema = TypeVar("StateSchema")
@@ -12,6 +20,113 @@ StateSchema = TypeVar("StateSchema")
 class Resource:
     vars: Dict[str, Any]
 
+
+class RunStatus(str, Enum):
+    """How a run ended"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed_out"
+    MAX_STEPS_EXCEEDED = "max_steps_exceeded"
+
+
+class RunCancelledError(Exception):
+    """Raised inside step logic when the run it belongs to must stop"""
+    def __init__(self, message: str, status: RunStatus = RunStatus.CANCELLED):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class RunLimits:
+    """
+    Bounds applied to a single run of the state machine.
+
+    Attributes:
+        max_steps: Maximum number of steps executed in the run (entry step included)
+        max_visits_per_step: Maximum number of times any single step may run,
+            e.g. bounding `llm_processor -> tool_executor -> llm_processor` loops
+        run_timeout: Wall-clock seconds allowed for the whole run
+        step_timeout: Wall-clock seconds allowed for each step
+    """
+    max_steps: Optional[int] = None
+    max_visits_per_step: Optional[int] = None
+    run_timeout: Optional[float] = None
+    step_timeout: Optional[float] = None
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation signal shared between a run and its step logic.
+
+    Long-running steps (tools, web searches, nested workflows) should call
+    `raise_if_cancelled()` at safe points. The token also trips once the
+    run or current step deadline has passed, or once its `parent` trips.
+    Each run executes under its own token, a child of the caller's, so
+    run deadlines never leak into the token the caller passed in.
+
+    Example:
+        >>> token = current_cancellation_token()
+        >>> for page in pages:
+        ...     if token:
+        ...         token.raise_if_cancelled()
+    """
+
+    def __init__(self, deadline: Optional[float] = None, parent: Optional["CancellationToken"] = None):
+        self.deadline = deadline
+        self.step_deadline: Optional[float] = None
+        self.parent = parent
+        self._reason: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"CancellationToken(cancelled={self.cancelled})"
+
+    def cancel(self, reason: str = "cancelled"):
+        """Request the run to stop at the next check"""
+        self._reason = reason
+
+    @property
+    def reason(self) -> Optional[str]:
+        """Reason given to `cancel`, on this token or a parent"""
+        if self._reason is not None:
+            return self._reason
+        return self.parent.reason if self.parent is not None else None
+
+    @property
+    def status(self) -> Optional[RunStatus]:
+        """Why the token tripped, or None if the run may continue"""
+        if self._reason is not None:
+            return RunStatus.CANCELLED
+        if self.parent is not None:
+            status = self.parent.status
+            if status is not None:
+                return status
+        now = time.monotonic()
+        if self.deadline is not None and now > self.deadline:
+            return RunStatus.TIMED_OUT
+        if self.step_deadline is not None and now > self.step_deadline:
+            return RunStatus.TIMED_OUT
+        return None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status is not None
+
+    def raise_if_cancelled(self):
+        status = self.status
+        if status is RunStatus.CANCELLED:
+            raise RunCancelledError(f"Run cancelled: {self.reason}", status)
+        if status is RunStatus.TIMED_OUT:
+            raise RunCancelledError("Run deadline exceeded", status)
+
+
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("_current_token", default=None)
+
+
+def current_cancellation_token() -> Optional[CancellationToken]:
+    """Cancellation token of the run executing the current step, if any"""
+    return _current_token.get()
+
 class Step(Generic[StateSchema]):
     def __init__(self, step_id: str, logic: Callable[[StateSchema], Dict]):
         self.step_id = step_id
@@ -131,6 +246,8 @@ class Run(Generic[StateSchema]):
     start_timestamp: datetime
     snapshots: List[Snapshot[StateSchema]] = field(default_factory=list)
     end_timestamp: Optional[datetime] = None
+    step_metrics: List[StepMetrics] = field(default_factory=list)
+    status: RunStatus = RunStatus.RUNNING
 
     def __str__(self) -> str:
         return f"Run('{self.run_id}')"
@@ -151,16 +268,26 @@ class Run(Generic[StateSchema]):
             "run_id": self.run_id,
             "start_timestamp": self.start_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
             "end_timestamp": self.end_timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
-            "snapshot_counts": len(self.snapshots)
+            "snapshot_counts": len(self.snapshots),
+            "status": self.status.value,
         }
 
     def add_snapshot(self, snapshot: Snapshot[StateSchema]):
         """Add a new snapshot to this run"""
         self.snapshots.append(snapshot)
 
-    def complete(self):
+    def add_step_metrics(self, metrics: StepMetrics):
+        """Record timing and usage of a step execution"""
+        self.step_metrics.append(metrics)
+
+    def step_stats(self) -> Dict[str, StepStats]:
+        """Aggregate step metrics (count, p50/p95 duration, tokens) per step id"""
+        return summarize_step_metrics(self.step_metrics)
+
+    def complete(self, status: RunStatus = RunStatus.COMPLETED):
         """Mark this run as complete"""
         self.end_timestamp = datetime.now()
+        self.status = status
 
     def get_final_state(self) -> Optional[StateSchema]:
         """Get the final state of this run"""
@@ -170,10 +297,16 @@ class Run(Generic[StateSchema]):
 
 
 class StateMachine(Generic[StateSchema]):
-    def __init__(self, state_schema: Type[StateSchema]):
+    def __init__(self, state_schema: Type[StateSchema], checkpointer: Optional[Checkpointer] = None,
+                 trace_memory: bool = False, limits: Optional[RunLimits] = None):
         self.state_schema = state_schema
         self.steps: Dict[str, Step[StateSchema]] = {}
         self.transitions: Dict[str, List[Transition[StateSchema]]] = {}
+        self.checkpointer = checkpointer
+        self.limits = limits or RunLimits()
+        # Record tracemalloc peaks per step (adds noticeable overhead)
+        self.trace_memory = trace_memory
+        self.listeners: List[StateMachineListener] = []
 
     def __str__(self) -> str:
         schema_keys = list(get_type_hints(self.state_schema).keys())
@@ -182,6 +315,16 @@ class StateMachine(Generic[StateSchema]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    def subscribe(self, listener: StateMachineListener):
+        """Register a listener for step, transition and error events"""
+        if listener not in self.listeners:
+            # Copy-on-write so runs in progress keep iterating the old list
+            self.listeners = self.listeners + [listener]
+
+    def unsubscribe(self, listener: StateMachineListener):
+        """Remove a previously registered listener"""
+        self.listeners = [l for l in self.listeners if l is not listener]
+
     def add_steps(self, steps: List[Step[StateSchema]]):
         """Add steps to the workflow"""
         for step in steps:
@@ -201,7 +344,9 @@ class StateMachine(Generic[StateSchema]):
             self.transitions[src_id] = []
         self.transitions[src_id].append(transition)
 
-    def run(self, state: StateSchema, resource: Resource = None):
+    def run(self, state: StateSchema, resource: Resource = None,
+            limits: Optional[RunLimits] = None,
+            cancellation_token: Optional[CancellationToken] = None):
         # Validate that state has at least one field from the schema
         expected_fields = get_type_hints(self.state_schema)
         state_fields = set(state.keys())
@@ -218,27 +363,163 @@ class StateMachine(Generic[StateSchema]):
         
         # Create a new run for this execution
         current_run = Run.create()
-        
-        current_step_id = entry_points[0].step_id        
+
+        return self._execute(current_run, state, entry_points[0].step_id, resource,
+                             limits, cancellation_token)
+
+    def resume(self, run_id: str, resource: Resource = None,
+               limits: Optional[RunLimits] = None,
+               cancellation_token: Optional[CancellationToken] = None,
+               checkpoint: Optional[Checkpoint] = None) -> Run[StateSchema]:
+        """Continue a checkpointed run from its last completed step
+
+        Steps that already finished are not executed again: execution picks up
+        at the step that was scheduled next when the checkpoint was written.
+        Runs that were cancelled, timed out or hit a limit are resumed from
+        the step they did not run.
+
+        Args:
+            run_id: Identifier of the run to resume
+            resource: Optional resource passed to the remaining steps
+            limits: Optional limits for the resumed execution (defaults to the machine's)
+            cancellation_token: Optional token used to cancel the resumed execution
+            checkpoint: Checkpoint of the run if the caller already loaded it
+
+        Returns:
+            The completed run, including the snapshots restored from the checkpoint
+
+        Raises:
+            ValueError: If the state machine has no checkpointer
+            CheckpointNotFoundError: If no checkpoint exists for `run_id`
+        """
+        if self.checkpointer is None:
+            raise ValueError("Cannot resume a run without a checkpointer")
+
+        if checkpoint is None:
+            checkpoint = self.checkpointer.load(run_id)
+        if checkpoint is None:
+            raise CheckpointNotFoundError(f"No checkpoint found for run '{run_id}'")
+
+        current_run: Run[StateSchema] = checkpoint.run
+        if checkpoint.completed:
+            return current_run
+        current_run.status = RunStatus.RUNNING
+        current_run.end_timestamp = None
+
+        state = copy.deepcopy(checkpoint.state)
+        return self._execute(current_run, state, checkpoint.next_step_id, resource,
+                             limits, cancellation_token)
+
+    def _save_checkpoint(self, run: Run[StateSchema], step_id: str, next_step_id: Optional[str],
+                         state: StateSchema):
+        if self.checkpointer is None:
+            return
+        self.checkpointer.save(
+            Checkpoint(
+                run_id=run.run_id,
+                step_id=step_id,
+                next_step_id=next_step_id,
+                run=run,
+                updated_at=datetime.now(),
+                state_data=state,
+            )
+        )
+
+    def _execute(self, current_run: Run[StateSchema], state: StateSchema,
+                 current_step_id: str, resource: Resource = None,
+                 limits: Optional[RunLimits] = None,
+                 cancellation_token: Optional[CancellationToken] = None) -> Run[StateSchema]:
+        limits = limits or self.limits
+        deadline = time.monotonic() + limits.run_timeout if limits.run_timeout is not None else None
+        token = CancellationToken(deadline, parent=cancellation_token)
+
+        attributes = {
+            "run_id": current_run.run_id,
+            "state_schema": getattr(self.state_schema, "__name__", str(self.state_schema)),
+            "start_step_id": current_step_id,
+        }
+        context_token = _current_token.set(token)
+        try:
+            with start_span("state_machine.run", attributes) as span:
+                self._run_steps(current_run, state, current_step_id, resource, limits, token)
+                span.set_attributes({
+                    "step_count": len(current_run.step_metrics),
+                    "status": current_run.status.value,
+                })
+        finally:
+            _current_token.reset(context_token)
+        return current_run
+
+    def _check_limits(self, run: Run[StateSchema], step_id: str, visits: Dict[str, int],
+                      limits: RunLimits, token: CancellationToken) -> Optional[RunStatus]:
+        """Return the status the run must end with before executing `step_id`, if any"""
+        status = token.status
+        if status is not None:
+            return status
+        if limits.max_steps is not None and len(run.step_metrics) >= limits.max_steps:
+            return RunStatus.MAX_STEPS_EXCEEDED
+        if limits.max_visits_per_step is not None and visits.get(step_id, 0) >= limits.max_visits_per_step:
+            return RunStatus.MAX_STEPS_EXCEEDED
+        return None
+
+    def _run_steps(self, current_run: Run[StateSchema], state: StateSchema,
+                   current_step_id: str, resource: Resource,
+                   limits: RunLimits, token: CancellationToken):
+        last_step_id = current_step_id
+        listeners = self.listeners
+        status = RunStatus.COMPLETED
+        # Resumed runs keep counting the steps executed before the checkpoint
+        visits: Dict[str, int] = {}
+        for m in current_run.step_metrics:
+            visits[m.step_id] = visits.get(m.step_id, 0) + 1
 
         while current_step_id:
             step = self.steps[current_step_id]
             if isinstance(step, Termination):
-                print(f"[StateMachine] Terminating: {current_step_id}")
                 break
-            
-            # Replace state entirely
-            state = step.run(state, self.state_schema, resource)  
 
-            if isinstance(step, EntryPoint):
-                print(f"[StateMachine] Starting: {current_step_id}")
-            else:
-                print(f"[StateMachine] Executing step: {current_step_id}")
+            limit_status = self._check_limits(current_run, current_step_id, visits, limits, token)
+            if limit_status is not None:
+                status = limit_status
+                break
+            visits[current_step_id] = visits.get(current_step_id, 0) + 1
+
+            if limits.step_timeout is not None:
+                token.step_deadline = time.monotonic() + limits.step_timeout
+
+            if listeners:
+                for listener in listeners:
+                    listener.on_step_start(current_run, current_step_id, state)
+
+            # Replace state entirely
+            with start_span("state_machine.step", {"run_id": current_run.run_id, "step_id": current_step_id}) as span:
+                try:
+                    with measure_step(current_step_id, self.trace_memory) as metrics:
+                        state = step.run(state, self.state_schema, resource)
+                except RunCancelledError as e:
+                    # The step gave up cooperatively; keep the last completed state
+                    status = e.status
+                    current_run.add_step_metrics(metrics)
+                    break
+                except Exception as e:
+                    if listeners:
+                        for listener in listeners:
+                            listener.on_error(current_run, current_step_id, e)
+                    raise
+                span.set_attribute("tokens", metrics.tokens)
+            current_run.add_step_metrics(metrics)
+
+            if listeners:
+                for listener in listeners:
+                    listener.on_step_end(current_run, current_step_id, state, metrics)
 
             # Create and add snapshot to the current run
             snapshot = Snapshot.create(copy.deepcopy(state), self.state_schema, current_step_id)
             current_run.add_snapshot(snapshot)
 
+            step_timed_out = limits.step_timeout is not None and metrics.duration > limits.step_timeout
+            token.step_deadline = None
+
             transitions = self.transitions.get(current_step_id, [])
             next_steps: List[str] = []
 
@@ -251,7 +532,20 @@ class StateMachine(Generic[StateSchema]):
             if len(next_steps) > 1:
                 raise NotImplementedError("Parallel execution not implemented yet.")
 
+            last_step_id = current_step_id
             current_step_id = next_steps[0]
 
-        current_run.complete()
-        return current_run
+            if listeners:
+                for listener in listeners:
+                    listener.on_transition(current_run, last_step_id, current_step_id)
+            self._save_checkpoint(current_run, last_step_id, current_step_id, state)
+
+            if step_timed_out:
+                # The step's result is kept; the run stops before the next one
+                status = RunStatus.TIMED_OUT
+                break
+
+        current_run.complete(status)
+        # A run stopped early stays resumable from the step it did not run
+        next_step_id = None if status is RunStatus.COMPLETED else current_step_id
+        self._save_checkpoint(current_run, last_step_id, next_step_id, state)
@@ -0,0 +1,111 @@
+from typing import Any, Dict, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover - tracing stays disabled
+    otel_trace = None
+
+
+class _NoopSpan:
+    """Stand-in returned by `start_span` while tracing is disabled"""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, exception: BaseException):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_tracer = None
+_provider = None
+
+
+def configure_tracing(service_name: str = "udaplay",
+                      endpoint: Optional[str] = None,
+                      exporter: Any = None,
+                      tracer_provider: Any = None,
+                      batch: bool = True) -> Any:
+    """
+    Enable OpenTelemetry tracing for state machines, LLM calls, tools and
+    vector store operations.
+
+    By default spans are sent through the OTLP/gRPC exporter, which honours
+    the standard `OTEL_EXPORTER_OTLP_*` environment variables. Pass an
+    `exporter` (e.g. `InMemorySpanExporter` or a local collector) to send
+    them elsewhere, or an already configured `tracer_provider` to reuse it.
+
+    Args:
+        service_name: Value of the `service.name` resource attribute
+        endpoint: Optional OTLP collector endpoint (e.g. "http://localhost:4317")
+        exporter: Optional span exporter to use instead of OTLP
+        tracer_provider: Optional existing TracerProvider; skips SDK setup
+        batch: Export spans in background batches (False exports synchronously)
+
+    Returns:
+        The TracerProvider spans are emitted to
+
+    Raises:
+        ImportError: If the OpenTelemetry SDK is not installed
+    """
+    global _tracer, _provider
+
+    if otel_trace is None:
+        raise ImportError("Tracing requires the `opentelemetry-sdk` package")
+
+    if tracer_provider is None:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+        if exporter is None:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+
+        tracer_provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        processor = BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter)
+        tracer_provider.add_span_processor(processor)
+
+    _provider = tracer_provider
+    _tracer = tracer_provider.get_tracer("udaplay.lib")
+    return tracer_provider
+
+
+def disable_tracing():
+    """Stop emitting spans and flush anything still buffered"""
+    global _tracer, _provider
+    provider = _provider
+    _tracer = None
+    _provider = None
+    if provider is not None and hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None):
+    """
+    Start a span as the current span, to be used as a context manager.
+
+    When tracing is disabled this returns a shared no-op span, so
+    instrumented code pays a single global lookup.
+
+    Example:
+        >>> with start_span("vector_store.query", {"n_results": 3}) as span:
+        ...     span.set_attribute("result_count", 3)
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return tracer.start_as_current_span(name, attributes=attributes)
@@ -1,12 +1,29 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import Callable, List, Optional, Dict, Any, Union
 from typing_extensions import TypedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import time
+
 import chromadb
-from chromadb.utils import embedding_functions
 from chromadb.api.models.Collection import Collection as ChromaCollection
 from chromadb.api.types import EmbeddingFunction, QueryResult, GetResult
 
 from lib.loaders import PDFLoader
 from lib.documents import Document, Corpus
+from lib.embeddings import get_embedding_function
+from lib.tracing import start_span
+
+
+logger = logging.getLogger("lib.vector_db")
+
+
+class IngestionError(Exception):
+    """Raised when chunks of a bulk write still fail after their retries"""
+
+    def __init__(self, message: str, failed_ids: List[str], errors: List[BaseException]):
+        super().__init__(message)
+        self.failed_ids = failed_ids
+        self.errors = errors
 
 
 class VectorStore:
@@ -25,50 +42,199 @@ class VectorStore:
     - Automatic embedding generation via OpenAI
     """
 
-    def __init__(self, chroma_collection: ChromaCollection):
+    def __init__(self, chroma_collection: ChromaCollection,
+                 embedding_function: Optional[EmbeddingFunction] = None):
         self._collection = chroma_collection
+        self.embedding_function = embedding_function or getattr(
+            chroma_collection, "_embedding_function", None
+        )
+
+    @property
+    def name(self) -> str:
+        return self._collection.name
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Collection-level metadata (e.g. schema version, embedding model)"""
+        return dict(self._collection.metadata or {})
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def update_metadata(self, metadata: Dict[str, Any]):
+        """Replace the collection-level metadata"""
+        self._collection.modify(metadata=metadata)
 
-    def add(self, item: Union[Document, Corpus, List[Document]]):
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts with the store's embedding function in a single call.
+
+        Lets callers embed once and reuse the vectors for both `query`
+        and `add` (via `query_embeddings` / `embeddings`).
+        """
+        if not texts:
+            return []
+        with start_span("vector_store.embed", {"collection": self.name, "text_count": len(texts)}):
+            return [list(map(float, vector)) for vector in self.embedding_function(texts)]
+
+    DEFAULT_BATCH_SIZE = 256
+
+    def add(self, item: Union[Document, Corpus, List[Document]],
+            embeddings: Optional[List[List[float]]] = None,
+            batch_size: Optional[int] = None, max_workers: int = 4,
+            max_retries: int = 2,
+            on_progress: Optional[Callable[[int, int], None]] = None):
         """
         Add documents to the vector store with automatic embedding generation.
         
         This method accepts various input formats and normalizes them to the
         ChromaDB batch format. Documents are automatically embedded using the
         collection's configured embedding function (typically OpenAI).
+
+        Large inputs are split into chunks of `batch_size` documents (capped
+        at Chroma's maximum batch size). Chunks are embedded concurrently on
+        a pool of `max_workers` threads and written as they complete; a
+        failing chunk is retried on its own with exponential backoff, so
+        one bad request doesn't redo the whole corpus.
         
         Args:
             item (Union[Document, Corpus, List[Document]]): Documents to add.
                 Can be a single Document, a Corpus collection, or a list of Documents.
+            embeddings (Optional[List[List[float]]]): Precomputed embeddings, one
+                per document, to store instead of embedding the contents again
+            batch_size (Optional[int]): Documents per chunk (default: 256)
+            max_workers (int): Chunks embedded at once (default: 4)
+            max_retries (int): Retries per failed chunk (default: 2)
+            on_progress (Optional[Callable[[int, int], None]]): Called with
+                (documents added so far, total documents) after each chunk
                 
         Raises:
             TypeError: If the input type is not supported or if a list contains
                 non-Document objects.
+            IngestionError: If some chunks still fail after their retries; the
+                other chunks are stored, and `failed_ids` lists what is missing
                 
         Example:
             >>> store.add(Document(content="AI is transforming healthcare"))
             >>> store.add([doc1, doc2, doc3])  # Batch add
             >>> store.add(Corpus([doc1, doc2]))  # Add corpus
+            >>> store.add(catalog, batch_size=500, max_workers=8,
+            ...           on_progress=lambda done, total: print(f"{done}/{total}"))
         """
+        self._write("add", self._as_corpus(item), embeddings, batch_size, max_workers,
+                    max_retries, on_progress)
+
+    def upsert(self, item: Union[Document, Corpus, List[Document]],
+               embeddings: Optional[List[List[float]]] = None,
+               batch_size: Optional[int] = None, max_workers: int = 4,
+               max_retries: int = 2,
+               on_progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Insert documents, or replace the stored ones with the same IDs.
+
+        Takes the same arguments as `add` and ingests in the same chunked,
+        concurrent way.
+        """
+        self._write("upsert", self._as_corpus(item), embeddings, batch_size, max_workers,
+                    max_retries, on_progress)
+
+    @staticmethod
+    def _as_corpus(item: Union[Document, Corpus, List[Document]]) -> Corpus:
         if isinstance(item, Document):
-            item = Corpus([item])
-        elif isinstance(item, list):
+            return Corpus([item])
+        if isinstance(item, list):
             if not all(isinstance(doc, Document) for doc in item):
                 raise TypeError("List must contain Document objects only.")
-            item = Corpus(item)
-        elif not isinstance(item, Corpus):
+            return Corpus(item)
+        if not isinstance(item, Corpus):
             raise TypeError("item must be Document, Corpus, or List[Document].")
+        return item
 
+    def _write(self, operation: str, item: Corpus, embeddings: Optional[List[List[float]]],
+               batch_size: Optional[int], max_workers: int, max_retries: int,
+               on_progress: Optional[Callable[[int, int], None]]):
         item_dict = item.to_dict()
+        total = len(item_dict["ids"])
+        size = max(1, min(batch_size or self.DEFAULT_BATCH_SIZE, self._max_batch_size()))
+        chunks = [(start, min(start + size, total)) for start in range(0, total, size)]
 
-        self._collection.add(
-            documents=item_dict["contents"],
-            ids=item_dict["ids"],
-            metadatas=item_dict["metadatas"]
-        )
+        attributes = {"collection": self._collection.name, "document_count": total, "chunk_count": len(chunks)}
+        with start_span(f"vector_store.{operation}", attributes):
+            if len(chunks) <= 1:
+                try:
+                    self._write_chunk(operation, item_dict, 0, total, embeddings, max_retries)
+                except Exception as e:
+                    raise IngestionError(
+                        f"{total} of {total} documents were not written to '{self._collection.name}'",
+                        list(item_dict["ids"]), [e],
+                    ) from e
+                if on_progress and total:
+                    on_progress(total, total)
+                return
+
+            done = 0
+            failed_ids: List[str] = []
+            errors: List[BaseException] = []
+            workers = max(1, min(max_workers, len(chunks)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vector-store-write") as pool:
+                futures = {
+                    pool.submit(self._write_chunk, operation, item_dict, start, end, embeddings, max_retries): (start, end)
+                    for start, end in chunks
+                }
+                for future in as_completed(futures):
+                    start, end = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed_ids.extend(item_dict["ids"][start:end])
+                        errors.append(e)
+                        continue
+                    done += end - start
+                    if on_progress:
+                        on_progress(done, total)
+
+            if failed_ids:
+                raise IngestionError(
+                    f"{len(failed_ids)} of {total} documents were not written to '{self._collection.name}'",
+                    failed_ids, errors,
+                )
+
+    def _max_batch_size(self) -> int:
+        client = getattr(self._collection, "_client", None)
+        try:
+            return client.get_max_batch_size()
+        except Exception:
+            return self.DEFAULT_BATCH_SIZE
 
-    def query(self, query_texts: str | List[str], n_results: int = 3,
+    def _write_chunk(self, operation: str, item_dict: Dict[str, List[Any]], start: int, end: int,
+                     embeddings: Optional[List[List[float]]], max_retries: int):
+        """Embed and write documents [start, end), retrying with backoff"""
+        attempt = 0
+        while True:
+            try:
+                vectors = embeddings[start:end] if embeddings is not None else None
+                if vectors is None and self.embedding_function is not None:
+                    vectors = self.embed(item_dict["contents"][start:end])
+                getattr(self._collection, operation)(
+                    documents=item_dict["contents"][start:end],
+                    ids=item_dict["ids"][start:end],
+                    metadatas=item_dict["metadatas"][start:end],
+                    embeddings=vectors
+                )
+                return
+            except Exception as e:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                logger.warning("Writing (%s) documents %d-%d to '%s' failed (%r), retry %d/%d",
+                               operation, start, end, self._collection.name, e, attempt, max_retries)
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 8.0))
+
+    def query(self, query_texts: Optional[str | List[str]] = None, n_results: int = 3,
               where: Optional[Dict[str, Any]] = None,
-              where_document: Optional[Dict[str, Any]] = None) -> QueryResult:
+              where_document: Optional[Dict[str, Any]] = None,
+              query_embeddings: Optional[List[List[float]]] = None,
+              include: Optional[List[str]] = None) -> QueryResult:
         """
         Perform semantic similarity search against stored documents.
         
@@ -83,6 +249,10 @@ class VectorStore:
                 ChromaDB query syntax (e.g., {"author": "Smith"})
             where_document (Optional[Dict[str, Any]]): Document content filter
                 conditions using ChromaDB query syntax
+            query_embeddings (Optional[List[List[float]]]): Precomputed query
+                vectors, used instead of `query_texts`
+            include (Optional[List[str]]): Fields to return (default: documents,
+                distances and metadatas)
                 
         Returns:
             QueryResult: ChromaDB query result containing documents, distances,
@@ -97,17 +267,25 @@ class VectorStore:
             >>> for doc, distance in zip(results['documents'][0], results['distances'][0]):
             ...     print(f"Similarity: {1-distance:.3f}, Content: {doc[:100]}...")
         """
-        return self._collection.query(
-            query_texts=query_texts,
-            n_results=n_results,
-            where=where,
-            where_document=where_document,
-            include=['documents', 'distances', 'metadatas']
-        )
+        attributes = {
+            "collection": self._collection.name,
+            "n_results": n_results,
+            "filtered": bool(where or where_document),
+        }
+        with start_span("vector_store.query", attributes):
+            return self._collection.query(
+                query_texts=query_texts,
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=where,
+                where_document=where_document,
+                include=include or ['documents', 'distances', 'metadatas']
+            )
 
     def get(self, ids: Optional[List[str]] = None, 
             where: Optional[Dict[str, Any]] = None,
-            limit: Optional[int] = None) -> GetResult:
+            limit: Optional[int] = None,
+            include: Optional[List[str]] = None) -> GetResult:
         """
         Retrieve documents by ID or metadata filters without similarity search.
         
@@ -119,6 +297,8 @@ class VectorStore:
             ids (Optional[List[str]]): Specific document IDs to retrieve
             where (Optional[Dict[str, Any]]): Metadata filter conditions
             limit (Optional[int]): Maximum number of documents to return
+            include (Optional[List[str]]): Fields to return (default: documents
+                and metadatas; add "embeddings" to reuse stored vectors)
             
         Returns:
             GetResult: ChromaDB result containing the requested documents
@@ -135,9 +315,16 @@ class VectorStore:
             ids=ids,
             where=where,
             limit=limit,
-            include=["documents", "metadatas"]
+            include=include or ["documents", "metadatas"]
         )
 
+    def delete(self, ids: List[str]):
+        """Remove documents by ID"""
+        if not ids:
+            return
+        with start_span("vector_store.delete", {"collection": self._collection.name, "document_count": len(ids)}):
+            self._collection.delete(ids=ids)
+
 class VectorStoreManager:
     """
     Factory and lifecycle manager for ChromaDB vector stores.
@@ -152,48 +339,92 @@ class VectorStoreManager:
     - OpenAI embedding function configuration
     - Vector store creation with consistent settings
     - Store lifecycle management (create, get, delete)
-    """
 
-    def __init__(self, openai_api_key: str):
-        self.chroma_client = chromadb.Client()
-        self.embedding_function = self._create_embedding_function(openai_api_key)
+    Stores live in memory unless `persist_directory` is given, in which
+    case collections and their embeddings are kept on disk and reattached
+    when the process restarts.
+
+    Embeddings come from OpenAI by default. `embedding_backend` selects a
+    local backend instead ("minilm" for the ONNX model shipped with Chroma,
+    "hashing" for deterministic test vectors); backends are shared per
+    process, so the model is loaded once. An `EmbeddingFunction` instance
+    can also be passed directly.
 
-    def _create_embedding_function(self, api_key: str) -> EmbeddingFunction:
-        embeddings_fn = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=api_key
+    Example:
+        >>> manager = VectorStoreManager(embedding_backend="minilm",
+        ...                              embedding_options={"num_threads": 2}, warm=True)
+    """
+
+    def __init__(self, openai_api_key: Optional[str] = None, persist_directory: Optional[str] = None,
+                 embedding_backend: Union[str, EmbeddingFunction] = "openai",
+                 embedding_options: Optional[Dict[str, Any]] = None, warm: bool = False):
+        self.persist_directory = persist_directory
+        if persist_directory:
+            self.chroma_client = chromadb.PersistentClient(path=persist_directory)
+        else:
+            self.chroma_client = chromadb.Client()
+        self.embedding_function = self._create_embedding_function(
+            openai_api_key, embedding_backend, embedding_options or {}, warm
         )
-        return embeddings_fn
+
+    def _create_embedding_function(self, api_key: Optional[str],
+                                   backend: Union[str, EmbeddingFunction] = "openai",
+                                   options: Optional[Dict[str, Any]] = None,
+                                   warm: bool = False) -> EmbeddingFunction:
+        if not isinstance(backend, str):
+            return backend
+        options = dict(options or {})
+        if backend == "openai" and api_key:
+            options.setdefault("api_key", api_key)
+        return get_embedding_function(backend, warm=warm, **options)
 
     def __repr__(self):
         return f"VectorStoreManager():{self.chroma_client}"
 
     def get_store(self, name: str) -> Optional[VectorStore]:
         try:
-            chroma_collection = self.chroma_client.get_collection(name)
-            return VectorStore(chroma_collection)
+            chroma_collection = self.chroma_client.get_collection(
+                name,
+                embedding_function=self.embedding_function
+            )
+            return VectorStore(chroma_collection, self.embedding_function)
         except Exception:
             return None
 
-    def create_store(self, store_name: str, force: bool = False) -> VectorStore:
+    def create_store(self, store_name: str, force: bool = False,
+                     metadata: Optional[Dict[str, Any]] = None) -> VectorStore:
         if force:
             self.delete_store(store_name)
 
         try:
             chroma_collection = self.chroma_client.create_collection(
                 name=store_name,
+                metadata=metadata,
                 embedding_function=self.embedding_function
             )
         except Exception as e:
             print(f"Pass `force=True` or use `get_or_create_store` method")
 
-        return VectorStore(chroma_collection)
+        return VectorStore(chroma_collection, self.embedding_function)
 
-    def get_or_create_store(self, store_name: str) -> VectorStore:
+    def get_or_create_store(self, store_name: str,
+                            metadata: Optional[Dict[str, Any]] = None) -> VectorStore:
         chroma_collection = self.chroma_client.get_or_create_collection(
             name=store_name,
+            metadata=metadata,
             embedding_function=self.embedding_function
         )
-        return VectorStore(chroma_collection)
+        return VectorStore(chroma_collection, self.embedding_function)
+
+    def list_stores(self) -> List[str]:
+        return [collection.name for collection in self.chroma_client.list_collections()]
+
+    def rename_store(self, store_name: str, new_name: str):
+        self.chroma_client.get_collection(store_name).modify(name=new_name)
+
+    def flush(self):
+        """Make pending writes durable (Chroma writes are already)"""
+        pass
 
     def delete_store(self, store_name: str):
         try:
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make `lib` importable when pytest runs from the starter directory or the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+from lib.agents import Agent
+from lib.checkpoint import SQLiteCheckpointer
+from lib.state_machine import Run
+from test_state_machine import _counter_machine
+
+
+def _agent_resuming(run):
+    agent = Agent(model_name="gpt-4o-mini", instructions="test")
+    agent.workflow = SimpleNamespace(checkpointer=None, resume=lambda run_id, checkpoint=None: run)
+    return agent
+
+
+def test_resume_stores_the_run_once():
+    run = Run.create()
+    agent = _agent_resuming(run)
+
+    agent.resume(run.run_id)
+    agent.resume(run.run_id)
+
+    runs = agent.get_session_runs()
+    assert [r.run_id for r in runs] == [run.run_id]
+
+
+def test_resume_loads_the_checkpoint_once(tmp_path):
+    loads = []
+
+    class CountingCheckpointer(SQLiteCheckpointer):
+        def load(self, run_id):
+            loads.append(run_id)
+            return super().load(run_id)
+
+    machine = _counter_machine(checkpointer=CountingCheckpointer(str(tmp_path / "runs.db")))
+    run = machine.run({"count": 0})
+    agent = Agent(model_name="gpt-4o-mini", instructions="test")
+    agent.workflow = machine
+
+    resumed = agent.resume(run.run_id)
+
+    assert resumed.run_id == run.run_id
+    assert loads == [run.run_id]
+
+
+def test_batch_deletes_its_own_sessions():
+    agent = Agent(model_name="gpt-4o-mini", instructions="test")
+
+    def invoke(query, session_id):
+        agent.memory.create_session(session_id)
+        return Run.create()
+
+    agent.invoke = invoke
+
+    result = agent.batch_invoke(["a", "b"])
+
+    assert all(item.ok and item.run for item in result.items)
+    assert agent.memory.get_all_sessions() == ["default"]
+
+
+def test_turns_share_one_conversation_buffer():
+    from test_server import _FakeLLM
+
+    agent = Agent(model_name="gpt-4o-mini", instructions="test")
+    agent._llm = _FakeLLM()
+    first = agent.invoke("Hi", "s")
+    second = agent.invoke("Again", "s")
+
+    logs = [s.state_data["messages"] for run in (first, second) for s in run.snapshots]
+    assert len({id(log._buffer) for log in logs if len(log)}) == 1
+    assert [m.content for m in second.get_final_state()["messages"]][-4:] == ["Hi", "Answer", "Again", "Answer"]
+    assert len(first.get_final_state()["messages"]) == 3
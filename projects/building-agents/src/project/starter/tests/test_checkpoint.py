@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from lib.checkpoint import DirectoryCheckpointer, SQLiteCheckpointer
+from test_state_machine import _counter_machine
+
+
+@pytest.fixture(params=["sqlite", "directory"])
+def checkpointer(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCheckpointer(str(tmp_path / "runs.db"))
+    return DirectoryCheckpointer(str(tmp_path / "runs"))
+
+
+def test_checkpoint_round_trips_every_snapshot(checkpointer):
+    machine = _counter_machine(limit=5, checkpointer=checkpointer)
+    run = machine.run({"count": 0})
+
+    checkpoint = checkpointer.load(run.run_id)
+
+    assert checkpoint.completed
+    assert [s.state_data["count"] for s in checkpoint.run.snapshots] == [0, 1, 2, 3, 4, 5]
+    assert [m.step_id for m in checkpoint.run.step_metrics] == [m.step_id for m in run.step_metrics]
+    assert checkpoint.run.status is run.status
+
+    assert checkpointer.delete(run.run_id)
+    assert checkpointer.load(run.run_id) is None
+    assert checkpointer.list_runs() == []
+
+
+def test_sqlite_writes_each_step_record_once(tmp_path):
+    path = str(tmp_path / "runs.db")
+    run = _counter_machine(limit=5, checkpointer=SQLiteCheckpointer(path)).run({"count": 0})
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT kind, COUNT(*) FROM checkpoint_records GROUP BY kind").fetchall()
+    assert dict(rows) == {"snapshots": len(run.snapshots), "step_metrics": len(run.step_metrics)}
+
+
+def test_directory_log_ignores_a_truncated_record(tmp_path):
+    directory = tmp_path / "runs"
+    machine = _counter_machine(limit=2, checkpointer=DirectoryCheckpointer(str(directory)))
+    run = machine.run({"count": 0})
+    records = directory / f"{run.run_id}.records"
+    size = records.stat().st_size
+    with open(records, "ab") as fp:
+        # A crash in the middle of appending the next record
+        fp.write(b"\x80\x05\x95garbage")
+
+    checkpointer = DirectoryCheckpointer(str(directory))
+    assert len(checkpointer.load(run.run_id).run.snapshots) == 3
+    checkpointer.save(checkpointer.load(run.run_id))
+    assert records.stat().st_size == size
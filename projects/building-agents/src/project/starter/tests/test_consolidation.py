@@ -0,0 +1,75 @@
+import json
+
+from lib.consolidation import MemoryConsolidator, cluster_embeddings
+from lib.local_vector_db import NumpyVectorStoreManager
+from lib.memory import LongTermMemory, MemoryFragment
+from lib.messages import AIMessage
+
+
+class _MergingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt, response_format=None):
+        self.calls += 1
+        groups = json.loads(prompt.split("# Groups:\n", 1)[1])
+        return AIMessage(content=json.dumps({"memories": [" / ".join(group) for group in groups]}))
+
+
+def _memory(contents):
+    memory = LongTermMemory(NumpyVectorStoreManager(embedding_backend="hashing"),
+                            flush_interval=None, dedup_threshold=None)
+    for i, content in enumerate(contents):
+        memory.register(MemoryFragment(content=content, owner="alice", timestamp=1000 + i))
+    return memory
+
+
+CONTENTS = [
+    "alice likes puzzle games on the switch",
+    "alice likes puzzle games on the nintendo switch",
+    "alice is looking for a new racing wheel",
+]
+
+
+def test_cluster_embeddings_groups_similar_rows():
+    vectors = [[1.0, 0.0], [0.99, 0.1], [0.0, 1.0], [0.05, 1.0]]
+    assert cluster_embeddings(vectors, threshold=0.9) == [[0, 1], [2, 3]]
+    assert cluster_embeddings(vectors, threshold=0.9, min_size=3) == []
+    assert cluster_embeddings([], threshold=0.9) == []
+
+
+def test_dry_run_reports_without_writing():
+    memory = _memory(CONTENTS)
+    llm = _MergingLLM()
+
+    report = MemoryConsolidator(memory, llm=llm, similarity_threshold=0.7).consolidate("alice", dry_run=True)
+
+    assert [c.contents for c in report.clusters] == [CONTENTS[:2]]
+    assert (report.fragments_before, report.fragments_after) == (3, 2)
+    assert llm.calls == 0
+    assert len(memory.get_records("alice")["ids"]) == 3
+
+
+def test_near_duplicates_are_merged_and_replaced():
+    memory = _memory(CONTENTS)
+    llm = _MergingLLM()
+
+    report = MemoryConsolidator(memory, llm=llm, similarity_threshold=0.7).consolidate("alice")
+
+    assert llm.calls == 1
+    assert report.fragments_after == 2
+    documents = sorted(memory.get_records("alice")["documents"])
+    assert documents == sorted([CONTENTS[2], " / ".join(CONTENTS[:2])])
+    merged = next(m for m, d in zip(memory.get_records("alice")["metadatas"],
+                                    memory.get_records("alice")["documents"]) if " / " in d)
+    assert merged["timestamp"] == 1001
+    assert memory.get_catalog("alice")[0].count == 2
+
+
+def test_owner_memories_are_bounded_by_evicting_the_oldest():
+    memory = _memory(["plays chess", "collects retro consoles", "streams speedruns"])
+
+    report = MemoryConsolidator(memory, llm=_MergingLLM(), max_fragments=2).consolidate("alice")
+
+    assert report.clusters == [] and len(report.evicted) == 1
+    assert sorted(memory.get_records("alice")["documents"]) == ["collects retro consoles", "streams speedruns"]
@@ -0,0 +1,83 @@
+import pytest
+
+from lib.embeddings import CachedEmbeddingFunction, EmbeddingBackend, HashingEmbeddings, get_embedding_function
+
+
+def test_shared_instance_per_backend_and_options():
+    first = get_embedding_function("hashing", dimensions=64)
+    assert get_embedding_function("hashing", dimensions=64) is first
+    assert get_embedding_function("hashing", dimensions=32) is not first
+
+
+def test_list_options_are_cacheable():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    providers = ["CPUExecutionProvider"]
+    function = get_embedding_function("minilm", preferred_providers=providers)
+    assert get_embedding_function("minilm", preferred_providers=list(providers)) is function
+
+
+def test_manager_accepts_list_options():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    from lib.vector_db import VectorStoreManager
+
+    manager = VectorStoreManager(embedding_backend="minilm",
+                                 embedding_options={"preferred_providers": ["CPUExecutionProvider"]})
+    assert manager.embedding_function.preferred_providers == ["CPUExecutionProvider"]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        get_embedding_function("nope")
+
+
+def test_hashing_is_deterministic_and_normalized():
+    a, b = HashingEmbeddings(dimensions=64)(["racing games", "racing games"])
+    assert (a == b).all()
+    assert abs(float((a * a).sum()) - 1.0) < 1e-5
+
+
+def test_backend_without_embed_batch_cannot_be_created():
+    class Incomplete(EmbeddingBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+class _CountingEmbeddings(HashingEmbeddings):
+    def __init__(self, dimensions=32):
+        super().__init__(dimensions=dimensions)
+        self.embedded = []
+
+    def _embed_batch(self, texts):
+        self.embedded.extend(texts)
+        return super()._embed_batch(texts)
+
+
+def test_cache_serves_vectors_from_disk_to_a_new_instance(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    first = _CountingEmbeddings()
+    vectors = CachedEmbeddingFunction(first, path)(["puzzle game", "racing game", "puzzle game"])
+
+    assert first.embedded == ["puzzle game", "racing game"]
+    second = _CountingEmbeddings()
+    cache = CachedEmbeddingFunction(second, path)
+    cached = cache(["racing game", "puzzle game", "new game"])
+
+    assert second.embedded == ["new game"]
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert all((a == b).all() for a, b in zip(cached[:2], [vectors[1], vectors[0]]))
+    assert len(cache) == 3
+
+
+def test_cache_keys_include_the_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    CachedEmbeddingFunction(_CountingEmbeddings(), path)(["puzzle game"])
+
+    other = _CountingEmbeddings()
+    other.model_name = "other-model"
+    CachedEmbeddingFunction(other, path)(["puzzle game"])
+
+    assert other.embedded == ["puzzle game"]
@@ -0,0 +1,87 @@
+import logging
+
+import pytest
+
+from lib.events import ConsoleListener, LoggingListener, StateMachineListener
+from test_state_machine import _counter_machine
+
+
+class _RecordingListener(StateMachineListener):
+    def __init__(self):
+        self.events = []
+
+    def on_step_start(self, run, step_id, state):
+        self.events.append(("start", step_id, state["count"]))
+
+    def on_step_end(self, run, step_id, state, metrics):
+        self.events.append(("end", step_id, state["count"], metrics.step_id))
+
+    def on_transition(self, run, source, target):
+        self.events.append(("transition", source, target))
+
+    def on_error(self, run, step_id, error):
+        self.events.append(("error", step_id, str(error)))
+
+
+def test_listener_receives_events_in_order():
+    machine = _counter_machine(limit=2)
+    listener = _RecordingListener()
+    machine.subscribe(listener)
+    machine.subscribe(listener)
+
+    machine.run({"count": 0})
+
+    assert listener.events == [
+        ("start", "__entry__", 0),
+        ("end", "__entry__", 0, "__entry__"),
+        ("transition", "__entry__", "increment"),
+        ("start", "increment", 0),
+        ("end", "increment", 1, "increment"),
+        ("transition", "increment", "increment"),
+        ("start", "increment", 1),
+        ("end", "increment", 2, "increment"),
+        ("transition", "increment", "__termination__"),
+    ]
+
+
+def test_listener_sees_errors_and_can_unsubscribe():
+    machine = _counter_machine()
+    listener = _RecordingListener()
+    machine.subscribe(listener)
+
+    def failing(state):
+        raise RuntimeError("boom")
+
+    machine.steps["increment"].logic = failing
+    with pytest.raises(RuntimeError):
+        machine.run({"count": 0})
+    assert listener.events[-1] == ("error", "increment", "boom")
+
+    machine.unsubscribe(listener)
+    machine.steps["increment"].logic = lambda state: {"count": 3}
+    count = len(listener.events)
+    machine.run({"count": 0})
+    assert len(listener.events) == count
+
+
+def test_logging_listener_emits_structured_records(caplog):
+    machine = _counter_machine(limit=1)
+    machine.subscribe(LoggingListener(logging.getLogger("test.events")))
+
+    with caplog.at_level(logging.DEBUG, logger="test.events"):
+        run = machine.run({"count": 0})
+
+    events = [(r.event, r.step_id) for r in caplog.records]
+    assert ("step_end", "increment") in events
+    assert ("transition", "increment") in events
+    assert all(r.run_id == run.run_id for r in caplog.records)
+
+
+def test_machines_without_listeners_print_nothing(capsys):
+    _counter_machine().run({"count": 0})
+    assert capsys.readouterr().out == ""
+
+    machine = _counter_machine(limit=1)
+    machine.subscribe(ConsoleListener())
+    machine.run({"count": 0})
+    assert "[StateMachine] Terminating: __termination__" in capsys.readouterr().out
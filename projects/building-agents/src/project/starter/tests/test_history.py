@@ -0,0 +1,113 @@
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+
+from lib.history import SUMMARY_PREFIX, SummarizingHistory, TokenBudgetWindow, estimate_tokens
+from lib.messages import AIMessage, MessageLog, SystemMessage, ToolMessage, UserMessage
+
+
+class _SummaryLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content=f"summary {len(self.prompts)}")
+
+
+def _conversation(turns, summary=None):
+    messages = [SystemMessage(content="Be brief")]
+    if summary is not None:
+        messages.append(SystemMessage(content=SUMMARY_PREFIX + summary))
+    for i in range(turns):
+        messages += [UserMessage(content=f"question {i} " + "x" * 200), AIMessage(content=f"answer {i}")]
+    return MessageLog(messages)
+
+
+def _summarize(history, messages, session_id):
+    history.apply(messages, session_id)
+    history._sessions[session_id].future.result()
+    return history.apply(messages, session_id)
+
+
+def test_summary_state_is_bounded_and_reset():
+    history = SummarizingHistory(max_tokens=200, llm=_SummaryLLM(), max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        _summarize(history, _conversation(6), session_id)
+
+    assert list(history._sessions) == ["b", "c"]
+    history.reset("b")
+    assert list(history._sessions) == ["c"]
+    history.reset()
+    assert not history._sessions
+    history.shutdown()
+
+
+def test_summary_is_picked_up_from_the_stored_history():
+    llm = _SummaryLLM()
+    history = SummarizingHistory(max_tokens=200, llm=llm)
+
+    # As after a restart: only the history stored with the last run is left
+    trimmed = _summarize(history, _conversation(6, summary="likes puzzle games"), "s")
+
+    assert "likes puzzle games" in llm.prompts[0]
+    assert trimmed[1].content == SUMMARY_PREFIX + "summary 1"
+    history.shutdown()
+
+
+def test_window_trims_old_turns_to_the_budget():
+    messages = _conversation(10)
+    window = TokenBudgetWindow(max_tokens=300)
+
+    trimmed = window.apply(messages, "s")
+
+    assert sum(estimate_tokens(m) for m in trimmed) <= 300
+    assert trimmed[0].content == "Be brief"
+    assert isinstance(trimmed[1], UserMessage)
+    assert list(trimmed)[-2:] == list(messages)[-2:]
+    assert window.apply(trimmed, "s") is trimmed
+
+
+def test_window_keeps_tool_results_with_their_call_and_the_current_turn():
+    call = ChatCompletionMessageToolCall(id="call-1", type="function",
+                                         function=Function(name="search", arguments="{}"))
+    messages = _conversation(4) + [
+        UserMessage(content="latest " + "y" * 2000),
+        AIMessage(content=None, tool_calls=[call]),
+        ToolMessage(content="result", tool_call_id="call-1", name="search"),
+    ]
+
+    trimmed = TokenBudgetWindow(max_tokens=100).apply(messages, "s")
+
+    # The current turn alone exceeds the budget and is kept whole
+    assert [type(m) for m in trimmed] == [SystemMessage, UserMessage, AIMessage, ToolMessage]
+
+
+def test_dropped_turns_are_summarized_in_the_background():
+    llm = _SummaryLLM()
+    history = SummarizingHistory(max_tokens=200, llm=llm)
+    messages = _conversation(6)
+
+    first = history.apply(messages, "s")
+    assert not any(m.content.startswith(SUMMARY_PREFIX) for m in first)
+
+    history._sessions["s"].future.result()
+    second = history.apply(messages, "s")
+
+    assert "question 0" in llm.prompts[0]
+    assert second[1].content == SUMMARY_PREFIX + "summary 1"
+    assert history.get_summary("s") == "summary 1"
+    history.shutdown()
+
+
+def test_agent_history_stays_within_the_budget():
+    from lib.agents import Agent
+    from test_server import _FakeLLM
+
+    agent = Agent(model_name="gpt-4o-mini", instructions="test", history=TokenBudgetWindow(max_tokens=120))
+    agent._llm = _FakeLLM()
+    for i in range(20):
+        run = agent.invoke(f"question {i} " + "x" * 80, "s")
+
+    messages = run.get_final_state()["messages"]
+    assert messages[0].content == "test"
+    assert messages[-2].content.startswith("question 19")
+    assert len(messages) < 10
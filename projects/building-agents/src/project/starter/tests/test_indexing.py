@@ -0,0 +1,65 @@
+from lib.documents import Document
+from lib.indexing import HASH_KEY, IncrementalIndexer
+from lib.local_vector_db import NumpyVectorStoreManager
+
+
+def _games(*names):
+    return [Document(id=name, content=f"{name} is a game", metadata={"genre": "puzzle"}) for name in names]
+
+
+def _store(tmp_path):
+    manager = NumpyVectorStoreManager(persist_directory=str(tmp_path / "db"), embedding_backend="hashing")
+    store = manager.create_store("games")
+    written = []
+    upsert = store.upsert
+
+    def recording_upsert(documents, **kwargs):
+        written.append([d.id for d in documents])
+        return upsert(documents, **kwargs)
+
+    store.upsert = recording_upsert
+    return store, written
+
+
+def test_sync_writes_only_the_diff(tmp_path):
+    store, written = _store(tmp_path)
+    indexer = IncrementalIndexer(store, tmp_path / "games.manifest.json")
+    assert indexer.sync(_games("tetris", "portal", "myst")).summary() == {
+        "added": 3, "changed": 0, "removed": 0, "unchanged": 0,
+    }
+
+    corpus = _games("tetris", "portal") + [Document(id="zelda", content="zelda is a game")]
+    corpus[1].content = "portal is a puzzle game"
+    diff = indexer.sync(corpus)
+
+    assert diff.summary() == {"added": 1, "changed": 1, "removed": 1, "unchanged": 1}
+    assert written[-1] == ["portal", "zelda"]
+    assert sorted(store.get()["ids"]) == ["portal", "tetris", "zelda"]
+    assert store.get(ids=["portal"])["documents"] == ["portal is a puzzle game"]
+
+    # Nothing changed: no writes at all
+    assert not indexer.sync(corpus).has_changes
+    assert len(written) == 2
+
+
+def test_manifest_is_rebuilt_from_the_store(tmp_path):
+    store, written = _store(tmp_path)
+    IncrementalIndexer(store, tmp_path / "games.manifest.json").sync(_games("tetris", "portal"))
+    (tmp_path / "games.manifest.json").unlink()
+
+    indexer = IncrementalIndexer(store, tmp_path / "games.manifest.json")
+    diff = indexer.sync(_games("tetris"))
+
+    assert diff.summary() == {"added": 0, "changed": 0, "removed": 1, "unchanged": 1}
+    assert len(written) == 1
+    assert store.get(ids=["tetris"])["metadatas"][0][HASH_KEY] == indexer.manifest["tetris"]
+
+
+def test_dry_run_writes_nothing(tmp_path):
+    store, written = _store(tmp_path)
+    indexer = IncrementalIndexer(store)
+
+    diff = indexer.sync(_games("tetris"), dry_run=True)
+
+    assert diff.added == ["tetris"]
+    assert written == [] and store.count() == 0
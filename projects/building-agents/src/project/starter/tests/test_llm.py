@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletionChunk
+
+from lib.llm import LLM
+
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    choices = [] if usage else [{"index": 0, "delta": {"content": content, "tool_calls": tool_calls}}]
+    return ChatCompletionChunk(id="c", object="chat.completion.chunk", created=0,
+                               model="gpt-4o-mini", choices=choices, usage=usage)
+
+
+def _llm_streaming(chunks):
+    llm = LLM(api_key="test")
+    requests = []
+
+    def create(**payload):
+        requests.append(payload)
+        return iter(chunks)
+
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return llm, requests
+
+
+def test_streamed_reply_is_assembled_and_forwarded():
+    llm, requests = _llm_streaming([
+        _chunk("Hel"),
+        _chunk("lo"),
+        _chunk(tool_calls=[{"index": 0, "id": "call_1", "function": {"name": "search", "arguments": '{"q": '}}]),
+        _chunk(tool_calls=[{"index": 0, "function": {"arguments": '"zelda"}'}}]),
+        _chunk(usage={"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}),
+    ])
+    deltas = []
+
+    message = llm.invoke("Hi", on_token=deltas.append)
+
+    assert requests[0]["stream"] is True
+    assert deltas == ["Hel", "lo"]
+    assert message.content == "Hello"
+    assert message.tool_calls[0].id == "call_1"
+    assert message.tool_calls[0].function.name == "search"
+    assert message.tool_calls[0].function.arguments == '{"q": "zelda"}'
+    assert message.token_usage.total_tokens == 5
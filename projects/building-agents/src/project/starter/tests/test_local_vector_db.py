@@ -0,0 +1,117 @@
+import pytest
+
+from lib.documents import Document
+from lib.local_vector_db import NumpyVectorStore, NumpyVectorStoreManager, _save_unsaved_stores
+
+
+def _documents(start, count):
+    return [Document(id=f"doc-{i}", content=f"game number {i}") for i in range(start, start + count)]
+
+
+def test_writes_are_saved_in_batches(tmp_path):
+    manager = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing",
+                                      save_interval=60)
+    store = manager.create_store("games")
+    for i in range(5):
+        store.add(_documents(i, 1))
+
+    reopened = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing")
+    assert reopened.get_store("games").count() == 0
+
+    manager.flush()
+    reopened = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing")
+    assert reopened.get_store("games").count() == 5
+
+
+def test_unsaved_stores_are_saved_at_exit(tmp_path):
+    manager = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing",
+                                      save_interval=60)
+    manager.create_store("games").add(_documents(0, 3))
+
+    _save_unsaved_stores()
+
+    reopened = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing")
+    assert reopened.get_store("games").count() == 3
+
+
+def test_deleted_store_is_not_saved_again(tmp_path):
+    manager = NumpyVectorStoreManager(persist_directory=str(tmp_path), embedding_backend="hashing",
+                                      save_interval=60)
+    manager.create_store("games").add(_documents(0, 3))
+    manager.delete_store("games")
+
+    _save_unsaved_stores()
+
+    assert not (tmp_path / "games").exists()
+
+
+def _indexed_manager(path, **index_options):
+    return NumpyVectorStoreManager(persist_directory=str(path), embedding_backend="hashing",
+                                   save_interval=0,
+                                   index_options={"min_train_size": 50, "n_lists": 8, **index_options})
+
+
+def test_store_shrunk_below_training_size_is_searched_exactly(tmp_path):
+    store = _indexed_manager(tmp_path).create_store("games")
+    store.add(_documents(0, 60))
+    assert store.index.trained
+
+    store.delete([f"doc-{i}" for i in range(20)])
+    store.index.search = None  # any approximate search would fail
+
+    result = store.query(query_texts=["game number 42"], n_results=1)
+    assert result["ids"] == [["doc-42"]]
+
+
+def test_saved_index_with_other_parameters_is_retrained(tmp_path):
+    store = _indexed_manager(tmp_path).create_store("games")
+    store.add(_documents(0, 60))
+    centroids = store.index.centroids
+
+    same = _indexed_manager(tmp_path).get_store("games")
+    assert same.index.trained and (same.index.centroids == centroids).all()
+
+    other = _indexed_manager(tmp_path, n_lists=4).get_store("games")
+    assert not other.index.trained
+    other.query(query_texts=["game number 1"], n_results=1)
+    assert len(other.index.centroids) == 4
+
+
+def test_equality_filters_match_like_python_equality():
+    store = NumpyVectorStoreManager(embedding_backend="hashing").create_store("games")
+    platforms = ["pc", "switch", None, "pc", 1, ["pc"]]
+    store.add([
+        Document(id=f"doc-{i}", content=f"game number {i}",
+                 metadata={"platform": p} if i != 2 else {"year": 2001})
+        for i, p in enumerate(platforms)
+    ])
+
+    def ids(where):
+        return store.get(where=where)["ids"]
+
+    assert ids({"platform": "pc"}) == ["doc-0", "doc-3"]
+    assert ids({"platform": {"$ne": "pc"}}) == ["doc-1", "doc-4", "doc-5"]
+    assert ids({"platform": {"$in": ["switch", True, "xbox"]}}) == ["doc-1", "doc-4"]
+    assert ids({"platform": {"$nin": ["pc"]}}) == ["doc-1", "doc-4", "doc-5"]
+    assert ids({"platform": ["pc"]}) == ["doc-5"]
+
+
+def test_empty_query_returns_empty_results():
+    store = NumpyVectorStoreManager(embedding_backend="hashing").create_store("games")
+    store.add(_documents(0, 3))
+
+    result = store.query(query_texts=[])
+
+    assert result["ids"] == [] and result["distances"] == []
+    assert store.query(query_embeddings=[])["ids"] == []
+
+
+def test_mismatched_batch_leaves_the_store_untouched():
+    store = NumpyVectorStore("games", embedding_function=lambda texts: [[1.0] * (len(t) % 3 + 2) for t in texts])
+
+    with pytest.raises(ValueError):
+        # Chunks embedded to different sizes: nothing may be written
+        store.add([Document(id=f"doc-{i}", content="x" * i) for i in range(3)], batch_size=1)
+
+    assert store.count() == 0
+    assert store.get()["ids"] == []
@@ -0,0 +1,329 @@
+import sqlite3
+import threading
+
+import pytest
+
+from lib.documents import Document
+from lib.messages import AIMessage, MessageLog, SystemMessage, UserMessage
+from lib.local_vector_db import NumpyVectorStoreManager
+from lib.memory import (
+    DirectorySessionStore, LongTermMemory, MemorySchemaError, ShortTermMemory, SQLiteSessionStore, MemoryFragment, RetrievalScoring,
+    _close_open_memories,
+)
+
+
+def _legacy_db():
+    """A manager holding a pre-v3 collection with memories of two owners"""
+    db = NumpyVectorStoreManager(embedding_backend="hashing")
+    legacy = db.create_store("long_term_memory")
+    legacy.add([
+        Document(id=f"{owner}-{i}", content=f"{owner} likes game {i}",
+                 metadata={"owner": owner, "namespace": "default"})
+        for owner in ("alice", "bob") for i in range(3)
+    ])
+    return db
+
+
+def _records(memory, owner):
+    return sorted(memory.get_records(owner)["ids"])
+
+
+@pytest.mark.parametrize("failing_rename", [1, 3])
+def test_interrupted_migration_is_recovered(failing_rename):
+    db = _legacy_db()
+    rename_store = db.rename_store
+    calls = []
+
+    def crashing_rename(name, new_name):
+        calls.append(name)
+        if len(calls) == failing_rename:
+            raise RuntimeError("crash")
+        rename_store(name, new_name)
+
+    db.rename_store = crashing_rename
+    with pytest.raises(RuntimeError):
+        LongTermMemory(db, flush_interval=None)
+    db.rename_store = rename_store
+
+    memory = LongTermMemory(db, flush_interval=None)
+    assert _records(memory, "alice") == ["alice-0", "alice-1", "alice-2"]
+    assert _records(memory, "bob") == ["bob-0", "bob-1", "bob-2"]
+    assert db.list_stores() == sorted(
+        memory.partition_name(owner, "default") for owner in ("alice", "bob")
+    )
+    memory.close()
+
+
+def test_unclosed_memories_are_flushed_at_exit():
+    db = NumpyVectorStoreManager(embedding_backend="hashing")
+    memory = LongTermMemory(db, flush_interval=None)
+    memory.register(MemoryFragment(content="likes puzzle games", owner="alice"))
+
+    _close_open_memories()
+
+    assert len(memory._pending) == 0
+    assert len(db.get_store(memory.partition_name("alice", "default")).get()["ids"]) == 1
+
+
+def test_scoring_defaults_are_not_shared():
+    db = NumpyVectorStoreManager(embedding_backend="hashing")
+    first = LongTermMemory(db, collection_name="first_memory", flush_interval=None)
+    second = LongTermMemory(db, collection_name="second_memory", flush_interval=None)
+    assert first.scoring == RetrievalScoring()
+    assert first.scoring is not second.scoring
+
+    unranked = LongTermMemory(db, collection_name="unranked_memory", flush_interval=None, scoring=False)
+    unranked.register(MemoryFragment(content="likes puzzle games", owner="alice"))
+    result = unranked.search("puzzle", owner="alice")
+    assert unranked.scoring is None
+    assert "scores" not in result.metadata
+    assert "scores" in unranked.search("puzzle", owner="alice", scoring=RetrievalScoring()).metadata
+
+
+def test_session_lock_survives_delete_and_eviction():
+    memory = ShortTermMemory(max_sessions=1)
+    memory.create_session("a")
+    with memory.session_lock("a"):
+        memory.delete_session("a")
+        memory.create_session("a")
+        memory.create_session("b")
+        # Still in use, so neither dropped nor replaced by a new lock
+        assert "a" in memory.sessions
+        results = []
+        other = threading.Thread(target=lambda: results.append(memory.session_lock("a").acquire(blocking=False)))
+        other.start()
+        other.join()
+        assert results == [False]
+    assert memory._session_locks == {}
+
+
+def _turns(store, session_id, log, start, count):
+    for i in range(start, start + count):
+        before = log
+        log = log + [UserMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+        # Like a run: every snapshot holds a view of the whole conversation
+        store.append(session_id, [{"turn": i, "snapshots": [before, log]}])
+    return log
+
+
+def test_sqlite_store_keeps_each_message_once(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SQLiteSessionStore(path)
+    log = _turns(store, "s", MessageLog([SystemMessage(content="Be brief")]), 0, 5)
+
+    # A second process continues the conversation it loads back
+    other = SQLiteSessionStore(path)
+    loaded = other.load("s")
+    _turns(other, "s", loaded[-1]["snapshots"][-1], 5, 5)
+
+    runs = SQLiteSessionStore(path).load("s")
+    assert [run["turn"] for run in runs] == list(range(10))
+    final = runs[-1]["snapshots"][-1]
+    assert len(final) == 21
+    assert final[-1].content == "answer 9"
+    assert runs[4]["snapshots"][-1] == log
+    assert len(runs[0]["snapshots"][0]) == 1
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 21
+
+    assert [run["turn"] for run in SQLiteSessionStore(path).load("s", limit=2)] == [8, 9]
+    store.delete("s")
+    assert conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 0
+
+
+def test_run_size_estimate_counts_only_new_messages():
+    memory = ShortTermMemory(max_bytes=10**9)
+    log = MessageLog()
+    for i in range(50):
+        log = log + [UserMessage(content=f"question {i:03}"), AIMessage(content=f"answer {i:03}")]
+        memory.add({"snapshots": [log]})
+
+    sizes = memory._sizes["default"]
+    assert max(sizes) - min(sizes) < 50
+    assert memory.total_bytes == sum(sizes)
+
+
+def test_full_reset_empties_spilled_sessions(tmp_path):
+    memory = ShortTermMemory(max_sessions=2, store=DirectorySessionStore(str(tmp_path)))
+    for session_id in ("a", "b"):
+        memory.create_session(session_id)
+        memory.add({"turn": 1}, session_id)
+    assert "a" not in memory.sessions
+
+    memory.reset()
+
+    assert memory.get_all_objects("a") == ()
+    assert memory.get_all_objects("b") == ()
+
+
+def test_read_reloads_a_session_evicted_after_validation(tmp_path):
+    memory = ShortTermMemory(max_sessions=3, store=DirectorySessionStore(str(tmp_path)))
+    memory.create_session("a")
+    memory.add({"turn": 1}, "a")
+    validate = memory._validate_session
+    calls = []
+
+    def validate_then_evict(session_id):
+        validate(session_id)
+        calls.append(session_id)
+        if len(calls) % 2:
+            # Another thread evicts the session right after the first check
+            with memory._lock:
+                memory._evict(session_id)
+
+    memory._validate_session = validate_then_evict
+    assert memory.get_last_object("a") == {"turn": 1}
+    assert memory.get_all_objects("a") == ({"turn": 1},)
+
+
+def test_trimmed_runs_leave_the_byte_budget():
+    memory = ShortTermMemory(max_runs_per_session=2, max_bytes=10**9)
+    for i in range(5):
+        memory.add({"turn": i, "text": "x" * 100 * (i + 1)})
+
+    assert [run["turn"] for run in memory.get_all_objects()] == [3, 4]
+    assert len(memory._sizes["default"]) == 2
+    assert memory.total_bytes == sum(memory._sizes["default"])
+
+
+def test_directory_store_removes_temp_file_when_save_fails(tmp_path):
+    store = DirectorySessionStore(str(tmp_path))
+    with pytest.raises(Exception):
+        store.save("s", [lambda: None])
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sqlite_store_pops_each_object_once(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).save("s", list(range(40)))
+    popped = []
+
+    def worker():
+        # A store per thread, like separate worker processes
+        store = SQLiteSessionStore(path)
+        while (obj := store.pop("s")) is not None:
+            popped.append(obj)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(popped) == list(range(40))
+
+
+def test_replace_rolls_back_merged_rows_when_delete_fails():
+    db = NumpyVectorStoreManager(embedding_backend="hashing")
+    memory = LongTermMemory(db, flush_interval=None)
+    for content in ("likes puzzle games", "enjoys puzzle games"):
+        memory.register(MemoryFragment(content=content, owner="alice"))
+    memory.flush()
+    before = _records(memory, "alice")
+    store = db.get_store(memory.partition_name("alice", "default"))
+    delete = store.delete
+    calls = []
+
+    def failing_delete(ids):
+        calls.append(ids)
+        if len(calls) == 1:
+            raise RuntimeError("crash")
+        delete(ids)
+
+    store.delete = failing_delete
+    with pytest.raises(RuntimeError):
+        memory.replace("alice", "default", before, [MemoryFragment(content="likes puzzles", owner="alice")])
+
+    assert _records(memory, "alice") == before
+    memory.close()
+
+
+def test_reads_return_the_stored_objects():
+    memory = ShortTermMemory()
+    run = {"turn": 1, "messages": ["hi"]}
+    memory.add(run)
+
+    stored = memory.get_last_object()
+    assert stored == run and stored is not run
+    assert memory.get_last_object() is stored
+    objects = memory.get_all_objects()
+    assert isinstance(objects, tuple) and objects[0] is stored
+
+    memory.add({"turn": 2})
+    # A sequence handed out earlier does not change afterwards
+    assert len(objects) == 1
+
+
+def test_copy_on_read_returns_private_copies():
+    memory = ShortTermMemory(copy_on_read=True)
+    memory.add({"turn": 1, "messages": ["hi"]})
+
+    copy = memory.get_last_object()
+    copy["messages"].append("changed")
+
+    assert memory.get_last_object() == {"turn": 1, "messages": ["hi"]}
+    assert memory.get_all_objects()[0] is not memory.get_all_objects()[0]
+
+
+def _persistent_db(path):
+    return NumpyVectorStoreManager(persist_directory=str(path), embedding_backend="hashing")
+
+
+def test_memories_survive_reopening(tmp_path):
+    memory = LongTermMemory(_persistent_db(tmp_path), flush_interval=None)
+    memory.register(MemoryFragment(content="likes puzzle games", owner="alice"))
+    memory.close()
+    stored = memory.get_records("alice", include_embeddings=True)
+
+    reopened = LongTermMemory(_persistent_db(tmp_path), flush_interval=None)
+
+    records = reopened.get_records("alice", include_embeddings=True)
+    assert records["documents"] == ["likes puzzle games"]
+    assert records["ids"] == stored["ids"]
+    assert (records["embeddings"][0] == stored["embeddings"][0]).all()
+    reopened.close()
+
+
+def test_reopening_with_another_embedding_model_fails_unless_reset(tmp_path):
+    memory = LongTermMemory(_persistent_db(tmp_path), flush_interval=None)
+    memory.register(MemoryFragment(content="likes puzzle games", owner="alice"))
+    memory.close()
+    db = _persistent_db(tmp_path)
+    store = db.get_store(memory.partition_name("alice", "default"))
+    store.update_metadata({**store.metadata, "embedding_function": "openai:text-embedding-3-small"})
+
+    with pytest.raises(MemorySchemaError):
+        LongTermMemory(db, flush_interval=None)
+
+    reset = LongTermMemory(db, flush_interval=None, reset=True)
+    assert reset.get_records("alice")["ids"] == []
+    assert reset.get_namespaces() == []
+    reset.close()
+
+
+def test_catalog_counts_follow_registrations_and_deletes(tmp_path):
+    memory = LongTermMemory(_persistent_db(tmp_path), flush_interval=None, dedup_threshold=None)
+    for owner, namespace, content in [
+        ("alice", "default", "likes puzzle games"),
+        ("alice", "default", "plays on switch"),
+        ("alice", "reviews", "loved the latest zelda"),
+        ("bob", "default", "prefers shooters"),
+    ]:
+        memory.register(MemoryFragment(content=content, owner=owner, namespace=namespace))
+
+    counts = {(e.owner, e.namespace): e.count for e in memory.get_catalog()}
+    assert counts == {("alice", "default"): 2, ("alice", "reviews"): 1, ("bob", "default"): 1}
+    assert memory.get_namespaces() == ["default", "reviews"]
+    assert memory.get_namespaces("bob") == ["default"]
+
+    removed = memory.get_records("alice")["ids"][0]
+    assert memory.replace("alice", "default", [removed], []) == 1
+    memory.close()
+
+    # Another process reads the catalog without scanning any memory
+    other = LongTermMemory(_persistent_db(tmp_path), flush_interval=None)
+    entry = other.get_catalog("alice", refresh=True)[0]
+    assert (entry.namespace, entry.count) == ("default", 1)
+    other.close()
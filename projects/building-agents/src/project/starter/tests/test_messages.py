@@ -0,0 +1,48 @@
+import copy
+import pickle
+
+import pytest
+
+from lib.messages import AIMessage, MessageLog, SystemMessage, UserMessage
+
+
+def _log():
+    return MessageLog([SystemMessage(content="Be brief")])
+
+
+def test_appending_to_the_newest_view_shares_the_buffer():
+    first = _log()
+    second = first + [UserMessage(content="Hi")]
+    third = second + [AIMessage(content="Hello")]
+
+    assert third._buffer is first._buffer
+    assert [len(first), len(second), len(third)] == [1, 2, 3]
+    assert list(second) == list(third)[:2]
+    assert third.prefix(2) == second and third.prefix(2)._buffer is first._buffer
+    with pytest.raises(IndexError):
+        second.prefix(3)
+
+
+def test_older_views_never_see_later_messages():
+    base = _log() + [UserMessage(content="Hi")]
+    newer = base + [AIMessage(content="first answer")]
+
+    # Branching from the older view must not change `newer`
+    branch = base + [AIMessage(content="second answer")]
+
+    assert branch._buffer is not base._buffer
+    assert [m.content for m in newer] == ["Be brief", "Hi", "first answer"]
+    assert [m.content for m in branch] == ["Be brief", "Hi", "second answer"]
+    assert len(base) == 2 and base[-1].content == "Hi"
+    with pytest.raises(IndexError):
+        base[2]
+
+
+def test_copies_are_the_log_itself_and_pickles_hold_only_the_view():
+    log = _log() + [UserMessage(content="Hi")]
+    log + [AIMessage(content="not in the view")]
+
+    assert copy.copy(log) is log
+    assert copy.deepcopy({"messages": log})["messages"] is log
+    restored = pickle.loads(pickle.dumps(log))
+    assert restored == log and len(restored._buffer.items) == 2
@@ -0,0 +1,48 @@
+import time
+
+from lib.metrics import measure_step, percentile, record_tokens
+from test_state_machine import _counter_machine
+
+
+def test_run_records_metrics_for_every_step():
+    machine = _counter_machine(limit=3, trace_memory=True)
+
+    def increment(state):
+        record_tokens(10)
+        buffer = bytearray(1 << 20)
+        time.sleep(0.005)
+        return {"count": state["count"] + len(buffer) // (1 << 20)}
+
+    machine.steps["increment"].logic = increment
+    run = machine.run({"count": 0})
+
+    assert [m.step_id for m in run.step_metrics] == ["__entry__", "increment", "increment", "increment"]
+    for m in run.step_metrics[1:]:
+        assert m.duration >= 0.005
+        assert m.cpu_time >= 0
+        assert m.tokens == 10
+        assert m.peak_memory >= 1 << 20
+
+    stats = run.step_stats()
+    assert stats["increment"].count == 3
+    assert stats["increment"].total_tokens == 30
+    assert stats["increment"].p50_duration <= stats["increment"].p95_duration
+    assert stats["__entry__"].total_tokens == 0
+
+
+def test_tokens_are_attributed_to_enclosing_steps():
+    with measure_step("outer") as outer:
+        record_tokens(5)
+        with measure_step("inner") as inner:
+            record_tokens(7)
+    record_tokens(100)
+
+    assert (inner.tokens, outer.tokens) == (7, 12)
+    assert outer.peak_memory is None
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile([], 95) == 0.0
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from lib.agents import Agent
+from lib.messages import AIMessage
+from lib.server import AgentServer
+
+
+class _FakeLLM:
+    def invoke(self, messages, on_token=None):
+        for delta in ("Ans", "wer"):
+            if on_token:
+                on_token(delta)
+        return AIMessage(content="Answer")
+
+
+def _post(app, path, body):
+    sent = []
+    received = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app({"type": "http", "method": "POST", "path": path}, receive, send))
+    return sent
+
+
+def test_stream_sends_token_deltas_before_the_answer():
+    agent = Agent(model_name="gpt-4o-mini", instructions="test")
+    agent._llm = _FakeLLM()
+    app = AgentServer(agent)
+
+    sent = _post(app, "/sessions/s1/messages/stream", {"query": "Hi"})
+
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body").decode()
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in body.strip().split("\n\n")
+    ]
+    names = [name for name, _ in events]
+    assert [data["delta"] for name, data in events if name == "token"] == ["Ans", "wer"]
+    assert names.index("token") < names.index("answer")
+    assert events[-1][1]["answer"] == "Answer"
+    agent.shutdown()
+
+
+class _LoggingAgent(Agent):
+    """Mirrors the submission agents, which wrap ``invoke`` positionally."""
+
+    def invoke(self, query, session_id=None, cancellation_token=None, on_token=None):
+        return super().invoke(query, session_id, cancellation_token, on_token=on_token)
+
+
+def test_stream_goes_through_subclass_invoke_overrides():
+    agent = _LoggingAgent(model_name="gpt-4o-mini", instructions="test")
+    agent._llm = _FakeLLM()
+    app = AgentServer(agent)
+
+    sent = _post(app, "/sessions/s1/messages/stream", {"query": "Hi"})
+
+    assert sent[0]["status"] == 200
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body").decode()
+    assert "event: token" in body and "event: answer" in body
+    agent.shutdown()
+
+
+def test_event_sink_is_cleared_after_each_query():
+    from lib.server import _event_sink
+
+    agent = Agent(model_name="gpt-4o-mini", instructions="test", max_workers=1)
+    agent._llm = _FakeLLM()
+    app = AgentServer(agent)
+
+    _post(app, "/sessions/s1/messages/stream", {"query": "Hi"})
+
+    assert agent.executor.submit(_event_sink.get).result() is None
+    agent.shutdown()
@@ -0,0 +1,129 @@
+from typing import TypedDict
+import time
+
+import pytest
+
+from lib.checkpoint import SQLiteCheckpointer
+from lib.state_machine import (
+    CancellationToken, EntryPoint, RunCancelledError, RunLimits, RunStatus, StateMachine, Step, Termination,
+    current_cancellation_token,
+)
+
+
+class CounterState(TypedDict):
+    count: int
+
+
+def _counter_machine(limit=3, **kwargs):
+    machine = StateMachine[CounterState](CounterState, **kwargs)
+    entry = EntryPoint[CounterState]()
+    increment = Step[CounterState]("increment", lambda state: {"count": state["count"] + 1})
+    termination = Termination[CounterState]()
+    machine.add_steps([entry, increment, termination])
+    machine.connect(entry, increment)
+    machine.connect(increment, [increment, termination],
+                    lambda state: increment if state["count"] < limit else termination)
+    return machine
+
+
+def test_run_timeout_leaves_the_caller_token_untouched():
+    machine = _counter_machine()
+    token = CancellationToken()
+    seen = []
+    machine.steps["increment"].logic = lambda state: seen.append(current_cancellation_token()) or {
+        "count": state["count"] + 1
+    }
+
+    run = machine.run({"count": 0}, limits=RunLimits(run_timeout=60, step_timeout=30),
+                      cancellation_token=token)
+
+    assert run.status is RunStatus.COMPLETED
+    assert token.deadline is None and token.step_deadline is None
+    # Steps see a run token that still follows the caller's
+    assert seen[0] is not token and seen[0].parent is token
+    token.cancel("stop")
+    assert seen[0].status is RunStatus.CANCELLED
+
+
+def test_cancelled_run_is_checkpointed_for_resume(tmp_path):
+    machine = _counter_machine(limit=4, checkpointer=SQLiteCheckpointer(str(tmp_path / "runs.db")))
+    token = CancellationToken()
+
+    def increment(state):
+        if state["count"] == 2:
+            token.cancel("shutdown")
+            current_cancellation_token().raise_if_cancelled()
+        return {"count": state["count"] + 1}
+
+    machine.steps["increment"].logic = increment
+    run = machine.run({"count": 0}, cancellation_token=token)
+
+    assert run.status is RunStatus.CANCELLED
+    checkpoint = machine.checkpointer.load(run.run_id)
+    assert not checkpoint.completed
+    assert checkpoint.next_step_id == "increment"
+    assert checkpoint.run.status is RunStatus.CANCELLED
+    assert checkpoint.state == {"count": 2}
+
+    resumed = machine.resume(run.run_id)
+    assert resumed.status is RunStatus.COMPLETED
+    assert resumed.get_final_state() == {"count": 4}
+    assert machine.checkpointer.load(run.run_id).completed
+
+
+def test_step_timeout_checkpoints_the_following_step(tmp_path):
+    machine = _counter_machine(limit=3, checkpointer=SQLiteCheckpointer(str(tmp_path / "runs.db")))
+
+    def slow_increment(state):
+        time.sleep(0.02)
+        return {"count": state["count"] + 1}
+
+    machine.steps["increment"].logic = slow_increment
+    run = machine.run({"count": 0}, limits=RunLimits(step_timeout=0.01))
+
+    assert run.status is RunStatus.TIMED_OUT
+    checkpoint = machine.checkpointer.load(run.run_id)
+    # The entry step finished in time; the first increment kept its result
+    assert (checkpoint.step_id, checkpoint.next_step_id) == ("increment", "increment")
+    assert checkpoint.state == {"count": 1}
+
+
+@pytest.mark.parametrize("limits, status, steps", [
+    (RunLimits(), RunStatus.COMPLETED, 6),
+    (RunLimits(max_steps=3), RunStatus.MAX_STEPS_EXCEEDED, 3),
+    (RunLimits(max_visits_per_step=2), RunStatus.MAX_STEPS_EXCEEDED, 3),
+])
+def test_step_limits_end_the_run_with_their_status(limits, status, steps):
+    run = _counter_machine(limit=5).run({"count": 0}, limits=limits)
+
+    assert run.status is status
+    assert len(run.step_metrics) == steps
+    assert run.end_timestamp is not None
+    assert run.metadata["status"] == status.value
+
+
+def test_run_timeout_stops_between_steps():
+    machine = _counter_machine(limit=100)
+
+    def slow_increment(state):
+        time.sleep(0.01)
+        return {"count": state["count"] + 1}
+
+    machine.steps["increment"].logic = slow_increment
+    run = machine.run({"count": 0}, limits=RunLimits(run_timeout=0.03))
+
+    assert run.status is RunStatus.TIMED_OUT
+    assert 1 <= run.get_final_state()["count"] < 100
+
+
+def test_cancelled_token_stops_the_run_before_the_next_step():
+    machine = _counter_machine(limit=5)
+    token = CancellationToken()
+    token.cancel("user left")
+
+    run = machine.run({"count": 0}, cancellation_token=token)
+
+    assert run.status is RunStatus.CANCELLED
+    assert run.step_metrics == [] and run.get_final_state() is None
+    with pytest.raises(RunCancelledError, match="user left"):
+        token.raise_if_cancelled()
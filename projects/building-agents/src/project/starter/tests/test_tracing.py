@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from lib.documents import Document
+from lib.local_vector_db import NumpyVectorStoreManager
+from lib.tracing import _NOOP_SPAN, configure_tracing, disable_tracing, start_span, tracing_enabled
+from test_state_machine import _counter_machine
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemorySpanExporter()
+    configure_tracing(exporter=exporter, batch=False)
+    yield exporter
+    disable_tracing()
+
+
+def test_disabled_tracing_returns_the_noop_span():
+    assert not tracing_enabled()
+    with start_span("anything", {"key": 1}) as span:
+        span.set_attribute("other", 2)
+    assert span is _NOOP_SPAN
+
+
+def test_run_spans_nest_steps_under_the_run(exporter):
+    run = _counter_machine(limit=2).run({"count": 0})
+
+    spans = exporter.get_finished_spans()
+    run_span = next(s for s in spans if s.name == "state_machine.run")
+    steps = [s for s in spans if s.name == "state_machine.step"]
+    assert run_span.attributes["run_id"] == run.run_id
+    assert run_span.attributes["status"] == "completed"
+    assert run_span.attributes["step_count"] == 3
+    assert [s.attributes["step_id"] for s in steps] == ["__entry__", "increment", "increment"]
+    assert all(s.parent.span_id == run_span.context.span_id for s in steps)
+
+
+def test_vector_store_operations_are_traced(exporter):
+    store = NumpyVectorStoreManager(embedding_backend="hashing").create_store("games")
+    store.add([Document(id="a", content="puzzle game")])
+    store.query("puzzle", n_results=1)
+
+    names = [s.name for s in exporter.get_finished_spans()]
+    assert "local_vector_store.add" in names
+    query = next(s for s in exporter.get_finished_spans() if s.name == "local_vector_store.query")
+    assert query.attributes["collection"] == "games"
+    assert query.attributes["n_results"] == 1
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+import pytest
+
+from lib.documents import Document
+from lib.vector_db import IngestionError, VectorStore
+
+
+def _failing_store():
+    def add(**kwargs):
+        raise ConnectionError("collection unavailable")
+
+    return VectorStore(SimpleNamespace(name="games", add=add, upsert=add))
+
+
+@pytest.mark.parametrize("batch_size", [None, 1])
+def test_failed_writes_raise_ingestion_error(batch_size):
+    documents = [Document(id=f"doc-{i}", content=f"game {i}") for i in range(3)]
+
+    with pytest.raises(IngestionError) as info:
+        _failing_store().add(documents, batch_size=batch_size, max_retries=0)
+
+    assert sorted(info.value.failed_ids) == ["doc-0", "doc-1", "doc-2"]
+    assert all(isinstance(e, ConnectionError) for e in info.value.errors)
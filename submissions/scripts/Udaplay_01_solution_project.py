@@ -36,6 +36,8 @@ if str(PROJECT_LIB) not in sys.path:
 
 from lib.documents import Document, Corpus  # noqa: E402
 from lib.vector_db import VectorStoreManager, VectorStore  # noqa: E402
+from lib.embeddings import CachedEmbeddingFunction  # noqa: E402
+from lib.indexing import IncrementalIndexer  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # 1.  Load and explore game data
@@ -122,10 +124,13 @@ class VocareumVectorStoreManager:
 
     def _create_embedding_function(self, api_key: str):
         if api_key.startswith("voc-"):
-            return embedding_functions.OpenAIEmbeddingFunction(
+            function = embedding_functions.OpenAIEmbeddingFunction(
                 api_key=api_key, api_base="https://openai.vocareum.com/v1"
             )
-        return embedding_functions.OpenAIEmbeddingFunction(api_key=api_key)
+        else:
+            function = embedding_functions.OpenAIEmbeddingFunction(api_key=api_key)
+        # Re-indexing only pays for descriptions that are new or changed
+        return CachedEmbeddingFunction(function, "./embedding_cache.sqlite")
 
     # Public helpers --------------------------------------------------------
     def create_store(self, name: str, force: bool = False) -> VectorStore:
@@ -149,12 +154,15 @@ class VocareumVectorStoreManager:
 # 4.  Index documents into ChromaDB
 # ---------------------------------------------------------------------------
 
-def index_documents(corpus: Corpus, store_name: str = "udaplay_games") -> VectorStore:
+def index_documents(corpus: Corpus, store_name: str = "udaplay_games",
+                    rebuild: bool = False) -> VectorStore:
     vector_manager = VocareumVectorStoreManager(CHROMA_OPENAI_API_KEY)
-    vec_store = vector_manager.create_store(store_name, force=True)
-    print("Adding documents to vector store – this may take a moment…")
-    vec_store.add(corpus)
-    print(f"Successfully indexed {len(corpus)} documents into '{store_name}'")
+    vec_store = vector_manager.create_store(store_name, force=rebuild)
+    # Only new, changed and removed games are written on re-runs
+    indexer = IncrementalIndexer(vec_store, f"./chroma_db/{store_name}.manifest.json")
+    print("Syncing documents with the vector store – this may take a moment…")
+    diff = indexer.sync(corpus)
+    print(f"Indexed {len(corpus)} documents into '{store_name}': {diff.summary()}")
     return vec_store
 
 # ---------------------------------------------------------------------------
@@ -48,6 +48,7 @@ from lib.tooling import tool, Tool
 from lib.vector_db import VectorStoreManager
 from lib.state_machine import StateMachine, Step, EntryPoint, Termination
 from lib.messages import AIMessage, UserMessage, SystemMessage, ToolMessage
+from lib.events import ConsoleListener
 
 # Load env vars
 load_dotenv()
@@ -289,7 +290,7 @@ def game_web_search(query: str) -> Dict:
 class UdaPlayAgent(Agent):
     """Agent that follows RAG → Evaluate → Web Search workflow."""
 
-    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7):
+    def __init__(self, model_name: str = "gpt-4o-mini", temperature: float = 0.7, verbose: bool = True):
         instructions = (
             "You are UdaPlay, an AI research assistant specializing in video game information.\n\n"
             "Workflow:\n"
@@ -309,12 +310,19 @@ class UdaPlayAgent(Agent):
             tools=[retrieve_game, evaluate_retrieval, game_web_search],
             temperature=temperature,
         )
-
-    def invoke(self, query: str, session_id: Optional[str] = None):
+        self.verbose = verbose
+        if verbose:
+            # Show step progress on the console, as the notebook version does
+            self.workflow.subscribe(ConsoleListener())
+
+    def invoke(self, query: str, session_id: Optional[str] = None, cancellation_token=None,
+               on_token=None):
+        if not self.verbose:
+            return super().invoke(query, session_id, cancellation_token, on_token=on_token)
         print("=" * 60)
         print(f"Processing query: '{query}'")
         print("=" * 60)
-        result = super().invoke(query, session_id)
+        result = super().invoke(query, session_id, cancellation_token, on_token=on_token)
         final_state = result.get_final_state()
         if final_state and "total_tokens" in final_state:
             print(f"💬 Total tokens used: {final_state['total_tokens']}")
@@ -0,0 +1,61 @@
+"""UdaPlay Agent Server
+
+Serves a single, long-lived `UdaPlayAgent` over HTTP/SSE/WebSocket so the
+vector store connection, LLM client and session memory stay warm across
+requests instead of being rebuilt per process.
+
+Usage:
+    python submissions/scripts/udaplay_server.py --port 8000
+
+    curl -X POST localhost:8000/sessions/demo/messages \\
+         -H "content-type: application/json" \\
+         -d '{"query": "When was Pokémon Gold and Silver released?"}'
+
+Prerequisites:
+    Same as `Udaplay_02_solution_project.py` (a `.env` file with the API keys
+    and the `udaplay_games` vector store built by Part 1), plus `uvicorn`.
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Importing the Part 2 script loads the environment and connects to the vector store
+from Udaplay_02_solution_project import UdaPlayAgent  # noqa: E402
+from lib.server import AgentServer  # noqa: E402
+
+
+def build_app(max_concurrency: int = 8, max_queue: int = 64, drain_timeout: float = 30.0) -> AgentServer:
+    agent = UdaPlayAgent(verbose=False)
+    return AgentServer(
+        agent,
+        max_concurrency=max_concurrency,
+        max_queue=max_queue,
+        drain_timeout=drain_timeout,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the UdaPlay agent over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    app = build_app(args.max_concurrency, args.max_queue, args.drain_timeout)
+    uvicorn.run(
+        app,
+        host=args.host,
+        port=args.port,
+        timeout_graceful_shutdown=int(args.drain_timeout),
+    )
+
+
+if __name__ == "__main__":
+    main()